@@ -1,10 +1,51 @@
 import streamlit as st
-import sqlite3
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
 from datetime import datetime, timedelta
 import os
+import tempfile
+
+from pestcore.aggregates import frame_aggregates, sql_aggregates
+from pestcore.branches import BranchSet, branch_paths, branch_table, merge_aggregates, merge_receivables, merge_trends
+from pestcore.charts import FigureCache, payment_bar, route_map, service_donut, trend_lines
+from pestcore.data import SERVICE_STATUSES
+from pestcore.db import ConnectionManager, DatabaseUnavailable
+from pestcore.edits import RecordNotFound, StaleRecord, bulk_update, cache_token, matching_versions, update_records
+from pestcore.export import FORMATS as EXPORT_FORMATS, backup_filename, export_records
+from pestcore.identity import CHURN_DAYS, customer_metrics, top_customers
+from pestcore.importer import import_upload
+from pestcore.receivables import (
+    BUCKET_LABELS, UNSET_METHOD, aging_summary, bucket_pivot, bucket_totals, customer_aging,
+    receivable_jobs, refresh_receivables,
+)
+from pestcore.records import PAGE_SIZE, build_filters, count_matching, fetch_page, fetch_record
+from pestcore.rollups import refresh_rollups, trend
+from pestcore.routes import day_routes, route_summary
+from pestcore.scheduler import OVERDUE_DAYS, RECURRENCE_INTERVALS, Scheduler, overdue_summary
+from pestcore.sampling import bin_trend
+from pestcore.snapshot import SnapshotCache
+from pestcore.theme import stylesheet, theme_key
+from pestcore.writequeue import WriteQueue
+from pestcore import timing
+
+PAYMENT_METHODS = ["Cash", "UPI", "Bank Transfer", "Credit Card", "Pending"]
+
+# How long a form submission waits for its group commit before answering
+SAVE_ACK_SECONDS = 2.0
+
+TREND_BREAKDOWNS = {
+    "Service": 'service',
+    "Payment Method": 'payment_method',
+    "Status": 'service_status',
+    "Payment Status": 'paid',
+}
+
+# Trend date range -> days back from today (None for everything)
+TREND_RANGES = {
+    "All Time": None,
+    "Last 90 Days": 90,
+    "Last Year": 365,
+    "Last 3 Years": 3 * 365,
+}
 
 # Initialize session state FIRST
 if 'show_add_form' not in st.session_state:
@@ -18,248 +59,209 @@ st.set_page_config(
     page_icon="🐛"
 )
 
-# Custom CSS for COVID-19 dashboard style
-st.markdown("""
-<style>
-    /* Global dark theme */
-    .main {
-        background: linear-gradient(135deg, #1e3c72 0%, #2a5298 100%);
-        color: white;
-    }
-    
-    .block-container {
-        padding-top: 2rem;
-        padding-bottom: 2rem;
-        background: transparent;
-    }
-    
-    /* Hide Streamlit branding */
-    #MainMenu {visibility: hidden;}
-    footer {visibility: hidden;}
-    header {visibility: hidden;}
-    
-    /* Main header */
-    .main-header {
-        text-align: center;
-        color: white;
-        font-size: 2.5rem;
-        font-weight: 300;
-        margin-bottom: 0.5rem;
-        text-shadow: 2px 2px 4px rgba(0,0,0,0.3);
-    }
-    
-    .sub-header {
-        text-align: center;
-        color: #ffa726;
-        font-size: 1.2rem;
-        font-weight: 400;
-        margin-bottom: 1rem;
-    }
-    
-    .debug-info {
-        background: rgba(76, 175, 80, 0.2);
-        color: #81c784;
-        padding: 0.5rem;
-        border-radius: 8px;
-        font-size: 0.9rem;
-        margin-bottom: 1rem;
-        border: 1px solid rgba(129, 199, 132, 0.3);
-    }
-    
-    .last-updated {
-        text-align: right;
-        color: #ffa726;
-        font-size: 0.9rem;
-        margin-bottom: 2rem;
-    }
-    
-    /* KPI Cards */
-    .metric-card {
-        background: rgba(255, 255, 255, 0.1);
-        backdrop-filter: blur(10px);
-        border: 1px solid rgba(255, 255, 255, 0.2);
-        border-radius: 15px;
-        padding: 2rem 1rem;
-        text-align: center;
-        margin: 1rem 0;
-        box-shadow: 0 8px 32px rgba(0, 0, 0, 0.3);
-        transition: transform 0.3s ease;
-        height: 140px;
-    }
-    
-    .metric-card:hover {
-        transform: translateY(-5px);
-        box-shadow: 0 12px 40px rgba(0, 0, 0, 0.4);
-    }
-    
-    .metric-title {
-        font-size: 1rem;
-        color: rgba(255, 255, 255, 0.9);
-        margin-bottom: 0.5rem;
-        font-weight: 400;
-    }
-    
-    .metric-value {
-        font-size: 2.2rem;
-        font-weight: 700;
-        margin: 0.5rem 0;
-        text-shadow: 2px 2px 4px rgba(0,0,0,0.3);
-    }
-    
-    .metric-change {
-        font-size: 0.85rem;
-        margin-top: 0.5rem;
-        opacity: 0.8;
-    }
-    
-    /* Different colors for metrics */
-    .metric-total { color: #ffb74d; }
-    .metric-revenue { color: #81c784; }
-    .metric-pending { color: #f06292; }
-    .metric-completed { color: #64b5f6; }
-    
-    /* Chart containers */
-    .chart-container {
-        background: rgba(255, 255, 255, 0.1);
-        backdrop-filter: blur(10px);
-        border: 1px solid rgba(255, 255, 255, 0.2);
-        border-radius: 15px;
-        padding: 1.5rem;
-        margin: 1rem 0;
-        box-shadow: 0 8px 32px rgba(0, 0, 0, 0.3);
-    }
-    
-    .chart-title {
-        color: white;
-        font-size: 1.2rem;
-        font-weight: 500;
-        margin-bottom: 1rem;
-        text-align: center;
-    }
-    
-    /* Button styling */
-    .stButton > button {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        color: white;
-        border: none;
-        border-radius: 25px;
-        padding: 0.5rem 2rem;
-        font-weight: 600;
-        transition: all 0.3s ease;
-    }
-    
-    .stButton > button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 5px 15px rgba(0,0,0,0.3);
-    }
-    
-    /* Section headers */
-    .section-header {
-        color: white;
-        font-size: 1.3rem;
-        font-weight: 500;
-        margin: 2rem 0 1rem 0;
-        padding-bottom: 0.5rem;
-        border-bottom: 2px solid rgba(255, 255, 255, 0.2);
-    }
-    
-    /* Form styling */
-    .stSelectbox label, .stTextInput label, .stTextArea label, 
-    .stNumberInput label, .stDateInput label, .stCheckbox label {
-        color: white !important;
-        font-weight: 500;
-    }
-    
-    /* Success/Error messages */
-    .stSuccess {
-        background: rgba(76, 175, 80, 0.2);
-        border-left: 4px solid #4caf50;
-    }
-    
-    .stError {
-        background: rgba(244, 67, 54, 0.2);
-        border-left: 4px solid #f44336;
-    }
-    
-    /* Add Customer Section */
-    .add-customer-section {
-        background: rgba(255, 255, 255, 0.1);
-        backdrop-filter: blur(10px);
-        border: 1px solid rgba(255, 255, 255, 0.2);
-        border-radius: 15px;
-        padding: 2rem;
-        margin: 2rem 0;
-        box-shadow: 0 8px 32px rgba(0, 0, 0, 0.3);
-    }
-</style>
-""", unsafe_allow_html=True)
+# Branch databases (PESTCONTROL_BRANCHES); a single pestcontrol.db by default
+BRANCHES = branch_paths()
+HEAD_OFFICE = "🏢 All Branches"
+
+# Branch choice comes first: every section below reads from it
+if len(BRANCHES) > 1:
+    selected_branch = st.sidebar.selectbox("🏢 Branch", [HEAD_OFFICE] + list(BRANCHES))
+else:
+    selected_branch = next(iter(BRANCHES))
+head_office = selected_branch == HEAD_OFFICE
+if head_office:
+    # Records, new entries and exports always belong to one branch
+    work_branch = st.sidebar.selectbox("Branch for records and new entries", list(BRANCHES))
+else:
+    work_branch = selected_branch
+db_path = BRANCHES[work_branch]
+db_name = os.path.basename(db_path)
+
+# Opt-in phase and query timing; the admin panel turns it on
+TIMING_LOG = 'timing.jsonl'
+# Set on the server only: a URL parameter would open the panel to any visitor
+show_admin = os.environ.get('PESTCONTROL_ADMIN') == '1'
+timing.begin_run('rerun')
+
+# Dashboard theme, read from disk once per process
+st.markdown(f"<style>{stylesheet()}</style>", unsafe_allow_html=True)
+
+# Shared connection manager, checked and migrated once per server process
+@st.cache_resource
+def get_connection_manager(db_path):
+    """Process-wide pooled connections for one database file"""
+    # Every write also folds new rows into the trend rollups and receivables ledger
+    return (
+        ConnectionManager(db_path).check()
+        .add_write_hook(refresh_rollups)
+        .add_write_hook(refresh_receivables)
+    )
+
+# Recurring visits and overdue sweeps run on one background thread per process
+@st.cache_resource
+def get_scheduler(db_path):
+    """Process-wide scheduler worker, started on first use"""
+    return Scheduler(get_connection_manager(db_path)).start()
+
+def open_branch(path):
+    """Checked manager for one branch database, with its scheduler running"""
+    manager = get_connection_manager(path)
+    get_scheduler(path)
+    return manager
+
+# Every branch is queried in parallel for the head-office view
+@st.cache_resource
+def get_branch_set():
+    """Process-wide branch set sharing the cached connection managers"""
+    return BranchSet(BRANCHES, open_branch=open_branch)
 
 # Database connection function
-def get_database_connection():
-    """Get database connection and handle errors"""
+def get_database():
+    """Get the shared connection manager and handle errors"""
     try:
-        # Check if database file exists
-        db_path = 'pestcontrol.db'
+        return open_branch(db_path)
+    
+    except DatabaseUnavailable as e:
+        st.error(f"❌ {e}")
         if not os.path.exists(db_path):
-            st.error(f"❌ Database file not found: {db_path}")
-            st.info("Please make sure 'pestcontrol.db' is in the same folder as your app.py file")
-            return None, None
-        
-        # Connect to database
-        conn = sqlite3.connect(db_path, check_same_thread=False)
-        c = conn.cursor()
-        
-        # Check if customers table exists
-        c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='customers'")
-        if not c.fetchone():
-            st.error("❌ 'customers' table not found in database")
-            return None, None
-        
-        return conn, c
+            st.info(f"Please make sure '{db_path}' exists, or set PESTCONTROL_DB / PESTCONTROL_BRANCHES")
+        return None
     
     except Exception as e:
         st.error(f"❌ Database connection error: {str(e)}")
-        return None, None
+        return None
+
+# Built figures are reused until their input data or the theme changes
+@st.cache_resource
+def get_figure_cache():
+    """Process-wide cache of validated chart figures"""
+    return FigureCache()
+
+# Shared customer cache, one per server process, first filled from the
+# memory-mapped snapshot kept next to the database by `pestcore.scheduler
+# serve` or a cron job running `pestcore.snapshot refresh`
+@st.cache_resource
+def get_customer_cache(db_path):
+    """Process-wide customers cache reused across reruns and sessions"""
+    return SnapshotCache(db_path)
+
+# New records go through one group-committing writer per database
+@st.cache_resource
+def get_write_queue(db_path):
+    """Process-wide write queue; each batch is folded into the customer cache"""
+    manager = get_connection_manager(db_path)
+    cache = get_customer_cache(db_path)
+
+    def refresh_cache(ids):
+        with manager.read() as conn:
+            cache.refresh(conn)
+
+    return WriteQueue(manager).add_commit_hook(refresh_cache).start()
 
 # Load data function
+@timing.timed('load_data')
 def load_data():
     """Load data from database with error handling"""
-    conn, c = get_database_connection()
+    db = get_database()
     
-    if conn is None:
+    if db is None:
         return pd.DataFrame()
     
     try:
-        # Get table info
-        c.execute("PRAGMA table_info(customers)")
-        columns = c.fetchall()
-        
-        # Load all data
-        df = pd.read_sql_query("SELECT * FROM customers ORDER BY id DESC", conn)
+        # Only rows inserted or changed since the last rerun are fetched
+        with db.read() as conn:
+            df = get_customer_cache(db.db_path).refresh(conn)
         
         if df.empty:
             st.warning("⚠️ Database is connected but contains no records")
-            return df
-        
-        # Convert date columns
-        if 'visit_date' in df.columns:
-            df["visit_date"] = pd.to_datetime(df["visit_date"], errors='coerce')
-            df["month"] = df["visit_date"].dt.month
-            df["year"] = df["visit_date"].dt.year
-        
-        # Fix old status values
-        if 'service_status' in df.columns:
-            df['service_status'] = df['service_status'].replace('Finished', 'Completed')
         
         return df
         
     except Exception as e:
         st.error(f"❌ Error loading data: {str(e)}")
         return pd.DataFrame()
-    
-    finally:
-        if conn:
-            conn.close()
+
+def data_token(db_path, scope):
+    """Cache token for one scope; edits elsewhere leave it unchanged"""
+    with get_connection_manager(db_path).read() as conn:
+        return cache_token(conn, scope)
+
+# Aggregates are recomputed in SQLite only when rows they read change
+@st.cache_data(show_spinner=False)
+def get_sql_aggregates(db_path, token, today):
+    """Grouped KPI and chart aggregates for one data state and day"""
+    with get_connection_manager(db_path).read() as conn:
+        return sql_aggregates(conn)
+
+@st.cache_data(show_spinner=False)
+def get_trend(db_path, token, grain, by, date_from=None):
+    """Rollup-backed trend series for one data state, binned to a drawable size"""
+    with get_connection_manager(db_path).read() as conn:
+        trend_df = trend(conn, grain=grain, by=by, date_from=date_from)
+    return bin_trend(trend_df) if grain == 'day' else (trend_df, None)
+
+@st.cache_data(show_spinner=False)
+def get_match_count(db_path, token, filters):
+    """Number of records matching the browser filters for one data state"""
+    with get_connection_manager(db_path).read() as conn:
+        return count_matching(conn, filters)
+
+@st.cache_data(show_spinner=False, ttl=60)
+def get_overdue_summary(db_path):
+    """Overdue job count and amount, as of the scheduler's last sweep"""
+    with get_connection_manager(db_path).read() as conn:
+        return overdue_summary(conn)
+
+# Entities are resolved by the scheduler in the background, so new records
+# only count once it has run; the ttl picks that up without a per-write token
+@st.cache_data(show_spinner=False, ttl=300)
+def get_customer_insights(db_path, today):
+    """Repeat-customer metrics and top customers by lifetime value"""
+    with get_connection_manager(db_path).read() as conn:
+        return customer_metrics(conn, today), top_customers(conn, today, limit=10)
+
+# The aging ledger is kept current by triggers and write hooks
+@st.cache_data(show_spinner=False)
+def get_receivables(db_path, token, today):
+    """Amount owed per aging bucket and payment method"""
+    with get_connection_manager(db_path).read() as conn:
+        return aging_summary(conn, today)
+
+@st.cache_data(show_spinner=False)
+def get_customer_aging(db_path, token, today, bucket=None, payment_method=None):
+    """Customers owing the most, for the collections drill-down"""
+    with get_connection_manager(db_path).read() as conn:
+        return customer_aging(conn, today, bucket, payment_method)
+
+def branch_tokens(scope):
+    """Cache tokens of every branch, fetched in parallel"""
+    return tuple(get_branch_set().read_all(lambda conn: cache_token(conn, scope)).items())
+
+@st.cache_data(show_spinner=False)
+def get_branch_aggregates(tokens, today):
+    """Aggregates of every branch for one data state, by branch name"""
+    return get_branch_set().read_all(sql_aggregates)
+
+@st.cache_data(show_spinner=False)
+def get_branch_receivables(tokens, today):
+    """Aging summaries of every branch, by branch name"""
+    return get_branch_set().read_all(lambda conn: aging_summary(conn, today))
+
+@st.cache_data(show_spinner=False)
+def get_branch_trend(tokens, grain, by, date_from=None):
+    """Trend series summed over every branch, binned like ``get_trend``"""
+    trend_df = merge_trends(get_branch_set().read_all(
+        lambda conn: trend(conn, grain=grain, by=by, date_from=date_from)
+    ))
+    return bin_trend(trend_df) if grain == 'day' else (trend_df, None)
+
+@timing.timed('load_aggregates')
+def load_aggregates(df):
+    """KPI and chart aggregates, falling back to the loaded frame"""
+    try:
+        return get_sql_aggregates(db_path, data_token(db_path, 'aggregates'), datetime.now().date())
+    except Exception:
+        return frame_aggregates(df)
 
 # Main header
 st.markdown('''
@@ -269,22 +271,30 @@ st.markdown('''
 '''.format(datetime.now().strftime("%B %d, %Y")), unsafe_allow_html=True)
 
 # Database status check
-db_path = 'pestcontrol.db'
-if os.path.exists(db_path):
+if head_office:
+    st.markdown(f'''
+    <div class="debug-info">
+        🏢 <strong>Head Office View:</strong> {len(BRANCHES)} branches combined • 
+        Records below are from {work_branch}
+    </div>
+    ''', unsafe_allow_html=True)
+elif os.path.exists(db_path):
     file_size = os.path.getsize(db_path)
     st.markdown(f'''
     <div class="debug-info">
-        ✅ <strong>Database Status:</strong> Found pestcontrol.db ({file_size:,} bytes) • 
+        ✅ <strong>Database Status:</strong> Found {db_name} ({file_size:,} bytes) • 
         Loading your business data...
     </div>
     ''', unsafe_allow_html=True)
 else:
-    st.markdown('''
+    st.markdown(f'''
     <div class="debug-info">
-        ❌ <strong>Database Status:</strong> pestcontrol.db not found in current directory
+        ❌ <strong>Database Status:</strong> {db_path} not found
     </div>
     ''', unsafe_allow_html=True)
 
+timing.lap('header')
+
 # Load data
 df = load_data()
 
@@ -336,11 +346,12 @@ if st.session_state.show_add_form:
         with col3:
             st.markdown("**Payment Information**")
             paid = st.checkbox("Payment Received")
-            payment_method = st.selectbox("Payment Method", ["Cash", "UPI", "Bank Transfer", "Credit Card", "Pending"])
+            payment_method = st.selectbox("Payment Method", PAYMENT_METHODS)
         
         with col4:
             st.markdown("**Service Status**")
-            service_status = st.selectbox("Service Status", ["Ongoing", "Completed", "Cancelled", "Scheduled"])
+            service_status = st.selectbox("Service Status", SERVICE_STATUSES)
+            repeat = st.selectbox("Repeats", ["Does not repeat"] + list(RECURRENCE_INTERVALS))
         
         # Form buttons
         col_btn1, col_btn2 = st.columns(2)
@@ -351,46 +362,76 @@ if st.session_state.show_add_form:
                 st.rerun()
 
         if submitted and name.strip():
-            conn, c = get_database_connection()
-            if conn:
+            db = get_database()
+            if db:
                 try:
-                    c.execute('''
-                        INSERT INTO customers (name, phone, address, service, visit_date, amount, paid, payment_method, service_status)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        name.strip(), phone.strip(), address.strip(), service,
-                        visit_date.strftime("%Y-%m-%d"),
-                        amount, int(paid), payment_method, service_status
-                    ))
-                    conn.commit()
-                    st.success("✅ Record saved successfully!")
+                    # Follow-up visits are created ahead of time by the scheduler
+                    saved = get_write_queue(db.db_path).submit({
+                        'name': name, 'phone': phone, 'address': address, 'service': service,
+                        'visit_date': visit_date, 'amount': amount, 'paid': paid,
+                        'payment_method': payment_method, 'service_status': service_status,
+                    }, every_months=RECURRENCE_INTERVALS.get(repeat))
+                    record_id = saved.result(timeout=SAVE_ACK_SECONDS)
+                    st.success(f"✅ Record #{record_id} saved successfully!")
                     st.balloons()
-                    st.rerun()
+                    # The writer already folded the row into the cache
+                    df = load_data()
+                except TimeoutError:
+                    st.info("⏳ Record queued; it will appear in a moment")
                 except Exception as e:
                     st.error(f"❌ Error saving record: {str(e)}")
-                finally:
-                    conn.close()
         elif submitted:
             st.error("❌ Please enter customer name")
     
+    # Bulk import of historical jobs
+    with st.expander("📥 Bulk Import from CSV / JSONL"):
+        st.caption("Columns: name, phone, address, service, visit_date, amount, paid, payment_method, service_status")
+        upload = st.file_uploader("Service records file", type=['csv', 'jsonl', 'json', 'gz'])
+        if upload is not None and st.button("📥 Import Records", use_container_width=True):
+            db = get_database()
+            if db:
+                try:
+                    with st.spinner("Importing records..."):
+                        import_stats, import_rejects = import_upload(db, upload.getvalue(), upload.name)
+                    st.success(f"✅ Imported {import_stats['inserted']:,} of {import_stats['read']:,} rows "
+                               f"({import_stats['rows_per_sec']:,} rows/s)")
+                    if import_stats['rejected']:
+                        st.warning(f"⚠️ {import_stats['rejected']:,} rows rejected")
+                        st.download_button(
+                            label="💾 Download Reject Log",
+                            data=import_rejects,
+                            file_name=f'import_rejects_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
+                            mime='text/csv',
+                            use_container_width=True
+                        )
+                except Exception as e:
+                    st.error(f"❌ Import failed: {str(e)}")
+    
     st.markdown('</div>', unsafe_allow_html=True)
 
 if df.empty:
-    st.markdown("""
+    st.markdown(f"""
     <div style='text-align: center; padding: 3rem; color: rgba(255,255,255,0.8);'>
         <h2>📊 No Data Found</h2>
-        <p>Please check that your pestcontrol.db file is in the same folder as app.py</p>
+        <p>Please check that {db_path} is the database you meant to open</p>
         <p>Or click "Add New Customer" to create your first record</p>
     </div>
     """, unsafe_allow_html=True)
     st.stop()
 
-# Calculate metrics
-total_contracts = len(df)
-total_revenue = df['amount'].sum() if 'amount' in df.columns else 0
-total_paid = df.loc[df['paid'] == 1, 'amount'].sum() if 'paid' in df.columns and 'amount' in df.columns else 0
-total_pending = df.loc[df['paid'] == 0, 'amount'].sum() if 'paid' in df.columns and 'amount' in df.columns else 0
-completed_count = len(df[df['service_status'] == 'Completed']) if 'service_status' in df.columns else 0
+timing.lap('data_and_forms')
+
+# Calculate metrics, combined over every branch for the head office
+if head_office:
+    branch_aggregates = get_branch_aggregates(branch_tokens('aggregates'), datetime.now().date())
+    aggregates = merge_aggregates(branch_aggregates)
+else:
+    aggregates = load_aggregates(df)
+total_contracts = aggregates['kpis']['total_contracts']
+total_revenue = aggregates['kpis']['total_revenue']
+total_paid = aggregates['kpis']['total_paid']
+total_pending = aggregates['kpis']['total_pending']
+completed_count = aggregates['kpis']['completed_count']
 
 # Key Performance Indicators
 st.markdown('<div class="section-header">📊 Business Overview</div>', unsafe_allow_html=True)
@@ -433,6 +474,28 @@ with col4:
     </div>
     """, unsafe_allow_html=True)
 
+# Per-branch drill-down of the combined figures
+if head_office:
+    with st.expander("🏢 Branch Breakdown", expanded=True):
+        branch_kpis = branch_table(branch_aggregates)
+        st.dataframe(
+            branch_kpis,
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                'branch': "Branch",
+                'total_contracts': st.column_config.NumberColumn("Contracts", format="%d"),
+                'total_revenue': st.column_config.NumberColumn("Revenue (₹)", format="%.0f"),
+                'total_paid': st.column_config.NumberColumn("Paid (₹)", format="%.0f"),
+                'total_pending': st.column_config.NumberColumn("Pending (₹)", format="%.0f"),
+                'completed_count': st.column_config.NumberColumn("Completed", format="%d"),
+                'completion_rate': st.column_config.NumberColumn("Completion %", format="%.1f"),
+                'recent_visits': st.column_config.NumberColumn("Visits (7 Days)", format="%d"),
+            },
+        )
+
+timing.lap('kpi_cards')
+
 # Charts section
 st.markdown('<div class="section-header">📈 Performance Analytics</div>', unsafe_allow_html=True)
 
@@ -443,36 +506,7 @@ with col1:
     st.markdown('<div class="chart-title">Service Distribution</div>', unsafe_allow_html=True)
     
     if 'service' in df.columns:
-        service_counts = df['service'].value_counts()
-        
-        fig_donut = go.Figure(data=[go.Pie(
-            labels=service_counts.index,
-            values=service_counts.values,
-            hole=0.6,
-            marker=dict(
-                colors=['#ffb74d', '#f06292', '#64b5f6', '#81c784', '#ba68c8', '#4db6ac', '#ff8a65'],
-                line=dict(color='rgba(255,255,255,0.8)', width=2)
-            ),
-            textfont=dict(color='white', size=12),
-            hovertemplate='<b>%{label}</b><br>Count: %{value}<br>Percentage: %{percent}<extra></extra>'
-        )])
-        
-        fig_donut.add_annotation(
-            text=f"<b>Total</b><br>{len(df):,}",
-            x=0.5, y=0.5,
-            font_size=16,
-            font_color='white',
-            showarrow=False
-        )
-        
-        fig_donut.update_layout(
-            showlegend=True,
-            legend=dict(font=dict(color='white', size=10)),
-            paper_bgcolor='rgba(0,0,0,0)',
-            plot_bgcolor='rgba(0,0,0,0)',
-            height=350,
-            margin=dict(l=20, r=20, t=20, b=20)
-        )
+        fig_donut = get_figure_cache().get(service_donut, aggregates['services'], total_contracts, theme=theme_key())
         
         st.plotly_chart(fig_donut, use_container_width=True)
     else:
@@ -480,31 +514,14 @@ with col1:
     
     st.markdown('</div>', unsafe_allow_html=True)
 
+timing.lap('fig_donut')
+
 with col2:
     st.markdown('<div class="chart-container">', unsafe_allow_html=True)
     st.markdown('<div class="chart-title">Payment Status Overview</div>', unsafe_allow_html=True)
     
     if 'paid' in df.columns:
-        payment_counts = df['paid'].value_counts()
-        payment_labels = ['Paid' if x == 1 else 'Unpaid' for x in payment_counts.index]
-        
-        fig_payment = go.Figure(data=[go.Bar(
-            x=payment_labels,
-            y=payment_counts.values,
-            marker_color=['#81c784', '#f06292'],
-            text=payment_counts.values,
-            textposition='auto',
-            textfont=dict(color='white', size=14, family="Arial Black")
-        )])
-        
-        fig_payment.update_layout(
-            xaxis=dict(title='Payment Status', color='white'),
-            yaxis=dict(title='Number of Customers', color='white'),
-            paper_bgcolor='rgba(0,0,0,0)',
-            plot_bgcolor='rgba(0,0,0,0)',
-            height=350,
-            showlegend=False
-        )
+        fig_payment = get_figure_cache().get(payment_bar, aggregates['payments'], theme=theme_key())
         
         st.plotly_chart(fig_payment, use_container_width=True)
     else:
@@ -512,81 +529,420 @@ with col2:
     
     st.markdown('</div>', unsafe_allow_html=True)
 
+timing.lap('fig_payment')
+
+# Trends from the pre-aggregated rollups
+st.markdown('<div class="section-header">📅 Revenue & Job Trends</div>', unsafe_allow_html=True)
+
+tcol1, tcol2, tcol3, tcol4 = st.columns(4)
+with tcol1:
+    trend_metric = st.radio("Metric", ["Revenue", "Jobs"], horizontal=True)
+with tcol2:
+    trend_by = st.selectbox("Breakdown", list(TREND_BREAKDOWNS))
+with tcol3:
+    trend_grain = st.radio("Granularity", ["Month", "Day"], horizontal=True)
+with tcol4:
+    trend_range = st.selectbox("Range", list(TREND_RANGES))
+
+trend_days = TREND_RANGES[trend_range]
+trend_from = (datetime.now().date() - timedelta(days=trend_days)).isoformat() if trend_days else None
+
+try:
+    # Long daily ranges come back binned to weeks or months
+    if head_office:
+        trend_df, trend_bin = get_branch_trend(branch_tokens('aggregates'),
+                                               trend_grain.lower(), TREND_BREAKDOWNS[trend_by], trend_from)
+    else:
+        trend_df, trend_bin = get_trend(db_path, data_token(db_path, 'aggregates'),
+                                        trend_grain.lower(), TREND_BREAKDOWNS[trend_by], trend_from)
+except Exception as e:
+    trend_df = None
+    st.info(f"Trend data not available: {str(e)}")
+
+if trend_df is not None and not trend_df.empty:
+    fig_trend = get_figure_cache().get(
+        trend_lines,
+        trend_df,
+        value_column='revenue' if trend_metric == "Revenue" else 'jobs',
+        grain_label=trend_bin or trend_grain,
+        paid_groups=TREND_BREAKDOWNS[trend_by] == 'paid',
+        theme=theme_key(),
+    )
+    
+    st.plotly_chart(fig_trend, use_container_width=True)
+    if trend_bin:
+        st.caption(f"Daily figures grouped by {trend_bin.lower()} to keep the chart readable over this range")
+
+timing.lap('trends')
+
+# Repeat business, counted per customer rather than per visit. Customers are
+# resolved within one branch's database, so the head office sees one branch
+with st.expander(f"👥 Customer Insights{f' — {work_branch} only' if head_office else ''}"):
+    if head_office:
+        st.caption(f"Customers are matched within each branch; showing {work_branch}, "
+                   "the branch chosen for records in the sidebar")
+    try:
+        metrics, best_customers = get_customer_insights(db_path, datetime.now().date())
+    except Exception as e:
+        metrics = None
+        st.info(f"Customer insights not available: {str(e)}")
+    
+    if metrics:
+        icol1, icol2, icol3, icol4 = st.columns(4)
+        icol1.metric("Unique Customers", f"{metrics['customers']:,}",
+                     help="Visits grouped by phone number, or by name and address")
+        icol2.metric("Repeat Rate", f"{metrics['repeat_rate']:.1f}%",
+                     help=f"{metrics['repeat_customers']:,} customers booked more than once")
+        icol3.metric("Avg Lifetime Value", f"₹{metrics['avg_lifetime_value']:,.0f}",
+                     help=f"₹{metrics['avg_lifetime_paid']:,.0f} of it paid")
+        icol4.metric("Churn", f"{metrics['churn_rate']:.1f}%",
+                     help=f"No visit in the last {CHURN_DAYS} days")
+        st.dataframe(
+            best_customers,
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                'name': "Customer",
+                'phone': "Phone",
+                'visits': st.column_config.NumberColumn("Visits", format="%d"),
+                'lifetime_value': st.column_config.NumberColumn("Lifetime Value (₹)", format="%.0f"),
+                'paid': st.column_config.NumberColumn("Paid (₹)", format="%.0f"),
+                'first_visit': "First Visit",
+                'last_visit': "Last Visit",
+            },
+        )
+
+timing.lap('customer_insights')
+
+# Collections: unpaid work by how long it has been owed, summed over every
+# branch for the head office; the drill-down stays in the work branch
+with st.expander(f"💳 Receivables Aging{' — All Branches' if head_office else ''}"):
+    aging_day = datetime.now().date()
+    try:
+        receivables_token = data_token(db_path, 'aggregates')
+        if head_office:
+            receivables = merge_receivables(get_branch_receivables(branch_tokens('aggregates'), aging_day))
+        else:
+            receivables = get_receivables(db_path, receivables_token, aging_day)
+    except Exception as e:
+        receivables = None
+        st.info(f"Receivables not available: {str(e)}")
+    
+    if receivables is not None:
+        bucket_cols = st.columns(len(BUCKET_LABELS))
+        for bucket_col, bucket in zip(bucket_cols, bucket_totals(receivables).itertuples()):
+            bucket_col.metric(f"{bucket.bucket} Days", f"₹{bucket.amount:,.0f}", help=f"{bucket.jobs:,} unpaid jobs")
+        st.dataframe(
+            bucket_pivot(receivables),
+            hide_index=True,
+            use_container_width=True,
+            column_config={'payment_method': "Payment Method", **{
+                col: st.column_config.NumberColumn(f"{col} (₹)", format="%.0f") for col in BUCKET_LABELS + ['Total']
+            }},
+        )
+        st.caption("Unpaid jobs by days since the visit; Scheduled and Cancelled jobs are not owed yet")
+        
+        # Drill down to the customers behind a bucket, then to their jobs
+        if head_office:
+            st.markdown(f"**Customers owing in {work_branch}**")
+        dcol1, dcol2 = st.columns(2)
+        with dcol1:
+            aging_bucket = st.selectbox("Aging Bucket", ["All"] + BUCKET_LABELS)
+        with dcol2:
+            methods = sorted(receivables['payment_method'].unique())
+            aging_method = st.selectbox("Owed By Method", ["All"] + methods,
+                                        format_func=lambda method: method or UNSET_METHOD)
+        debtors = get_customer_aging(
+            db_path, receivables_token, aging_day,
+            None if aging_bucket == "All" else aging_bucket,
+            None if aging_method == "All" else aging_method,
+        )
+        st.dataframe(
+            debtors.drop(columns=['entity']),
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                'name': "Customer",
+                'phone': "Phone",
+                'jobs': st.column_config.NumberColumn("Unpaid Jobs", format="%d"),
+                'amount': st.column_config.NumberColumn("Owed (₹)", format="%.0f"),
+                'oldest_visit': "Oldest Visit",
+                **{col: st.column_config.NumberColumn(f"{col} (₹)", format="%.0f") for col in BUCKET_LABELS},
+            },
+        )
+        if not debtors.empty:
+            debtor = st.selectbox(
+                "Customer Jobs",
+                debtors.index,
+                format_func=lambda row: f"{debtors.at[row, 'name']} • ₹{debtors.at[row, 'amount']:,.0f}",
+            )
+            db = get_database()
+            if db:
+                with db.read() as conn:
+                    jobs = receivable_jobs(
+                        conn, debtors.at[debtor, 'entity'], aging_day,
+                        None if aging_bucket == "All" else aging_bucket,
+                        None if aging_method == "All" else aging_method,
+                    )
+                st.dataframe(jobs, hide_index=True, use_container_width=True)
+
+timing.lap('receivables')
+
+# Technician routes for one day's Scheduled visits
+with st.expander("🗺️ Technician Routes"):
+    rcol1, rcol2, rcol3 = st.columns([1.5, 1, 1])
+    with rcol1:
+        route_day = st.date_input("Route Day", value=datetime.today(), key='route_day')
+    with rcol2:
+        route_technicians = st.number_input("Technicians", min_value=1, max_value=20, value=2, step=1)
+    with rcol3:
+        st.markdown("<div style='height: 1.75rem'></div>", unsafe_allow_html=True)
+        plan_routes_clicked = st.button("🧭 Plan Routes", use_container_width=True)
+    
+    route_key = (db_path, route_day, int(route_technicians))
+    if plan_routes_clicked:
+        db = get_database()
+        if db:
+            try:
+                # Addresses are geocoded once and cached in the database
+                st.session_state.routes_plan = (route_key, *day_routes(db, route_day, int(route_technicians)))
+            except Exception as e:
+                st.error(f"❌ Route planning failed: {str(e)}")
+    
+    plan = st.session_state.get('routes_plan')
+    if plan and plan[0] == route_key:
+        _, routes, unroutable = plan
+        if routes.empty and unroutable.empty:
+            st.info("No Scheduled visits on this day")
+        if not routes.empty:
+            st.plotly_chart(route_map(routes), use_container_width=True)
+            st.dataframe(route_summary(routes), hide_index=True, use_container_width=True)
+            st.dataframe(
+                routes[['technician', 'stop', 'id', 'name', 'phone', 'address', 'service', 'leg_km']],
+                hide_index=True,
+                use_container_width=True,
+            )
+        if not unroutable.empty:
+            st.warning(f"📍 {len(unroutable)} visit(s) have addresses the gazetteer could not place")
+            st.dataframe(unroutable[['id', 'name', 'address']], hide_index=True, use_container_width=True)
+
+timing.lap('routes')
+
 # Customer Records Management
 st.markdown('<div class="section-header">📋 Customer Records</div>', unsafe_allow_html=True)
 
-# Show records with expandable details
-if not df.empty:
-    for idx, row in df.head(15).iterrows():  # Show first 15 records
-        # Create a safe display for missing columns
-        name = row.get('name', 'Unknown')
-        phone = row.get('phone', 'No phone')
-        amount = row.get('amount', 0)
-        service_status = row.get('service_status', 'Unknown')
+# Record browser filters
+fcol1, fcol2, fcol3, fcol4, fcol5 = st.columns([2, 1.5, 1.5, 1, 2])
+with fcol1:
+    record_search = st.text_input("Search", placeholder="Name, phone digits or locality...")
+with fcol2:
+    record_statuses = st.multiselect("Status", SERVICE_STATUSES)
+with fcol3:
+    record_services = st.multiselect("Service", aggregates['services']['service'].tolist())
+with fcol4:
+    record_paid = st.selectbox("Payment", ["All", "Paid", "Unpaid"])
+with fcol5:
+    record_dates = st.date_input("Visit Date Range", value=(), format="YYYY-MM-DD")
+
+record_filters = build_filters(
+    search=record_search,
+    statuses=record_statuses,
+    services=record_services,
+    paid={"All": None, "Paid": True, "Unpaid": False}[record_paid],
+    date_from=record_dates[0] if len(record_dates) > 0 else None,
+    date_to=record_dates[1] if len(record_dates) > 1 else None,
+)
+
+# Keyset cursors of the pages visited so far, reset whenever the filters change
+if st.session_state.get('records_filters') != record_filters:
+    st.session_state.records_filters = record_filters
+    st.session_state.records_cursors = [None]
+
+db = get_database()
+if db:
+    with db.read() as conn:
+        page, has_more = fetch_page(conn, record_filters, after_id=st.session_state.records_cursors[-1])
+    matching = get_match_count(db.db_path, data_token(db.db_path, 'records'), record_filters)
+
+    page_number = len(st.session_state.records_cursors)
+    first = (page_number - 1) * PAGE_SIZE + 1
+    
+    # Outcome of the save or bulk update that triggered this rerun
+    for level, message in st.session_state.pop('records_flash', []):
+        getattr(st, level)(message)
+    
+    # Payment and status are edited in place; the row version guards against
+    # overwriting someone else's change made since this page was read
+    edited = st.data_editor(
+        page,
+        hide_index=True,
+        use_container_width=True,
+        disabled=['id', 'name', 'phone', 'service', 'visit_date', 'amount'],
+        key=f"records_editor_{page_number}_{st.session_state.get('records_saved', 0)}",
+        column_config={
+            'id': st.column_config.NumberColumn("ID", format="%d"),
+            'name': "Customer",
+            'phone': "Phone",
+            'service': "Service",
+            'visit_date': "Visit Date",
+            'amount': st.column_config.NumberColumn("Amount", format="₹%.2f"),
+            'paid': st.column_config.CheckboxColumn("Paid"),
+            'payment_method': st.column_config.SelectboxColumn("Method", options=PAYMENT_METHODS),
+            'service_status': st.column_config.SelectboxColumn("Status", options=SERVICE_STATUSES),
+            'version': None,
+        },
+    )
+    
+    record_edits = []
+    for (_, before), (_, after) in zip(page.iterrows(), edited.iterrows()):
+        changes = {
+            col: after[col] for col in ['paid', 'payment_method', 'service_status']
+            if before[col] != after[col] and not (pd.isna(before[col]) and pd.isna(after[col]))
+        }
+        if changes:
+            record_edits.append((int(before['id']), int(before['version']), changes))
+    
+    if record_edits:
+        if st.button(f"💾 Save {len(record_edits)} Changed Record{'s' if len(record_edits) > 1 else ''}", type="primary"):
+            try:
+                update_records(db, record_edits)
+                st.session_state.records_saved = st.session_state.get('records_saved', 0) + 1
+                st.session_state.records_flash = [('success', f"✅ Saved {len(record_edits)} record(s)")]
+                st.rerun()
+            except (StaleRecord, RecordNotFound) as e:
+                st.error(f"❌ Nothing saved: {e}. Someone else changed it; reload the page and try again.")
+            except Exception as e:
+                st.error(f"❌ Save failed: {str(e)}")
+    
+    # Bulk changes for everything matching the filters, not just this page
+    with st.expander(f"⚡ Bulk Update ({matching:,} matching records)"):
+        bcol1, bcol2, bcol3 = st.columns(3)
+        with bcol1:
+            bulk_paid = st.selectbox("Mark as", ["Unchanged", "Paid", "Unpaid"])
+        with bcol2:
+            bulk_method = st.selectbox("Payment method", ["Unchanged"] + PAYMENT_METHODS)
+        with bcol3:
+            bulk_status = st.selectbox("Set status", ["Unchanged"] + SERVICE_STATUSES)
+        
+        bulk_changes = {}
+        if bulk_paid != "Unchanged":
+            bulk_changes['paid'] = bulk_paid == "Paid"
+        if bulk_method != "Unchanged":
+            bulk_changes['payment_method'] = bulk_method
+        if bulk_status != "Unchanged":
+            bulk_changes['service_status'] = bulk_status
         
-        with st.expander(f"🏠 {name} • {phone} • ₹{amount:,.0f} • {service_status}"):
-            col1, col2 = st.columns([3, 1])
-            
-            with col1:
-                visit_date_str = 'N/A'
-                if 'visit_date' in row and pd.notnull(row['visit_date']):
-                    try:
-                        visit_date_str = pd.to_datetime(row['visit_date']).strftime('%Y-%m-%d')
-                    except:
-                        visit_date_str = str(row['visit_date'])
-                
-                payment_status = "✅ Paid" if row.get('paid', 0) == 1 else "❌ Unpaid"
-                
-                st.markdown(f"""
-                **🛡️ Service:** {row.get('service', 'Not specified')}  
-                **📅 Visit Date:** {visit_date_str}  
-                **📍 Address:** {row.get('address', 'Not provided')}  
-                **💳 Payment:** {payment_status} via {row.get('payment_method', 'Unknown')}  
-                **📊 Status:** `{service_status}`  
-                **💰 Amount:** ₹{amount:,.2f}
-                """)
-            
-            with col2:
-                # Update functionality
-                if st.button(f"🔄 Edit Record", key=f"edit_{row.get('id', idx)}", use_container_width=True):
-                    st.info("Record editing available in full version")
-
-    # Show total record count
-    if len(df) > 15:
-        st.markdown(f"<div style='color: rgba(255,255,255,0.6); text-align: center; margin: 2rem 0;'>Showing first 15 records. Total: {len(df)} records in database.</div>", unsafe_allow_html=True)
+        if st.button(f"Apply to {matching:,} records", disabled=not bulk_changes or not matching, use_container_width=True):
+            try:
+                with db.read() as conn:
+                    targets = matching_versions(conn, record_filters)
+                with st.spinner("Updating records..."):
+                    outcome = bulk_update(db, targets, bulk_changes)
+                flash = [('success', f"✅ Updated {len(outcome['updated']):,} records")]
+                if outcome['conflicts']:
+                    flash.append(('warning', f"⚠️ {len(outcome['conflicts']):,} records changed or were deleted while updating and were skipped"))
+                st.session_state.records_saved = st.session_state.get('records_saved', 0) + 1
+                st.session_state.records_flash = flash
+                st.rerun()
+            except Exception as e:
+                st.error(f"❌ Bulk update failed: {str(e)}")
+
+    # Addresses stay in SQLite until a single record is opened
+    if not page.empty:
+        with st.expander("🔎 Record Details"):
+            labels = {int(row.id): f"#{row.id} · {row.name}" for row in page.itertuples()}
+            selected = st.selectbox("Record", list(labels), format_func=labels.get)
+            with db.read() as conn:
+                record = fetch_record(conn, selected)
+            if record is None:
+                st.warning("This record no longer exists.")
+            else:
+                dcol1, dcol2 = st.columns(2)
+                with dcol1:
+                    st.markdown(f"**{record['name']}**  \n📞 {record['phone'] or '—'}")
+                    st.markdown(f"📍 {record['address'] or 'No address on file'}")
+                with dcol2:
+                    st.markdown(
+                        f"**{record['service'] or '—'}** on {record['visit_date'] or '—'}  \n"
+                        f"₹{record['amount'] or 0:,.2f} · {'Paid' if record['paid'] else 'Unpaid'}"
+                        f" ({record['payment_method'] or '—'})  \n"
+                        f"Status: {record['service_status'] or '—'}"
+                    )
+
+    pcol1, pcol2, pcol3 = st.columns([1, 2, 1])
+    with pcol1:
+        if st.button("⬅️ Previous", disabled=page_number == 1, use_container_width=True):
+            st.session_state.records_cursors.pop()
+            st.rerun()
+    with pcol2:
+        shown = f"{first:,}–{first + len(page) - 1:,}" if len(page) else "0"
+        st.markdown(f"<div style='color: rgba(255,255,255,0.6); text-align: center;'>Showing {shown} of {matching:,} matching records</div>", unsafe_allow_html=True)
+    with pcol3:
+        if st.button("Next ➡️", disabled=not has_more, use_container_width=True):
+            st.session_state.records_cursors.append(int(page['id'].iloc[-1]))
+            st.rerun()
+
+timing.lap('records_browser')
 
 # Sidebar with stats
 with st.sidebar:
     st.markdown('<div style="background: rgba(255,255,255,0.1); padding: 1rem; border-radius: 10px; margin-bottom: 1rem; text-align: center; color: white; font-weight: 600;">📊 Quick Stats</div>', unsafe_allow_html=True)
     
     if not df.empty:
-        # Safe calculations for sidebar
-        pending_payments = 0
-        recent_customers = 0
+        # Sidebar stats come from the same one-pass KPI computation as the cards
+        kpis = aggregates['kpis']
         
-        if 'paid' in df.columns and 'amount' in df.columns:
-            pending_payments = df[df['paid'] == 0]['amount'].sum()
-        
-        if 'visit_date' in df.columns:
-            try:
-                recent_customers = len(df[pd.to_datetime(df['visit_date'], errors='coerce') >= (datetime.now() - timedelta(days=7))])
-            except:
-                recent_customers = 0
+        # Pending Payments is already a card; collections care how old it is
+        try:
+            if head_office:
+                owed = merge_receivables(get_branch_receivables(branch_tokens('aggregates'), datetime.now().date()))
+            else:
+                owed = get_receivables(db_path, data_token(db_path, 'aggregates'), datetime.now().date())
+            oldest = owed[owed['bucket'] == BUCKET_LABELS[-1]]
+            st.metric(f"💳 Owed {BUCKET_LABELS[-1]} Days", f"₹{oldest['amount'].sum():,.0f}",
+                      f"{int(oldest['jobs'].sum()):,} jobs", delta_color="off")
+        except Exception:
+            st.metric("💰 Pending Payments", f"₹{kpis['total_pending']:,.0f}")
+        st.metric("📊 Total Records", f"{kpis['total_contracts']}")
+        st.metric("🗓️ Visits (Last 7 Days)", f"{kpis['recent_visits']:,}")
+        st.metric("🎯 Completion Rate", f"{kpis['completion_rate']:.1f}%" if kpis['total_contracts'] > 0 else "0%")
         
-        st.metric("💰 Pending Payments", f"₹{pending_payments:,.0f}")
-        st.metric("📊 Total Records", f"{len(df)}")
-        st.metric("🎯 Completion Rate", f"{(completed_count/total_contracts*100):.1f}%" if total_contracts > 0 else "0%")
+        try:
+            paths = BRANCHES.values() if head_office else [db_path]
+            summaries = [get_overdue_summary(path) for path in paths]
+            overdue = {key: sum(summary[key] for summary in summaries) for key in ['count', 'amount']}
+            st.metric(f"⏰ Overdue (>{OVERDUE_DAYS} Days)", f"{overdue['count']:,}", f"₹{overdue['amount']:,.0f} unpaid", delta_color="off")
+        except Exception:
+            pass
         
         # Export functionality
+        export_format = st.selectbox("Export Format", list(EXPORT_FORMATS), format_func=lambda f: f.upper())
+        export_filtered = st.checkbox("Only records matching the browser filters")
         if st.button("📊 Export Database", use_container_width=True):
-            csv = df.to_csv(index=False).encode('utf-8')
-            st.download_button(
-                label="💾 Download CSV",
-                data=csv,
-                file_name=f'pest_control_backup_{datetime.now().strftime("%Y%m%d")}.csv',
-                mime='text/csv',
-                use_container_width=True
-            )
+            db = get_database()
+            if db:
+                # Rows stream from SQLite into a temporary file in chunks
+                extension, mime = EXPORT_FORMATS[export_format]
+                handle, export_path = tempfile.mkstemp(suffix=extension)
+                os.close(handle)
+                try:
+                    with db.read() as conn:
+                        exported = export_records(
+                            conn, export_path, export_format,
+                            record_filters if export_filtered else build_filters()
+                        )
+                    with open(export_path, 'rb') as export_file:
+                        st.download_button(
+                            label=f"💾 Download {export_format.upper()} ({exported:,} rows)",
+                            data=export_file,
+                            file_name=backup_filename(export_format),
+                            mime=mime,
+                            use_container_width=True
+                        )
+                except Exception as e:
+                    st.error(f"❌ Export failed: {str(e)}")
+                finally:
+                    os.remove(export_path)
 
 # Footer
 st.markdown("""
@@ -595,3 +951,30 @@ st.markdown("""
     <p>Your real pest control business • Professional analytics • Modern interface</p>
 </div>
 """, unsafe_allow_html=True)
+
+timing.lap('sidebar_and_footer')
+timing_run = timing.end_run()
+
+# Admin-only timing panel: PESTCONTROL_ADMIN=1
+if show_admin:
+    with st.sidebar.expander("⏱️ Performance Timings", expanded=timing.is_enabled()):
+        recording = st.checkbox("Record timings", value=timing.is_enabled(),
+                                help="Times each page section and SQL query on every rerun")
+        if recording != timing.is_enabled():
+            timing.enable(recording)
+            timing.clear()
+            st.rerun()
+
+        if timing_run is not None:
+            st.caption(f"Last rerun: {timing_run.seconds * 1000:,.0f} ms")
+            breakdown = pd.DataFrame(timing_run.records)
+            st.dataframe(breakdown.sort_values('ms', ascending=False), hide_index=True, use_container_width=True)
+
+        if timing.history():
+            st.caption(f"p50/p95 over the last {len(timing.history())} reruns")
+            st.dataframe(pd.DataFrame(timing.rolling_stats()), hide_index=True, use_container_width=True)
+            st.download_button("💾 Download JSONL", timing.to_jsonl(), file_name='timing.jsonl',
+                               mime='application/jsonl', use_container_width=True)
+            if st.button(f"📝 Append to {TIMING_LOG}", use_container_width=True):
+                written = timing.append_jsonl(TIMING_LOG)
+                st.success(f"✅ Appended {written} reruns to {TIMING_LOG}")
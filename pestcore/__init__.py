@@ -0,0 +1 @@
+"""Headless data and analytics core for the BharatPest Control dashboard"""
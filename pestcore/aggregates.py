@@ -0,0 +1,75 @@
+"""KPI and chart aggregates computed inside SQLite, with an in-memory fallback
+
+Both paths return the same shape::
+
+    {
+        'kpis': {'total_contracts', 'total_revenue', 'total_paid', 'total_pending',
+                 'completed_count', 'completion_rate', 'recent_visits'},
+        'services': DataFrame[service, count],   # most frequent first
+        'payments': DataFrame[paid, count],      # most frequent first
+    }
+"""
+import pandas as pd
+
+from pestcore.metrics import COMPLETED_STATUSES, compute_metrics, recent_first_day
+from pestcore.migrations import ISO_DATE_GLOB
+
+
+def sql_aggregates(conn, table='customers', now=None):
+    """Compute the dashboard aggregates with grouped queries inside SQLite"""
+    placeholders = ', '.join('?' for _ in COMPLETED_STATUSES)
+    row = conn.execute(f'''
+        SELECT COUNT(*),
+               TOTAL(amount),
+               TOTAL(CASE WHEN paid = 1 THEN amount END),
+               TOTAL(CASE WHEN paid = 0 THEN amount END),
+               COUNT(CASE WHEN service_status IN ({placeholders}) THEN 1 END),
+               COUNT(CASE WHEN visit_date >= ? AND visit_date GLOB ? THEN 1 END)
+        FROM "{table}"
+    ''', COMPLETED_STATUSES + [recent_first_day(now).isoformat(), ISO_DATE_GLOB + '*']).fetchone()
+    total, revenue, paid, pending, completed, recent = row
+    kpis = {
+        'total_contracts': total,
+        'total_revenue': round(revenue, 2),
+        'total_paid': round(paid, 2),
+        'total_pending': round(pending, 2),
+        'completed_count': completed,
+        'completion_rate': completed / total * 100 if total else 0.0,
+        'recent_visits': recent,
+    }
+
+    services = pd.DataFrame(conn.execute(f'''
+        SELECT service, COUNT(*) AS count FROM "{table}"
+        WHERE service IS NOT NULL
+        GROUP BY service ORDER BY count DESC, service
+    ''').fetchall(), columns=['service', 'count'])
+
+    payments = pd.DataFrame(conn.execute(f'''
+        SELECT paid, COUNT(*) AS count FROM "{table}"
+        WHERE paid IS NOT NULL
+        GROUP BY paid ORDER BY count DESC, paid
+    ''').fetchall(), columns=['paid', 'count'])
+
+    return {'kpis': kpis, 'services': services, 'payments': payments}
+
+
+def _counts(series, name):
+    """value_counts() as a frame ordered like the SQL path"""
+    counts = series.dropna().value_counts()
+    # Categoricals also report unused categories
+    counts = counts[counts > 0]
+    counts = pd.DataFrame({name: counts.index.to_numpy(dtype=object), 'count': counts.to_numpy(dtype=int)})
+    return counts.sort_values(['count', name], ascending=[False, True], ignore_index=True)
+
+
+def frame_aggregates(df, now=None):
+    """Compute the dashboard aggregates from an already loaded DataFrame"""
+    kpis = compute_metrics(df, now)
+
+    services = _counts(df['service'], 'service') if 'service' in df.columns \
+        else pd.DataFrame(columns=['service', 'count'])
+    # SQLite returns paid as a plain integer
+    payments = _counts(df['paid'].astype('Int64'), 'paid').astype({'paid': 'int64'}) if 'paid' in df.columns \
+        else pd.DataFrame(columns=['paid', 'count'])
+
+    return {'kpis': kpis, 'services': services, 'payments': payments}
@@ -0,0 +1,701 @@
+"""Benchmarks and load tests for the dashboard's data layer
+
+Every scenario runs against a scratch database unless ``--db`` is given.
+
+    python -m pestcore.bench stress --sessions 8 --seconds 10
+    python -m pestcore.bench metrics --rows 10000 1000000 10000000
+    python -m pestcore.bench memory --rows 1000000
+    python -m pestcore.bench snapshot --rows 1000000
+    python -m pestcore.bench startup --rows 100000
+    python -m pestcore.bench branches --branches 1 2 4 8 --rows 200000
+    python -m pestcore.bench writes --submitters 16 --seconds 10
+    python -m pestcore.bench routes --stops 500 3000 --technicians 1 4
+    python -m pestcore.bench load --rows 10k 1m --out load.jsonl --baseline baseline.jsonl
+"""
+import argparse
+import gc
+import json
+import math
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from pestcore.aggregates import sql_aggregates
+from pestcore import timing
+from pestcore.branches import BRANCHES_ENV, DB_ENV, BranchSet, merge_aggregates
+from pestcore.data import CustomerCache, memory_report
+from pestcore.db import ConnectionManager
+from pestcore.metrics import compute_metrics
+from pestcore.receivables import refresh_receivables
+from pestcore.rollups import refresh_rollups
+from pestcore.routes import distance_matrix, nearest_neighbour, plan_routes, route_summary
+from pestcore.scheduler import run_once
+from pestcore.snapshot import SNAPSHOT_SUFFIX, SnapshotCache, snapshot_path, write_snapshot
+from pestcore.synthetic import INSERT_SQL, generate_database, parse_rows, random_row, seed_database, synthetic_frame
+from pestcore.writequeue import RECORD_COLUMNS, WriteQueue
+
+def legacy_metrics(df, now):
+    """The dashboard's original multi-pass metric code, kept as a baseline"""
+    total_revenue = df['amount'].sum()
+    total_paid = df.loc[df['paid'] == 1, 'amount'].sum()
+    total_pending = df.loc[df['paid'] == 0, 'amount'].sum()
+    completed_count = len(df[df['service_status'] == 'Completed'])
+    pending_payments = df[df['paid'] == 0]['amount'].sum()
+    recent = len(df[pd.to_datetime(df['visit_date'], errors='coerce') >= (now - timedelta(days=7))])
+    return total_revenue, total_paid, total_pending, completed_count, pending_payments, recent
+
+
+def best_of(func, repeat):
+    """Fastest wall time of ``repeat`` calls, in seconds"""
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def metrics_benchmark(sizes, repeat=5, seed=0):
+    """compute_metrics() against the legacy multi-pass code per table size"""
+    now = pd.Timestamp('2025-06-01').to_pydatetime()
+    results = []
+    for rows in sizes:
+        df = synthetic_frame(rows, seed)
+        legacy = best_of(lambda: legacy_metrics(df, now), repeat)
+        one_pass = best_of(lambda: compute_metrics(df, now), repeat)
+        results.append({
+            'rows': rows,
+            'legacy_ms': round(legacy * 1000, 2),
+            'one_pass_ms': round(one_pass * 1000, 2),
+            'speedup': round(legacy / one_pass, 1) if one_pass else None,
+        })
+        del df
+    return results
+
+
+def memory_benchmark(db_path):
+    """Bytes per row of the legacy ``SELECT *`` frame against the compact cache"""
+    conn = sqlite3.connect(db_path)
+    try:
+        legacy = pd.read_sql_query("SELECT * FROM customers ORDER BY id DESC", conn)
+        legacy['visit_date'] = pd.to_datetime(legacy['visit_date'], errors='coerce')
+        before = memory_report(legacy)
+        del legacy
+        after = memory_report(CustomerCache(db_path).refresh(conn))
+    finally:
+        conn.close()
+    return {'before': before, 'after': after}
+
+
+def snapshot_benchmark(db_path, new_rows=1000):
+    """Cold customer-cache fill from SQLite against one from a fresh snapshot
+
+    ``new_rows`` copies of the newest row are added after the snapshot is
+    written, so the snapshot load also reads a delta from SQLite.
+    """
+    path = snapshot_path(db_path)
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        written = write_snapshot(conn, path)
+        cursor = conn.execute("SELECT * FROM customers ORDER BY id DESC LIMIT 1")
+        columns = [description[0] for description in cursor.description][1:]
+        newest = cursor.fetchone()[1:]
+        conn.execute("BEGIN")
+        conn.executemany(
+            f"INSERT INTO customers ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            [newest] * new_rows
+        )
+        conn.execute("COMMIT")
+
+        started = time.perf_counter()
+        from_sqlite = CustomerCache(db_path).refresh(conn)
+        sqlite_ms = (time.perf_counter() - started) * 1000
+
+        cache = SnapshotCache(db_path)
+        started = time.perf_counter()
+        from_snapshot = cache.refresh(conn)
+        snapshot_ms = (time.perf_counter() - started) * 1000
+        try:
+            # Appended rows can reorder categories, as any incremental refresh does
+            pd.testing.assert_frame_equal(from_sqlite, from_snapshot, check_categorical=False)
+            match = True
+        except AssertionError:
+            match = False
+    finally:
+        conn.close()
+    return {
+        'rows': len(from_sqlite),
+        'write_s': written['seconds'],
+        'file_mb': round(os.path.getsize(path) / 1024 / 1024, 1),
+        'sqlite_ms': round(sqlite_ms, 1),
+        'snapshot_ms': round(snapshot_ms, 1),
+        'snapshot_load': cache.last_refresh['kind'],
+        'match': match,
+    }
+
+
+# Budgets enforced by ``bench startup`` on a 100k-row database
+CORE_IMPORT_BUDGET_MS = 1000
+COLD_START_BUDGET_MS = 3000
+RERUN_BUDGET_MS = 300
+
+# Modules the headless core must not pull in at import time
+HEAVY_MODULES = ['plotly', 'altair', 'streamlit']
+
+APP_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pestcontrol.py')
+
+_CORE_IMPORT = """
+import sys, time
+started = time.perf_counter()
+import pestcore.aggregates, pestcore.charts, pestcore.data, pestcore.db, pestcore.export
+import pestcore.importer, pestcore.metrics, pestcore.records, pestcore.rollups
+print((time.perf_counter() - started) * 1000)
+print(' '.join(name for name in {heavy!r} if name in sys.modules))
+"""
+
+
+def core_import_time():
+    """Import time of the headless core in a fresh interpreter, and any heavy modules it loaded"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run(
+        [sys.executable, '-c', _CORE_IMPORT.format(heavy=HEAVY_MODULES)],
+        cwd=root, capture_output=True, text=True, check=True,
+    ).stdout.splitlines()
+    return round(float(output[0]), 1), output[1].split() if len(output) > 1 else []
+
+
+def startup_benchmark(db_path, reruns=10, script=APP_SCRIPT):
+    """Cold-start and rerun wall time of the Streamlit page against ``db_path``
+
+    The page opens ``pestcontrol.db`` in the working directory, so the run
+    happens from the database's folder. Must be the first app run in this
+    process for the cold start to be cold.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    import_ms, heavy = core_import_time()
+    previous = os.getcwd()
+    os.chdir(os.path.dirname(os.path.abspath(db_path)))
+    try:
+        started = time.perf_counter()
+        app = AppTest.from_file(script, default_timeout=120)
+        app.run()
+        cold = time.perf_counter() - started
+        timings = []
+        for _ in range(reruns):
+            started = time.perf_counter()
+            app.run()
+            timings.append(time.perf_counter() - started)
+        errors = [str(element.value) for element in app.exception]
+    finally:
+        os.chdir(previous)
+
+    rerun = summarize(timings)
+    budgets = {
+        'core_import': (import_ms, CORE_IMPORT_BUDGET_MS),
+        'cold_start': (round(cold * 1000, 1), COLD_START_BUDGET_MS),
+        'rerun_p50': (rerun['p50_ms'], RERUN_BUDGET_MS),
+    }
+    return {
+        'budgets': budgets,
+        'rerun': rerun,
+        'heavy_imports': heavy,
+        'errors': errors,
+        'ok': not heavy and not errors and all(value <= limit for value, limit in budgets.values()),
+    }
+
+
+def branches_benchmark(counts, rows, repeat=3, directory=None):
+    """Head-office aggregation over 1..N branches, one query at a time vs fanned out
+
+    Seeds ``max(counts)`` branch databases of ``rows`` rows each. Latency
+    that grows sub-linearly with the branch count shows the fan-out
+    overlapping branch queries.
+    """
+    directory = directory or tempfile.mkdtemp(prefix='pestbench-branches-')
+    paths = {
+        f"Branch {index + 1}": seed_database(os.path.join(directory, f'branch{index + 1}.db'), rows, seed=index)
+        for index in range(max(counts))
+    }
+    results = []
+    for count in counts:
+        branches = BranchSet(dict(list(paths.items())[:count]))
+        try:
+            branches.read_all(lambda conn: conn.execute("SELECT 1").fetchone())
+
+            def sequential():
+                per_branch = {}
+                for name in branches.names:
+                    with branches.manager(name).read() as conn:
+                        per_branch[name] = sql_aggregates(conn)
+                return merge_aggregates(per_branch)
+
+            serial = best_of(sequential, repeat)
+            parallel = best_of(lambda: merge_aggregates(branches.read_all(sql_aggregates)), repeat)
+        finally:
+            for name in branches.names:
+                branches.manager(name).close()
+            branches.close()
+        results.append({
+            'branches': count,
+            'sequential_ms': round(serial * 1000, 1),
+            'fan_out_ms': round(parallel * 1000, 1),
+        })
+    base = results[0]['fan_out_ms'] / results[0]['branches']
+    for result in results:
+        # 1.0 means linear growth; lower is better
+        result['growth'] = round(result['fan_out_ms'] / (base * result['branches']), 2) if base else None
+    return results
+
+
+def summarize(samples):
+    """Count, p50, p95 and max of latencies in milliseconds"""
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+    return {
+        'count': len(ordered),
+        'p50_ms': round(statistics.median(ordered) * 1000, 2),
+        'p95_ms': round(ordered[math.ceil(0.95 * len(ordered)) - 1] * 1000, 2),
+        'max_ms': round(ordered[-1] * 1000, 2),
+    }
+
+
+def stress(db_path, sessions=8, seconds=10.0, write_ratio=0.2, seed=0):
+    """Concurrent sessions mixing single-row inserts with dashboard reads"""
+    manager = ConnectionManager(db_path).check()
+    latencies = {'insert': [], 'read': []}
+    errors = []
+    deadline = time.perf_counter() + seconds
+
+    def session(index):
+        rng = random.Random(seed + index)
+        inserts, reads = [], []
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                if rng.random() < write_ratio:
+                    with manager.write() as conn:
+                        conn.execute(INSERT_SQL, random_row(rng))
+                    inserts.append(time.perf_counter() - started)
+                else:
+                    with manager.read() as conn:
+                        sql_aggregates(conn)
+                        conn.execute("SELECT * FROM customers ORDER BY id DESC LIMIT 50").fetchall()
+                    reads.append(time.perf_counter() - started)
+            except Exception as e:
+                errors.append(repr(e))
+        latencies['insert'].extend(inserts)
+        latencies['read'].extend(reads)
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    manager.close()
+
+    return {
+        'sessions': sessions,
+        'seconds': seconds,
+        'insert': summarize(latencies['insert']),
+        'read': summarize(latencies['read']),
+        'inserts_per_sec': round(len(latencies['insert']) / seconds, 1),
+        'errors': len(errors),
+    }
+
+
+def write_load(db_path, submitters=16, seconds=10.0, queued=True, seed=0):
+    """Sustained form-style inserts: each submitter saves a row and waits for it
+
+    ``queued`` sends rows through a WriteQueue; otherwise every row is its
+    own write transaction, as the add form used to do. The rollup and
+    receivables write hooks run either way, as in the app.
+    """
+    manager = ConnectionManager(db_path).check().add_write_hook(refresh_rollups).add_write_hook(refresh_receivables)
+    writes = WriteQueue(manager).start() if queued else None
+    latencies, errors = [], []
+    deadline = time.perf_counter() + seconds
+
+    def submitter(index):
+        rng = random.Random(seed + index)
+        acks = []
+        while time.perf_counter() < deadline:
+            row = random_row(rng)
+            started = time.perf_counter()
+            try:
+                if queued:
+                    writes.submit(dict(zip(RECORD_COLUMNS, row))).result()
+                else:
+                    with manager.write() as conn:
+                        conn.execute(INSERT_SQL, row)
+                acks.append(time.perf_counter() - started)
+            except Exception as e:
+                errors.append(repr(e))
+        latencies.extend(acks)
+
+    threads = [threading.Thread(target=submitter, args=(i,)) for i in range(submitters)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if writes is not None:
+        writes.stop()
+    manager.close()
+
+    result = {
+        'mode': 'queued' if queued else 'direct',
+        'submitters': submitters,
+        'ack': summarize(latencies),
+        'inserts_per_sec': round(len(latencies) / seconds, 1),
+        'errors': len(errors),
+    }
+    if writes is not None:
+        result['rows_per_commit'] = round(writes.stats['rows'] / max(writes.stats['batches'], 1), 1)
+    return result
+
+
+def routes_benchmark(sizes, technicians, seed=0):
+    """Route planning time and length against nearest neighbour alone
+
+    Stops are scattered over a 30 km square, about the size of Pune.
+    """
+    rng = np.random.default_rng(seed)
+    results = []
+    for stops in sizes:
+        points = pd.DataFrame({'lat': 18.45 + rng.random(stops) * 0.27, 'lon': 73.72 + rng.random(stops) * 0.28})
+        depot = (float(points['lat'].mean()), float(points['lon'].mean()))
+        dist = distance_matrix(np.append(depot[0], points['lat']), np.append(depot[1], points['lon']))
+        order = nearest_neighbour(dist)
+        greedy_km = dist[order[:-1], order[1:]].sum()
+        for teams in technicians:
+            started = time.perf_counter()
+            routes = plan_routes(points, teams, depot)
+            results.append({
+                'stops': stops,
+                'technicians': teams,
+                'seconds': round(time.perf_counter() - started, 2),
+                'km': round(float(route_summary(routes)['km'].sum()), 1),
+                'nearest_neighbour_km': round(float(greedy_km), 1) if teams == 1 else None,
+            })
+    return results
+
+
+def _widget(elements, label):
+    return next(element for element in elements if element.label == label)
+
+
+def _add_record(app):
+    if not any(button.label == "💾 Save Record" for button in app.button):
+        _widget(app.button, "➕ Add New Customer").click()
+        app.run()
+    _widget(app.text_input, "Customer Name").input("Load Test")
+    _widget(app.number_input, "Amount (₹)").set_value(1500.0)
+    _widget(app.button, "💾 Save Record").click()
+
+
+# Page interactions replayed by ``bench load``, in order: (name, action before the rerun)
+LOAD_SCENARIOS = [
+    ('rerun', lambda app: None),
+    ('search', lambda app: _widget(app.text_input, "Search").input("patil")),
+    ('clear_search', lambda app: _widget(app.text_input, "Search").input("")),
+    ('next_page', lambda app: _widget(app.button, "Next ➡️").click()),
+    ('trend_last_year', lambda app: _widget(app.selectbox, "Range").set_value("Last Year")),
+    ('trend_daily', lambda app: _widget(app.radio, "Granularity").set_value("Day")),
+    ('aging_drilldown', lambda app: _widget(app.selectbox, "Aging Bucket").set_value("90+")),
+    ('add_record', _add_record),
+    ('export_csv', lambda app: _widget(app.button, "📊 Export Database").click()),
+]
+
+# Reruns per scenario; the first applies the interaction, later ones repeat it
+LOAD_REPEAT = 3
+
+# Relative slowdown or memory growth over the baseline reported as a regression
+LOAD_TOLERANCE = 0.25
+
+
+def _reset_peak_rss():
+    """Restart the peak RSS count where Linux allows it (VmHWM)"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as handle:
+            handle.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss_mb():
+    """Peak RSS since the last reset, or since process start where it cannot be reset"""
+    try:
+        with open('/proc/self/status') as handle:
+            for line in handle:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def drive_app(db_path, repeat=LOAD_REPEAT, script=APP_SCRIPT):
+    """Replay ``LOAD_SCENARIOS`` against the page headlessly; one result per scenario
+
+    Run it in a fresh process: the first run is the cold start, and peak
+    RSS covers only this page. Query time is the SQLite time the timing
+    module records on the script thread, so background writers are excluded.
+    """
+    os.environ[DB_ENV] = os.path.abspath(db_path)
+    os.environ.pop(BRANCHES_ENV, None)
+    from streamlit.testing.v1 import AppTest
+
+    timing.enable(True)
+    app = AppTest.from_file(script, default_timeout=600)
+    results = []
+
+    def measure(name, action, runs):
+        _reset_peak_rss()
+        samples, query_ms, queries, errors = [], [], [], []
+        for _ in range(runs):
+            try:
+                action(app)
+            except (StopIteration, ValueError) as e:
+                errors.append(f"{name}: widget not found ({e!r})")
+                break
+            started = time.perf_counter()
+            app.run()
+            samples.append(time.perf_counter() - started)
+            history = timing.history()
+            records = [record for record in history[-1].records if record['kind'] == 'query'] if history else []
+            query_ms.append(sum(record['ms'] for record in records))
+            queries.append(len(records))
+            errors.extend(str(element.value) for element in list(app.exception) + list(app.error))
+        results.append({
+            'scenario': name,
+            **summarize(samples),
+            'query_ms': round(statistics.median(query_ms), 2) if query_ms else None,
+            'queries': int(statistics.median(queries)) if queries else 0,
+            'peak_rss_mb': _peak_rss_mb(),
+            'errors': errors,
+        })
+
+    measure('cold_start', lambda app: None, 1)
+    for name, action in LOAD_SCENARIOS:
+        measure(name, action, repeat)
+    return results
+
+
+def load_database(rows, data_dir, seed=0):
+    """Synthetic database of ``rows`` rows, generated and settled once per data directory
+
+    A scheduler pass runs once after generation, as the command-line
+    scheduler would, so the page's own scheduler has nothing left to catch
+    up on while it is measured and a snapshot is in place.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f'synthetic-{rows}-seed{seed}.db')
+    if not os.path.exists(path):
+        generate_database(path + '.partial', rows, seed)
+        manager = ConnectionManager(path + '.partial').check()
+        try:
+            run_once(manager, snapshot=True)
+        finally:
+            manager.close()
+        for suffix in ['-wal', '-shm']:
+            if os.path.exists(path + '.partial' + suffix):
+                os.remove(path + '.partial' + suffix)
+        if os.path.exists(snapshot_path(path + '.partial')):
+            os.replace(snapshot_path(path + '.partial'), snapshot_path(path))
+        os.replace(path + '.partial', path)
+    return path
+
+
+def load_test(sizes, repeat=LOAD_REPEAT, data_dir=None, seed=0):
+    """``drive_app()`` against a synthetic database of each size, each in a fresh process"""
+    data_dir = data_dir or os.path.join(tempfile.gettempdir(), 'pestbench-load')
+    results = []
+    for rows in sizes:
+        db_path = load_database(rows, data_dir, seed)
+        # A copy per run: the page writes (add_record, scheduler passes)
+        scratch = os.path.join(tempfile.mkdtemp(prefix='pestbench-load-'), 'pestcontrol.db')
+        with sqlite3.connect(db_path) as source, sqlite3.connect(scratch) as target:
+            source.backup(target)
+        if os.path.exists(snapshot_path(db_path)):
+            shutil.copyfile(snapshot_path(db_path), snapshot_path(scratch))
+        try:
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                for result in pool.submit(drive_app, scratch, repeat).result():
+                    results.append({'rows': rows, **result})
+        finally:
+            for suffix in ['', '-wal', '-shm', SNAPSHOT_SUFFIX]:
+                if os.path.exists(scratch + suffix):
+                    os.remove(scratch + suffix)
+    return results
+
+
+def compare_to_baseline(results, baseline, tolerance=LOAD_TOLERANCE):
+    """Regressions against earlier ``load_test()`` results, as messages"""
+    previous = {(row['rows'], row['scenario']): row for row in baseline}
+    regressions = []
+    for row in results:
+        before = previous.get((row['rows'], row['scenario']))
+        if before is None:
+            continue
+        for metric in ['p50_ms', 'query_ms', 'peak_rss_mb']:
+            old, new = before.get(metric), row.get(metric)
+            if old and new and new > old * (1 + tolerance):
+                regressions.append(f"{row['rows']:,} rows {row['scenario']}: {metric} {old} -> {new}")
+    return regressions
+
+
+def _scratch_db(args):
+    """Database path for a scenario, seeding a scratch copy when none is given"""
+    if args.db:
+        return args.db
+    path = os.path.join(tempfile.mkdtemp(prefix='pestbench-'), 'bench.db')
+    return seed_database(path, args.rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pestcore.bench', description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    stress_cmd = commands.add_parser('stress', help='concurrent insert/read latency')
+    stress_cmd.add_argument('--db', help='database to hammer (default: seeded scratch copy)')
+    stress_cmd.add_argument('--rows', type=int, default=100_000, help='rows to seed the scratch database with')
+    stress_cmd.add_argument('--sessions', type=int, default=8)
+    stress_cmd.add_argument('--seconds', type=float, default=10.0)
+    stress_cmd.add_argument('--write-ratio', type=float, default=0.2)
+
+    metrics_cmd = commands.add_parser('metrics', help='one-pass metrics vs the legacy multi-pass code')
+    metrics_cmd.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    metrics_cmd.add_argument('--repeat', type=int, default=5)
+
+    memory_cmd = commands.add_parser('memory', help='frame memory per row, legacy vs compact')
+    memory_cmd.add_argument('--db', help='database to load (default: seeded scratch copy)')
+    memory_cmd.add_argument('--rows', type=int, default=100_000, help='rows to seed the scratch database with')
+
+    snapshot_cmd = commands.add_parser('snapshot', help='cold cache fill from SQLite vs from the Arrow snapshot')
+    snapshot_cmd.add_argument('--db', help='database to snapshot (default: seeded scratch copy)')
+    snapshot_cmd.add_argument('--rows', type=int, default=100_000, help='rows to seed the scratch database with')
+
+    startup_cmd = commands.add_parser('startup', help='core import, cold start and rerun time against budgets')
+    startup_cmd.add_argument('--db', help='pestcontrol.db to run the page against (default: seeded scratch copy)')
+    startup_cmd.add_argument('--rows', type=int, default=100_000, help='rows to seed the scratch database with')
+    startup_cmd.add_argument('--reruns', type=int, default=10)
+
+    branches_cmd = commands.add_parser('branches', help='head-office aggregation latency by branch count')
+    branches_cmd.add_argument('--branches', type=int, nargs='+', default=[1, 2, 4, 8])
+    branches_cmd.add_argument('--rows', type=int, default=200_000, help='rows per branch database')
+    branches_cmd.add_argument('--repeat', type=int, default=3)
+
+    writes_cmd = commands.add_parser('writes', help='sustained inserts through the write queue vs direct commits')
+    writes_cmd.add_argument('--db', help='database to write to (default: seeded scratch copy)')
+    writes_cmd.add_argument('--rows', type=int, default=100_000, help='rows to seed the scratch database with')
+    writes_cmd.add_argument('--submitters', type=int, default=16)
+    writes_cmd.add_argument('--seconds', type=float, default=10.0)
+
+    load_cmd = commands.add_parser('load', help='rerun latency, peak RSS and query time of the page per data size')
+    load_cmd.add_argument('--rows', type=parse_rows, nargs='+', default=[10_000, 1_000_000],
+                          help='database sizes, e.g. 10k 1m 10m')
+    load_cmd.add_argument('--repeat', type=int, default=LOAD_REPEAT)
+    load_cmd.add_argument('--data-dir', help='where generated databases are kept between runs')
+    load_cmd.add_argument('--out', help='append results to this JSONL file')
+    load_cmd.add_argument('--baseline', help='JSONL from an earlier run to compare against')
+    load_cmd.add_argument('--tolerance', type=float, default=LOAD_TOLERANCE)
+
+    routes_cmd = commands.add_parser('routes', help='route planning time for a day of random stops')
+    routes_cmd.add_argument('--stops', type=int, nargs='+', default=[500, 1000, 3000])
+    routes_cmd.add_argument('--technicians', type=int, nargs='+', default=[1, 4])
+
+    args = parser.parse_args(argv)
+    if args.command == 'stress':
+        result = stress(_scratch_db(args), args.sessions, args.seconds, args.write_ratio)
+        for key, value in result.items():
+            print(f"{key:>16}: {value}")
+    elif args.command == 'metrics':
+        print(f"{'rows':>12} {'legacy ms':>12} {'one-pass ms':>12} {'speedup':>8}")
+        for row in metrics_benchmark(args.rows, args.repeat):
+            print(f"{row['rows']:>12,} {row['legacy_ms']:>12} {row['one_pass_ms']:>12} {row['speedup']:>7}x")
+    elif args.command == 'memory':
+        result = memory_benchmark(_scratch_db(args))
+        before, after = result['before'], result['after']
+        print(f"{'column':>16} {'before B/row':>14} {'after B/row':>14}")
+        for col in before['columns']:
+            size = after['columns'].get(col)
+            shown = f"{size / after['rows']:>14.1f}" if size is not None and after['rows'] else f"{'(lazy)':>14}"
+            print(f"{col:>16} {before['columns'][col] / max(before['rows'], 1):>14.1f} {shown}")
+        print(f"{'total':>16} {before['bytes_per_row']:>14} {after['bytes_per_row']:>14}")
+    elif args.command == 'snapshot':
+        for key, value in snapshot_benchmark(_scratch_db(args)).items():
+            print(f"{key:>16}: {value}")
+    elif args.command == 'startup':
+        if args.db:
+            db_path = args.db
+        else:
+            db_path = seed_database(os.path.join(tempfile.mkdtemp(prefix='pestbench-'), 'pestcontrol.db'), args.rows)
+        result = startup_benchmark(db_path, args.reruns)
+        for name, (value, limit) in result['budgets'].items():
+            print(f"{name:>16}: {value:>9} ms  (budget {limit} ms){'' if value <= limit else '  OVER'}")
+        print(f"{'rerun':>16}: {result['rerun']}")
+        if result['heavy_imports']:
+            print(f"{'heavy imports':>16}: {', '.join(result['heavy_imports'])}")
+        for error in result['errors']:
+            print(f"{'app error':>16}: {error}")
+        return 0 if result['ok'] else 1
+
+    elif args.command == 'branches':
+        print(f"{'branches':>8} {'sequential ms':>14} {'fan-out ms':>11} {'vs linear':>10}")
+        for row in branches_benchmark(sorted(args.branches), args.rows, args.repeat):
+            print(f"{row['branches']:>8} {row['sequential_ms']:>14} {row['fan_out_ms']:>11} {row['growth']:>9}x")
+        print(f"({os.cpu_count()} CPUs)")
+
+    elif args.command == 'writes':
+        db_path = _scratch_db(args)
+        for queued in (False, True):
+            result = write_load(db_path, args.submitters, args.seconds, queued)
+            print(f"{result.pop('mode'):>8}: {result}")
+
+    elif args.command == 'load':
+        results = load_test(args.rows, args.repeat, args.data_dir)
+        print(f"{'rows':>12} {'scenario':<16} {'p50 ms':>9} {'p95 ms':>9} {'query ms':>9} {'queries':>8} {'peak MB':>8}")
+        for row in results:
+            print(f"{row['rows']:>12,} {row['scenario']:<16} {row.get('p50_ms', '-'):>9} {row.get('p95_ms', '-'):>9} "
+                  f"{row['query_ms'] if row['query_ms'] is not None else '-':>9} {row['queries']:>8} {row['peak_rss_mb']:>8}")
+            for error in row['errors']:
+                print(f"{'':>12} {'':<16} error: {error}")
+        if args.out:
+            with open(args.out, 'a', encoding='utf-8') as handle:
+                for row in results:
+                    handle.write(json.dumps({'recorded': time.time(), **row}) + '\n')
+        failed = any(row['errors'] for row in results)
+        if args.baseline:
+            with open(args.baseline, encoding='utf-8') as handle:
+                baseline = [json.loads(line) for line in handle if line.strip()]
+            regressions = compare_to_baseline(results, baseline, args.tolerance)
+            for message in regressions:
+                print(f"REGRESSION {message}")
+            failed = failed or bool(regressions)
+        return 1 if failed else 0
+
+    elif args.command == 'routes':
+        print(f"{'stops':>6} {'techs':>6} {'seconds':>8} {'km':>9} {'NN km':>9}")
+        for row in routes_benchmark(args.stops, args.technicians):
+            greedy = row['nearest_neighbour_km'] if row['nearest_neighbour_km'] is not None else '-'
+            print(f"{row['stops']:>6} {row['technicians']:>6} {row['seconds']:>8} {row['km']:>9} {greedy:>9}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
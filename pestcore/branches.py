@@ -0,0 +1,159 @@
+"""Branch databases and head-office aggregation across them
+
+Each city branch keeps its own SQLite file with the usual schema. The set
+of branches comes from ``PESTCONTROL_BRANCHES``, a comma-separated list of
+``Name=path`` entries (a bare path is named after its file)::
+
+    PESTCONTROL_BRANCHES="Mumbai=data/mumbai.db,Pune=data/pune.db"
+
+Without it the dashboard runs on the single ``PESTCONTROL_DB`` file,
+``pestcontrol.db`` by default.
+
+Branches are separate files rather than databases ATTACHed to one
+connection: queries on one connection run one at a time, while separate
+pooled connections let ``BranchSet.fan_out()`` query every branch at once
+on a thread pool (sqlite3 releases the GIL while SQLite works).
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from pestcore.db import ConnectionManager
+from pestcore.receivables import BUCKET_LABELS
+
+DEFAULT_DB = 'pestcontrol.db'
+DB_ENV = 'PESTCONTROL_DB'
+BRANCHES_ENV = 'PESTCONTROL_BRANCHES'
+
+# Upper bound on concurrent branch queries
+MAX_WORKERS = 16
+
+
+def branch_paths(spec=None):
+    """Branch name -> database path, in configured order"""
+    spec = os.environ.get(BRANCHES_ENV, '') if spec is None else spec
+    branches = {}
+    for entry in spec.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, _, path = entry.rpartition('=')
+        path = path.strip()
+        name = name.strip() or os.path.splitext(os.path.basename(path))[0]
+        if name in branches:
+            raise ValueError(f"Branch {name!r} is configured twice")
+        branches[name] = path
+    if not branches:
+        path = os.environ.get(DB_ENV, DEFAULT_DB)
+        branches['Main'] = path
+    return branches
+
+
+class BranchSet:
+    """One ConnectionManager per branch plus a thread pool to query them all
+
+    ``open_branch(path)`` returns the checked manager for a path; pass the
+    page's cached factory so branches share managers (and their background
+    work) with the rest of the app.
+    """
+
+    def __init__(self, branches, open_branch=None):
+        self.branches = dict(branches)
+        self._open_branch = open_branch or (lambda path: ConnectionManager(path).check())
+        self._pool = ThreadPoolExecutor(
+            max_workers=min(MAX_WORKERS, max(len(self.branches), 1)),
+            thread_name_prefix='pestcore-branch',
+        )
+
+    @property
+    def names(self):
+        return list(self.branches)
+
+    def manager(self, name):
+        return self._open_branch(self.branches[name])
+
+    def fan_out(self, func, names=None):
+        """``func(name, manager)`` for every branch in parallel, as {name: result}
+
+        Results keep branch order. The first branch to fail raises once all
+        have finished.
+        """
+        names = self.names if names is None else list(names)
+        # Managers are opened on the calling thread, where the page's
+        # cached factories run
+        futures = {name: self._pool.submit(func, name, self.manager(name)) for name in names}
+        return {name: future.result() for name, future in futures.items()}
+
+    def read_all(self, query, names=None):
+        """``query(conn)`` on a pooled read connection of every branch"""
+        def run(name, manager):
+            with manager.read() as conn:
+                return query(conn)
+        return self.fan_out(run, names)
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+
+def _merge_counts(frames, key):
+    """Per-branch count frames summed and ordered like ``sql_aggregates``"""
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame(columns=[key, 'count'])
+    merged = pd.concat(frames, ignore_index=True).groupby(key, as_index=False, sort=False)['count'].sum()
+    return merged.sort_values(['count', key], ascending=[False, True], ignore_index=True)
+
+
+def merge_aggregates(per_branch):
+    """One head-office aggregates dict from per-branch ones
+
+    Sums are added up; the completion rate is recomputed from the totals
+    rather than averaged.
+    """
+    parts = list(per_branch.values())
+    kpis = {
+        name: sum(part['kpis'][name] for part in parts)
+        for name in ['total_contracts', 'completed_count', 'recent_visits']
+    }
+    for name in ['total_revenue', 'total_paid', 'total_pending']:
+        kpis[name] = round(sum(part['kpis'][name] for part in parts), 2)
+    total = kpis['total_contracts']
+    kpis['completion_rate'] = kpis['completed_count'] / total * 100 if total else 0.0
+
+    return {
+        'kpis': kpis,
+        'services': _merge_counts([part['services'] for part in parts], 'service'),
+        'payments': _merge_counts([part['payments'] for part in parts], 'paid'),
+    }
+
+
+def branch_table(per_branch):
+    """Per-branch KPIs as a DataFrame, one row per branch, for drill-down"""
+    rows = [dict(branch=name, **aggregates['kpis']) for name, aggregates in per_branch.items()]
+    return pd.DataFrame(rows)
+
+
+def merge_trends(per_branch):
+    """Per-branch ``rollups.trend()`` frames summed per period and group"""
+    frames = [frame for frame in per_branch.values() if frame is not None and not frame.empty]
+    if not frames:
+        return pd.DataFrame(columns=['period', 'group', 'jobs', 'revenue'])
+    return (
+        pd.concat(frames, ignore_index=True)
+        .groupby(['period', 'group'], as_index=False, sort=True)[['jobs', 'revenue']].sum()
+    )
+
+
+def merge_receivables(per_branch):
+    """Per-branch ``receivables.aging_summary()`` frames summed per bucket and payment method"""
+    frames = [frame for frame in per_branch.values() if frame is not None and not frame.empty]
+    if not frames:
+        return pd.DataFrame(columns=['bucket', 'payment_method', 'jobs', 'amount'])
+    merged = (
+        pd.concat(frames, ignore_index=True)
+        .groupby(['bucket', 'payment_method'], as_index=False, sort=False)[['jobs', 'amount']].sum()
+    )
+    merged['amount'] = merged['amount'].round(2)
+    order = merged['bucket'].map({label: position for position, label in enumerate(BUCKET_LABELS)})
+    return merged.iloc[order.argsort(kind='stable')].reset_index(drop=True)
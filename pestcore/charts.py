@@ -0,0 +1,226 @@
+"""Plotly chart specs for the dashboard, built without importing plotly
+
+Each builder returns a plain figure dict (``data`` traces plus ``layout``)
+that ``st.plotly_chart`` renders directly and ``st.cache_data`` can pickle.
+Plotly itself is only imported by ``to_figure()``, for callers that want a
+``go.Figure`` to export or inspect.
+
+``FigureCache`` keeps built figures keyed on a digest of the builder's
+input data and the theme, so an unchanged chart is neither rebuilt nor
+revalidated by plotly on the next rerun.
+"""
+import hashlib
+import pickle
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from pestcore.sampling import MAX_POINTS, thin_series
+
+SERVICE_COLORS = ['#ffb74d', '#f06292', '#64b5f6', '#81c784', '#ba68c8', '#4db6ac', '#ff8a65']
+PAYMENT_COLORS = ['#81c784', '#f06292']
+
+TRANSPARENT = 'rgba(0,0,0,0)'
+
+PAID_LABELS = {1: 'Paid', 0: 'Unpaid'}
+
+# Figures kept per process
+FIGURE_CACHE_SIZE = 64
+
+
+def _layout(**overrides):
+    """Dark transparent layout shared by every dashboard chart"""
+    layout = {'paper_bgcolor': TRANSPARENT, 'plot_bgcolor': TRANSPARENT}
+    layout.update(overrides)
+    return layout
+
+
+def service_donut(services, total):
+    """Donut of job counts per service, with the total in the hole
+
+    ``services`` is the ``services`` frame of the dashboard aggregates.
+    """
+    return {
+        'data': [{
+            'type': 'pie',
+            'labels': services['service'].astype(str).tolist(),
+            'values': services['count'].tolist(),
+            'hole': 0.6,
+            'marker': {
+                'colors': SERVICE_COLORS,
+                'line': {'color': 'rgba(255,255,255,0.8)', 'width': 2},
+            },
+            'textfont': {'color': 'white', 'size': 12},
+            'hovertemplate': '<b>%{label}</b><br>Count: %{value}<br>Percentage: %{percent}<extra></extra>',
+        }],
+        'layout': _layout(
+            showlegend=True,
+            legend={'font': {'color': 'white', 'size': 10}},
+            height=350,
+            margin={'l': 20, 'r': 20, 't': 20, 'b': 20},
+            annotations=[{
+                'text': f"<b>Total</b><br>{total:,}",
+                'x': 0.5, 'y': 0.5,
+                'font': {'size': 16, 'color': 'white'},
+                'showarrow': False,
+            }],
+        ),
+    }
+
+
+def payment_bar(payments):
+    """Bar chart of customers per payment state
+
+    ``payments`` is the ``payments`` frame of the dashboard aggregates.
+    """
+    counts = payments['count'].tolist()
+    return {
+        'data': [{
+            'type': 'bar',
+            'x': [PAID_LABELS.get(int(paid), 'Unpaid') for paid in payments['paid']],
+            'y': counts,
+            'marker': {'color': PAYMENT_COLORS},
+            'text': counts,
+            'textposition': 'auto',
+            'textfont': {'color': 'white', 'size': 14, 'family': 'Arial Black'},
+        }],
+        'layout': _layout(
+            xaxis={'title': {'text': 'Payment Status'}, 'color': 'white'},
+            yaxis={'title': {'text': 'Number of Customers'}, 'color': 'white'},
+            height=350,
+            showlegend=False,
+        ),
+    }
+
+
+def trend_lines(trend_df, value_column='revenue', grain_label='Month', paid_groups=False, max_points=MAX_POINTS):
+    """One line per group over the periods of a ``rollups.trend()`` frame
+
+    Lines longer than ``max_points`` are thinned with LTTB; bin long daily
+    ranges with ``sampling.bin_trend()`` first so totals stay exact.
+    """
+    groups = trend_df['group'].map(PAID_LABELS) if paid_groups else trend_df['group']
+    traces = []
+    for group, series in trend_df.groupby(groups, sort=True):
+        periods, values = thin_series(series['period'].tolist(), series[value_column].tolist(), max_points)
+        traces.append({
+            'type': 'scatter',
+            'x': periods,
+            'y': values,
+            'mode': 'lines+markers' if len(values) <= 60 else 'lines',
+            'name': str(group) or 'Unspecified',
+            'hovertemplate': '%{x}<br>%{y:,.0f}<extra>%{fullData.name}</extra>',
+        })
+    return {
+        'data': traces,
+        'layout': _layout(
+            # Thinned lines keep different periods; ISO strings sort by date
+            xaxis={'title': {'text': grain_label}, 'color': 'white', 'type': 'category',
+                   'categoryorder': 'category ascending'},
+            yaxis={'title': {'text': 'Revenue (₹)' if value_column == 'revenue' else 'Jobs'}, 'color': 'white'},
+            legend={'font': {'color': 'white', 'size': 10}},
+            height=380,
+            margin={'l': 20, 'r': 20, 't': 20, 'b': 20},
+        ),
+    }
+
+
+def route_map(routes, depot=None):
+    """Map of technician routes: one line of numbered stops per technician
+
+    ``routes`` is a ``routes.plan_routes()`` frame. Lines start at
+    ``depot`` when one is given.
+    """
+    traces = []
+    for index, (team, stops) in enumerate(routes.groupby('technician', sort=True)):
+        lat, lon = stops['lat'].tolist(), stops['lon'].tolist()
+        text = [f"{stop}. {name}" for stop, name in zip(stops['stop'], stops['name'])]
+        if depot is not None:
+            lat, lon, text = [depot[0]] + lat, [depot[1]] + lon, ['Depot'] + text
+        traces.append({
+            'type': 'scattermap',
+            'lat': lat,
+            'lon': lon,
+            'mode': 'lines+markers',
+            'name': f"Technician {team}",
+            'text': text,
+            'hoverinfo': 'text',
+            'marker': {'size': 8, 'color': SERVICE_COLORS[index % len(SERVICE_COLORS)]},
+            'line': {'width': 2, 'color': SERVICE_COLORS[index % len(SERVICE_COLORS)]},
+        })
+    center = (
+        {'lat': float(routes['lat'].mean()), 'lon': float(routes['lon'].mean())}
+        if len(routes) else {'lat': 18.5204, 'lon': 73.8567}
+    )
+    return {
+        'data': traces,
+        'layout': _layout(
+            map={'style': 'open-street-map', 'center': center, 'zoom': 11},
+            legend={'font': {'color': 'white', 'size': 10}},
+            height=480,
+            margin={'l': 0, 'r': 0, 't': 0, 'b': 0},
+        ),
+    }
+
+
+def to_figure(spec):
+    """A ``plotly.graph_objects.Figure`` for a spec, importing plotly on first use"""
+    try:
+        import plotly.graph_objects as go
+    except ImportError:
+        raise RuntimeError("Figure objects need plotly (pip install plotly)")
+    return go.Figure(spec)
+
+
+def data_digest(*values):
+    """Stable digest of builder arguments: frames by content, the rest by pickle"""
+    digest = hashlib.blake2b(digest_size=16)
+    for value in values:
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            labels = list(value.columns) if isinstance(value, pd.DataFrame) else value.name
+            digest.update(repr((type(value).__name__, labels, value.dtypes)).encode())
+            digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+        else:
+            digest.update(pickle.dumps(value, protocol=4))
+    return digest.hexdigest()
+
+
+class FigureCache:
+    """Process-wide LRU of validated figures
+
+    Entries are keyed on the builder, a digest of its arguments and the
+    theme key, and hold the ``go.Figure``, which ``st.plotly_chart`` sends
+    without validating it again. Thread-safe; figures must be treated as
+    read-only by callers.
+    """
+
+    def __init__(self, maxsize=FIGURE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._figures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, builder, *args, theme='', **kwargs):
+        """The figure for ``builder(*args, **kwargs)``, built on a miss"""
+        names = sorted(kwargs)
+        key = (builder.__qualname__, data_digest(*args, names, *(kwargs[name] for name in names)), theme)
+        with self._lock:
+            figure = self._figures.get(key)
+            if figure is not None:
+                self._figures.move_to_end(key)
+                self.hits += 1
+                return figure
+            self.misses += 1
+
+        figure = to_figure(builder(*args, **kwargs))
+        with self._lock:
+            self._figures[key] = figure
+            while len(self._figures) > self.maxsize:
+                self._figures.popitem(last=False)
+        return figure
+
+    def clear(self):
+        with self._lock:
+            self._figures.clear()
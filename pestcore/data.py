@@ -0,0 +1,270 @@
+"""Cached, incrementally refreshed customers DataFrame"""
+import os
+import sqlite3
+import threading
+import zlib
+
+import numpy as np
+import pandas as pd
+
+# Rows are digested in fixed id ranges so an edit only refetches its range
+BUCKET_SIZE = 4096
+
+SERVICE_STATUSES = ["Ongoing", "Completed", "Cancelled", "Scheduled"]
+
+# Old status values still present in historical rows
+LEGACY_STATUSES = {'Finished': 'Completed'}
+
+# Low-cardinality text columns kept as pandas categoricals
+CATEGORICAL_COLUMNS = ['service', 'payment_method', 'service_status']
+
+# Columns left in SQLite and fetched per record when shown
+LAZY_COLUMNS = ['address', 'version', 'updated_at']
+
+# Largest float32 rounding error accepted for amounts (half a paisa)
+AMOUNT_TOLERANCE = 0.005
+
+
+def _row_crc(*values):
+    """Stable checksum of one row, registered as an SQL function"""
+    return zlib.crc32(repr(values).encode('utf-8'))
+
+
+def table_digest(conn, table, columns, low, high):
+    """Per-bucket (count, checksum) of ``columns`` for rows with low <= id <= high"""
+    conn.create_function('row_crc', -1, _row_crc, deterministic=True)
+    selected = ', '.join(f'"{col}"' for col in columns)
+    rows = conn.execute(f'''
+        SELECT id / ? AS bucket, COUNT(*), SUM(row_crc({selected}))
+        FROM "{table}" WHERE id >= ? AND id <= ? GROUP BY bucket
+    ''', (BUCKET_SIZE, low, high)).fetchall()
+    return {bucket: (count, crc) for bucket, count, crc in rows}
+
+
+def records_version(conn):
+    """Counter bumped by every customers edit and delete, or None before it exists
+
+    Maintained by the change-tracking triggers (see ``pestcore.edits``).
+    """
+    try:
+        row = conn.execute("SELECT version FROM cache_state WHERE scope = 'records'").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+def database_token(db_path):
+    """Identity and modification state of a database file and its WAL"""
+    st = os.stat(db_path)
+    identity = (st.st_dev, st.st_ino)
+    state = [st.st_mtime_ns, st.st_size]
+    wal_path = db_path + '-wal'
+    if os.path.exists(wal_path):
+        wal = os.stat(wal_path)
+        state += [wal.st_mtime_ns, wal.st_size]
+    return identity, tuple(state)
+
+
+def prepare_frame(df):
+    """Parse dates and fix legacy values on freshly fetched rows"""
+    if 'visit_date' in df.columns:
+        df["visit_date"] = pd.to_datetime(df["visit_date"], errors='coerce', format='ISO8601')
+
+    # Fix old status values
+    if 'service_status' in df.columns:
+        df['service_status'] = df['service_status'].replace(LEGACY_STATUSES)
+
+    return compact_frame(df)
+
+
+def compact_frame(df):
+    """Shrink a prepared frame: categoricals, boolean paid, float32 amounts"""
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+
+    if 'paid' in df.columns:
+        df['paid'] = df['paid'].astype('boolean')
+
+    if 'amount' in df.columns and df['amount'].dtype == 'float64':
+        amount32 = df['amount'].astype('float32')
+        error = np.abs(amount32.astype('float64') - df['amount']).max()
+        if not error > AMOUNT_TOLERANCE:
+            df['amount'] = amount32
+
+    return df
+
+
+def merge_frames(parts):
+    """Concatenate compact frames without losing their compact dtypes"""
+    parts = [part for part in parts if not part.empty] or parts[:1]
+    if len(parts) == 1:
+        return parts[0]
+
+    # A chunk whose column is all NULL reads as object; give it the other chunks' dtype
+    for col in parts[0].columns:
+        typed = [part[col].dtype for part in parts if part[col].dtype != object]
+        if typed:
+            parts = [
+                part.assign(**{col: part[col].astype(typed[0])})
+                if part[col].dtype == object and part[col].isna().all() else part
+                for part in parts
+            ]
+
+    for col in CATEGORICAL_COLUMNS:
+        if col in parts[0].columns:
+            categories = pd.Index(list(dict.fromkeys(
+                value for part in parts for value in part[col].cat.categories
+            )))
+            parts = [part.assign(**{col: part[col].cat.set_categories(categories)}) for part in parts]
+
+    # A chunk with amounts float32 can't hold exactly keeps the whole frame float64
+    if 'amount' in parts[0].columns and len({str(part['amount'].dtype) for part in parts}) > 1:
+        parts = [part.assign(amount=part['amount'].astype('float64')) for part in parts]
+
+    return pd.concat(parts, ignore_index=True)
+
+
+def memory_report(df):
+    """Deep memory use of a frame, in total and per row and column"""
+    per_column = df.memory_usage(deep=True, index=False)
+    total = int(per_column.sum())
+    return {
+        'rows': len(df),
+        'bytes': total,
+        'bytes_per_row': round(total / len(df), 1) if len(df) else 0.0,
+        'columns': {col: int(size) for col, size in per_column.items()},
+    }
+
+
+class CustomerCache:
+    """Customers table kept in memory and refreshed from the database's change state
+
+    The frame is compact (see ``compact_frame``), omits ``LAZY_COLUMNS``
+    and is shared by every session, so callers must treat it as read-only.
+
+    A refresh costs one ``stat`` call while the database file is unchanged.
+    When it changes, rows above the cached high-water ``id`` are appended and
+    id ranges whose digest moved (edits, deletes) are refetched. The digests
+    are only recomputed when the customers ``records`` counter moved, so
+    appended rows alone never rescan the table. Only a new file or a schema
+    change triggers a full reload.
+    """
+
+    def __init__(self, db_path, table='customers'):
+        self.db_path = db_path
+        self.table = table
+        self.frame = None
+        self.last_refresh = None
+        self._lock = threading.Lock()
+        self._token = None
+        self._identity = None
+        self._schema_version = None
+        self._columns = []
+        self._hwm = 0
+        self._digests = {}
+        self._records = None
+
+    def refresh(self, conn):
+        """Return the cached frame, fetching only what changed since the last call"""
+        with self._lock:
+            identity, state = database_token(self.db_path)
+            if self.frame is not None and (identity, state) == (self._identity, self._token):
+                self.last_refresh = {'kind': 'cached', 'rows': 0}
+                return self.frame
+
+            # One read transaction, so the rows, digests and records counter
+            # all come from the same database snapshot
+            owned = not conn.in_transaction
+            if owned:
+                conn.execute("BEGIN")
+            try:
+                schema_version = conn.execute("PRAGMA schema_version").fetchone()[0]
+                if (self.frame is None or identity != self._identity
+                        or schema_version != self._schema_version):
+                    self._full_load(conn)
+                else:
+                    self._incremental_load(conn)
+            finally:
+                if owned:
+                    conn.rollback()
+
+            self._identity = identity
+            self._token = state
+            self._schema_version = schema_version
+            return self.frame
+
+    def invalidate(self):
+        """Force a full reload on the next refresh"""
+        with self._lock:
+            self.frame = None
+
+    def _digest(self, conn, low, high):
+        """Per-bucket (count, checksum) for rows with low <= id <= high"""
+        return table_digest(conn, self.table, self._columns, low, high)
+
+    def _records_version(self, conn):
+        # The change-tracking triggers only watch customers
+        return records_version(conn) if self.table == 'customers' else None
+
+    def _select(self):
+        """Column list for cached rows, leaving lazy columns in SQLite"""
+        return ', '.join(f'"{col}"' for col in self._columns if col not in LAZY_COLUMNS)
+
+    def _full_load(self, conn):
+        self._columns = [row[1] for row in conn.execute(f'PRAGMA table_info("{self.table}")')]
+        self._records = self._records_version(conn)
+        df = pd.read_sql_query(f'SELECT {self._select()} FROM "{self.table}" ORDER BY id DESC', conn)
+        self._hwm = int(df['id'].max()) if not df.empty else 0
+        self._digests = self._digest(conn, 0, self._hwm)
+        self.frame = prepare_frame(df)
+        self.last_refresh = {'kind': 'full', 'rows': len(df)}
+
+    def _incremental_load(self, conn):
+        records = self._records_version(conn)
+        if records is not None and records == self._records:
+            # Nothing edited, deleted or inserted below the mark: only new rows to append
+            digests, changed = dict(self._digests), []
+        else:
+            digests = self._digest(conn, 0, self._hwm)
+            changed = sorted(
+                bucket for bucket in set(digests) | set(self._digests)
+                if digests.get(bucket) != self._digests.get(bucket)
+            )
+        self._records = records
+
+        parts = []
+        new_rows = pd.read_sql_query(
+            f'SELECT {self._select()} FROM "{self.table}" WHERE id > ? ORDER BY id DESC',
+            conn, params=(self._hwm,)
+        )
+        if not new_rows.empty:
+            parts.append(prepare_frame(new_rows))
+
+        fetched = len(new_rows)
+        if changed:
+            for bucket in changed:
+                rows = pd.read_sql_query(
+                    f'SELECT {self._select()} FROM "{self.table}" WHERE id >= ? AND id < ? AND id <= ?',
+                    conn, params=(bucket * BUCKET_SIZE, (bucket + 1) * BUCKET_SIZE, self._hwm)
+                )
+                fetched += len(rows)
+                if not rows.empty:
+                    parts.append(prepare_frame(rows))
+            keep = ~(self.frame['id'] // BUCKET_SIZE).isin(changed)
+            parts.append(self.frame[keep])
+        else:
+            parts.append(self.frame)
+
+        merged = merge_frames(parts)
+        if changed:
+            merged = merged.sort_values('id', ascending=False, ignore_index=True)
+
+        if not new_rows.empty:
+            # Re-digest the buckets the new rows landed in
+            low = int(new_rows['id'].min()) // BUCKET_SIZE * BUCKET_SIZE
+            self._hwm = int(new_rows['id'].max())
+            digests.update(self._digest(conn, low, self._hwm))
+        self._digests = digests
+        self.frame = merged
+        self.last_refresh = {'kind': 'incremental', 'rows': fetched, 'buckets': len(changed)}
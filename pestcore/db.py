@@ -0,0 +1,128 @@
+"""Process-wide SQLite connection manager
+
+One manager per database file serves every Streamlit session:
+
+- the database runs in WAL mode so readers never wait on the writer
+- reads borrow a connection from a small pool
+- writes go through a single connection, serialized by a lock
+- the file, schema and table checks run once, in ``check()``
+"""
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from pestcore.migrations import migrate
+from pestcore.timing import TracedConnection
+
+READER_POOL_SIZE = 4
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KIB = 16 * 1024
+MMAP_SIZE = 256 * 1024 * 1024
+
+
+class DatabaseUnavailable(Exception):
+    """The database file or the customers table is missing"""
+
+
+class ConnectionManager:
+    """Pooled readers plus one serialized writer over a WAL database"""
+
+    def __init__(self, db_path, readers=READER_POOL_SIZE, table='customers'):
+        self.db_path = db_path
+        self.table = table
+        self._readers = queue.LifoQueue()
+        self._reader_slots = threading.BoundedSemaphore(readers)
+        self._writer = None
+        self._write_lock = threading.Lock()
+        self._checked = False
+        self._write_hooks = []
+
+    def _connect(self, readonly=False):
+        # Autocommit: transactions are opened explicitly, so idle readers
+        # never pin an old WAL snapshot
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None,
+                               factory=TracedConnection)
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KIB}")
+        conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+        if readonly:
+            conn.execute("PRAGMA query_only = ON")
+        else:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    def check(self):
+        """Verify the database once, apply migrations and switch it to WAL"""
+        if self._checked:
+            return self
+        if not os.path.exists(self.db_path):
+            raise DatabaseUnavailable(f"Database file not found: {self.db_path}")
+
+        with self._write_lock:
+            # Sessions starting together all get here; only the first migrates
+            if self._checked:
+                return self
+            if self._writer is None:
+                self._writer = self._connect()
+            migrate(self._writer)
+            found = self._writer.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name=?", (self.table,)
+            ).fetchone()
+            if not found:
+                raise DatabaseUnavailable(f"'{self.table}' table not found in database")
+            self._checked = True
+        return self
+
+    def add_write_hook(self, hook):
+        """Call ``hook(conn)`` at the end of every write, inside its transaction"""
+        if hook not in self._write_hooks:
+            self._write_hooks.append(hook)
+        return self
+
+    @contextmanager
+    def read(self):
+        """Borrow a pooled read-only connection"""
+        with self._reader_slots:
+            try:
+                conn = self._readers.get_nowait()
+            except queue.Empty:
+                conn = self._connect(readonly=True)
+            try:
+                yield conn
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+                self._readers.put(conn)
+
+    @contextmanager
+    def write(self):
+        """Run a block inside one serialized write transaction"""
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._connect()
+            conn = self._writer
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                for hook in self._write_hooks:
+                    hook(conn)
+            except BaseException:
+                conn.rollback()
+                raise
+            else:
+                conn.commit()
+
+    def close(self):
+        """Close every pooled connection"""
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
@@ -0,0 +1,216 @@
+"""Record edits with optimistic concurrency and scoped cache tokens
+
+Every customers row carries a ``version`` that each edit bumps along with
+``updated_at``. Edits name the version they were made against and are
+refused for rows changed since, instead of silently overwriting them.
+
+``cache_state`` keeps one counter per cache scope, bumped by triggers:
+
+- ``aggregates``: deletes and edits of columns the KPIs, charts and
+  rollups read
+- ``records``: any delete or edit
+
+``cache_token()`` pairs a scope's counter with the highest id, so inserts
+invalidate both scopes while, say, fixing a phone number leaves the cached
+aggregates alone. A row inserted below the highest id (a restored record)
+leaves that id alone, so it bumps both counters instead.
+"""
+from datetime import date, datetime
+
+from pestcore.data import SERVICE_STATUSES
+
+EDITABLE_COLUMNS = [
+    'name', 'phone', 'address', 'service', 'visit_date',
+    'amount', 'paid', 'payment_method', 'service_status',
+]
+
+# Columns read by the aggregates, charts and rollups
+AGGREGATE_COLUMNS = ['service', 'visit_date', 'amount', 'paid', 'payment_method', 'service_status']
+
+CACHE_SCOPES = ['aggregates', 'records']
+
+# Rows per bulk UPDATE statement, well under SQLite's bound-parameter limit
+BULK_STATEMENT_ROWS = 500
+
+# Rows per bulk write transaction: large enough to amortize the commit,
+# small enough not to hold the write lock for long
+BULK_BATCH_SIZE = 5000
+
+
+class RecordNotFound(LookupError):
+    """The record was deleted"""
+
+
+class StaleRecord(Exception):
+    """The record changed since the version an edit was made against"""
+
+    def __init__(self, record_id, expected, current):
+        super().__init__(f"Record {record_id} is at version {current}, not {expected}")
+        self.record_id = record_id
+        self.expected = expected
+        self.current = current
+
+
+def create_change_tracking(conn):
+    """Version columns, cache_state and the triggers that bump it"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(customers)")}
+    if 'version' not in columns:
+        conn.execute("ALTER TABLE customers ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+    if 'updated_at' not in columns:
+        conn.execute("ALTER TABLE customers ADD COLUMN updated_at TEXT")
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS cache_state (
+            scope TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.executemany("INSERT OR IGNORE INTO cache_state (scope) VALUES (?)", [(s,) for s in CACHE_SCOPES])
+
+    bump = "UPDATE cache_state SET version = version + 1 WHERE scope IN ({});"
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS cache_customers_delete AFTER DELETE ON customers
+        BEGIN {bump.format("'aggregates', 'records'")} END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS cache_customers_insert_below AFTER INSERT ON customers
+        WHEN new.id < (SELECT MAX(id) FROM customers)
+        BEGIN {bump.format("'aggregates', 'records'")} END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS cache_customers_update AFTER UPDATE ON customers
+        BEGIN {bump.format("'records'")} END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS cache_customers_update_aggregates
+        AFTER UPDATE OF {', '.join(AGGREGATE_COLUMNS)} ON customers
+        BEGIN {bump.format("'aggregates'")} END
+    ''')
+
+
+def cache_token(conn, scope):
+    """Token that changes whenever data cached under ``scope`` may have"""
+    top = conn.execute("SELECT MAX(id) FROM customers").fetchone()[0]
+    row = conn.execute("SELECT version FROM cache_state WHERE scope = ?", (scope,)).fetchone()
+    return top, row[0] if row else None
+
+
+def clean_changes(changes):
+    """Validated column -> value edits, stored the way the importer stores them"""
+    cleaned = {}
+    for col, value in changes.items():
+        if col not in EDITABLE_COLUMNS:
+            raise ValueError(f"Column {col!r} cannot be edited")
+        if col == 'paid':
+            value = int(bool(value))
+        elif col == 'amount':
+            value = float(value)
+            if value < 0:
+                raise ValueError(f"Negative amount {value}")
+        elif col == 'visit_date':
+            if isinstance(value, datetime):
+                value = value.date()
+            if not isinstance(value, date):
+                value = date.fromisoformat(str(value).strip()[:10])
+            value = value.isoformat()
+        elif col == 'service_status':
+            if value not in SERVICE_STATUSES:
+                raise ValueError(f"Unknown service_status {value!r}")
+        elif col == 'name':
+            value = (value or '').strip()
+            if not value:
+                raise ValueError("Name cannot be empty")
+        elif value is not None:
+            value = str(value).strip() or None
+        cleaned[col] = value
+    if not cleaned:
+        raise ValueError("No changes given")
+    return cleaned
+
+
+def _set_clause(changes):
+    assignments = [f'"{col}" = ?' for col in changes]
+    return ', '.join(assignments + ['version = version + 1', 'updated_at = ?'])
+
+
+def _now():
+    return datetime.now().isoformat(timespec='seconds')
+
+
+def _apply_edit(conn, record_id, expected_version, changes, now):
+    """One versioned UPDATE on an open write transaction; returns the new version"""
+    row = conn.execute(
+        f"UPDATE customers SET {_set_clause(changes)} WHERE id = ? AND version = ? RETURNING version",
+        list(changes.values()) + [now, int(record_id), int(expected_version)],
+    ).fetchone()
+    if row is not None:
+        return row[0]
+    current = conn.execute("SELECT version FROM customers WHERE id = ?", (int(record_id),)).fetchone()
+    if current is None:
+        raise RecordNotFound(f"Record {record_id} no longer exists")
+    raise StaleRecord(record_id, expected_version, current[0])
+
+
+def update_record(manager, record_id, expected_version, changes):
+    """Apply ``changes`` to one record if it is still at ``expected_version``
+
+    Returns the record's new version; raises StaleRecord or RecordNotFound.
+    """
+    changes = clean_changes(changes)
+    with manager.write() as conn:
+        return _apply_edit(conn, record_id, expected_version, changes, _now())
+
+
+def update_records(manager, edits):
+    """Apply per-record edits ``(id, expected_version, changes)`` all or nothing
+
+    Any stale or deleted record rolls the whole batch back.
+    Returns {id: new version}.
+    """
+    edits = [(record_id, version, clean_changes(changes)) for record_id, version, changes in edits]
+    now = _now()
+    with manager.write() as conn:
+        return {
+            int(record_id): _apply_edit(conn, record_id, version, changes, now)
+            for record_id, version, changes in edits
+        }
+
+
+def bulk_update(manager, rows, changes, batch_size=BULK_BATCH_SIZE):
+    """Apply the same ``changes`` to many ``(id, expected_version)`` rows
+
+    Each ``batch_size`` rows share one write transaction, updated
+    ``BULK_STATEMENT_ROWS`` per statement, so a large update never holds
+    the write lock for long. Rows changed or deleted since their version
+    was read are skipped and reported rather than failing the batch.
+
+    Returns {'updated': [ids], 'conflicts': [ids]}.
+    """
+    changes = clean_changes(changes)
+    rows = [(int(record_id), int(version)) for record_id, version in rows]
+    now = _now()
+    result = {'updated': [], 'conflicts': []}
+
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        updated = set()
+        with manager.write() as conn:
+            for offset in range(0, len(batch), BULK_STATEMENT_ROWS):
+                chunk = batch[offset:offset + BULK_STATEMENT_ROWS]
+                wanted = ', '.join('(?, ?)' for _ in chunk)
+                params = [value for row in chunk for value in row] + list(changes.values()) + [now]
+                updated.update(row[0] for row in conn.execute(f'''
+                    WITH wanted (id, version) AS (VALUES {wanted})
+                    UPDATE customers SET {_set_clause(changes)}
+                    WHERE (id, version) IN (SELECT id, version FROM wanted)
+                    RETURNING id
+                ''', params))
+        result['updated'] += [record_id for record_id, _ in batch if record_id in updated]
+        result['conflicts'] += [record_id for record_id, _ in batch if record_id not in updated]
+    return result
+
+
+def matching_versions(conn, filters=('1', [])):
+    """(id, version) of every record matching record browser filters"""
+    where, params = filters
+    return conn.execute(f"SELECT id, version FROM customers WHERE {where} ORDER BY id", params).fetchall()
@@ -0,0 +1,152 @@
+"""Streaming exports of the customers table to CSV, gzip CSV or Parquet
+
+Rows are read from SQLite in chunks and written straight to the output
+file, so memory stays bounded by ``chunk_size`` whatever the table size.
+
+    python -m pestcore.export --db pestcontrol.db --format csv.gz --out backups/
+"""
+import argparse
+import csv
+import gzip
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+from pestcore.records import build_filters
+
+CHUNK_SIZE = 50_000
+
+FORMATS = {
+    'csv': ('.csv', 'text/csv'),
+    'csv.gz': ('.csv.gz', 'application/gzip'),
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+}
+
+
+def backup_filename(fmt, when=None):
+    """Default file name for a dated backup in the given format"""
+    when = when or datetime.now()
+    return f'pest_control_backup_{when.strftime("%Y%m%d")}{FORMATS[fmt][0]}'
+
+
+def _iter_chunks(cursor, chunk_size):
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield rows
+
+
+def _write_csv(handle, columns, chunks):
+    writer = csv.writer(handle)
+    writer.writerow(columns)
+    count = 0
+    for rows in chunks:
+        writer.writerows(rows)
+        count += len(rows)
+    return count
+
+
+def _pyarrow():
+    """pyarrow and pyarrow.parquet, imported only for Parquet exports"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+    return pyarrow, pyarrow.parquet
+
+
+def _parquet_schema(conn, table, columns):
+    pa, _ = _pyarrow()
+    declared = {row[1]: (row[2] or '').upper() for row in conn.execute(f'PRAGMA table_info("{table}")')}
+    types = {'INTEGER': pa.int64(), 'REAL': pa.float64()}
+    return pa.schema([(col, types.get(declared.get(col), pa.string())) for col in columns])
+
+
+def _write_parquet(path, schema, chunks):
+    pa, pq = _pyarrow()
+    count = 0
+    with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+        for rows in chunks:
+            columns = list(zip(*rows))
+            arrays = [pa.array(values, type=field.type) for values, field in zip(columns, schema)]
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            count += len(rows)
+    return count
+
+
+def export_records(conn, path, fmt='csv', filters=('1', []), chunk_size=CHUNK_SIZE, table='customers'):
+    """Stream matching rows to ``path`` and return how many were written
+
+    The file is written under a temporary name and moved into place at the
+    end, so a failed export never leaves a truncated backup behind.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+    where, params = filters
+    cursor = conn.execute(f'SELECT * FROM "{table}" WHERE {where} ORDER BY id', params)
+    columns = [description[0] for description in cursor.description]
+    chunks = _iter_chunks(cursor, chunk_size)
+
+    partial = path + '.part'
+    try:
+        if fmt == 'parquet':
+            count = _write_parquet(partial, _parquet_schema(conn, table, columns), chunks)
+        elif fmt == 'csv.gz':
+            with gzip.open(partial, 'wt', newline='', encoding='utf-8') as handle:
+                count = _write_csv(handle, columns, chunks)
+        else:
+            with open(partial, 'w', newline='', encoding='utf-8') as handle:
+                count = _write_csv(handle, columns, chunks)
+        os.replace(partial, path)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    finally:
+        cursor.close()
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pestcore.export', description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default='pestcontrol.db')
+    parser.add_argument('--format', choices=sorted(FORMATS), default='csv.gz')
+    parser.add_argument('--out', default='.', help='output file, or directory for a dated backup name')
+    parser.add_argument('--search', help='free-text search over name, phone and address')
+    parser.add_argument('--status', action='append', help='service status (repeatable)')
+    parser.add_argument('--service', action='append', help='service type (repeatable)')
+    parser.add_argument('--paid', choices=['yes', 'no'])
+    parser.add_argument('--from', dest='date_from', help='first visit date, YYYY-MM-DD')
+    parser.add_argument('--to', dest='date_to', help='last visit date, YYYY-MM-DD')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    out = args.out
+    if os.path.isdir(out):
+        out = os.path.join(out, backup_filename(args.format))
+
+    filters = build_filters(
+        search=args.search,
+        statuses=args.status,
+        services=args.service,
+        paid=None if args.paid is None else args.paid == 'yes',
+        date_from=args.date_from,
+        date_to=args.date_to,
+    )
+
+    conn = sqlite3.connect(args.db)
+    try:
+        started = datetime.now()
+        count = export_records(conn, out, args.format, filters, args.chunk_size)
+        elapsed = (datetime.now() - started).total_seconds()
+    finally:
+        conn.close()
+    print(f"Exported {count:,} rows to {out} in {elapsed:.1f}s")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
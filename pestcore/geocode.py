@@ -0,0 +1,143 @@
+"""Offline geocoding of customer addresses through a local gazetteer
+
+``gazetteer`` holds known places: localities and cities by name and,
+when loaded from a fuller file, postcodes. The bundled ``gazetteer.csv``
+covers Pune localities with approximate centre coordinates; load a more
+detailed file with ``python -m pestcore.routes load-gazetteer``.
+
+``geocodes`` caches the result for every address looked up, misses
+included, so each distinct address is resolved once. Loading a gazetteer
+clears the cached misses so they are tried again.
+
+An address resolves to the most specific gazetteer entry it mentions: a
+postcode, else the longest locality name, else a city.
+"""
+import csv
+import os
+import re
+from datetime import datetime
+
+import pandas as pd
+
+BUNDLED_GAZETTEER = os.path.join(os.path.dirname(__file__), 'gazetteer.csv')
+
+# Entry kinds, most specific first
+KINDS = ['postcode', 'locality', 'city']
+
+# Longest place name matched, in words
+MAX_NAME_WORDS = 4
+
+POSTCODE = re.compile(r'\b[1-9]\d{5}\b')
+
+
+def normalize_address(address):
+    """Cache key of an address: lower-case words separated by single spaces"""
+    return ' '.join(re.findall(r'[a-z0-9]+', (address or '').lower()))
+
+
+def create_geocoding(conn):
+    """Gazetteer and geocode cache tables, seeded with the bundled gazetteer"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS gazetteer (
+            name TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            lat REAL NOT NULL,
+            lon REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS geocodes (
+            address_key TEXT PRIMARY KEY,
+            lat REAL,
+            lon REAL,
+            source TEXT,
+            resolved_at TEXT NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    load_gazetteer(conn, BUNDLED_GAZETTEER)
+
+
+def load_gazetteer(conn, path, replace=False):
+    """Add (or with ``replace``, swap in) gazetteer entries from a CSV file
+
+    Columns: name, kind, lat, lon. Must run inside a write transaction.
+    Returns the number of entries loaded.
+    """
+    with open(path, newline='', encoding='utf-8') as handle:
+        entries = []
+        for row in csv.DictReader(handle):
+            kind = row['kind'].strip().lower()
+            if kind not in KINDS:
+                raise ValueError(f"Unknown gazetteer kind {row['kind']!r} for {row['name']!r}")
+            name = row['name'] if kind == 'postcode' else normalize_address(row['name'])
+            entries.append((name.strip(), kind, float(row['lat']), float(row['lon'])))
+    if replace:
+        conn.execute("DELETE FROM gazetteer")
+    conn.executemany("INSERT OR REPLACE INTO gazetteer (name, kind, lat, lon) VALUES (?, ?, ?, ?)", entries)
+    # Earlier misses may resolve now
+    conn.execute("DELETE FROM geocodes WHERE lat IS NULL")
+    return len(entries)
+
+
+def read_gazetteer(conn):
+    """{kind: {name: (lat, lon)}} of every gazetteer entry"""
+    places = {kind: {} for kind in KINDS}
+    for name, kind, lat, lon in conn.execute("SELECT name, kind, lat, lon FROM gazetteer"):
+        places[kind][name] = (lat, lon)
+    return places
+
+
+def resolve(address_key, places):
+    """(lat, lon, source) for a normalized address, or (None, None, None)"""
+    for code in reversed(POSTCODE.findall(address_key)):
+        if code in places['postcode']:
+            return (*places['postcode'][code], f'postcode:{code}')
+
+    words = address_key.split()
+    for kind in ['locality', 'city']:
+        names = places[kind]
+        if not names:
+            continue
+        # Longest name first; on a tie the one nearer the end of the address
+        for size in range(min(MAX_NAME_WORDS, len(words)), 0, -1):
+            for start in range(len(words) - size, -1, -1):
+                name = ' '.join(words[start:start + size])
+                if name in names:
+                    return (*names[name], f'{kind}:{name}')
+    return None, None, None
+
+
+def geocode(conn, addresses):
+    """Coordinates for addresses, resolving and caching any not seen before
+
+    Must run inside a write transaction. Returns a DataFrame with columns
+    address, lat, lon, source in input order; unresolved addresses have
+    null coordinates.
+    """
+    keys = [normalize_address(address) for address in addresses]
+    found = {}
+    unique = list(dict.fromkeys(keys))
+    for start in range(0, len(unique), 500):
+        chunk = unique[start:start + 500]
+        found.update(
+            (key, (lat, lon, source)) for key, lat, lon, source in conn.execute(
+                f"SELECT address_key, lat, lon, source FROM geocodes "
+                f"WHERE address_key IN ({', '.join('?' for _ in chunk)})", chunk
+            )
+        )
+
+    missing = [key for key in unique if key not in found]
+    if missing:
+        places = read_gazetteer(conn)
+        now = datetime.now().isoformat(timespec='seconds')
+        resolved = [(key, *resolve(key, places)) for key in missing]
+        conn.executemany(
+            "INSERT OR REPLACE INTO geocodes (address_key, lat, lon, source, resolved_at) VALUES (?, ?, ?, ?, ?)",
+            [row + (now,) for row in resolved],
+        )
+        found.update((key, (lat, lon, source)) for key, lat, lon, source in resolved)
+
+    return pd.DataFrame(
+        [(address, *found[key]) for address, key in zip(addresses, keys)],
+        columns=['address', 'lat', 'lon', 'source'],
+    )
@@ -0,0 +1,299 @@
+"""Customer identity resolution and repeat-customer analytics
+
+Every visit is its own customers row, so one household booking four times
+is four rows. Identity resolution groups rows into customer entities:
+
+- each row gets blocking keys: its phone number (last 10 digits, any
+  extension dropped) and its name together with its address
+- rows sharing any key belong to the same entity, transitively
+
+Keys are joined by hash lookups, never by comparing rows pairwise:
+connected components are found by label propagation, where every row and
+key repeatedly takes the smallest entity label among its neighbours, one
+vectorized pass per step. Keys shared by more than ``MAX_KEY_ROWS``
+rows (an office number, "N/A") identify nobody and stop linking rows once
+they pass the limit; a rebuild also unlinks the rows they joined before.
+
+``customer_entities`` maps each row to its entity (the smallest row id in
+it) and ``identity_keys`` maps each key to its entity, so
+``resolve_identities()`` only has to place rows added since the last run,
+merging entities a new row links. Edited names or phones are picked up
+by a rebuild.
+"""
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+# Keys shared by more rows than this are too common to identify anyone
+MAX_KEY_ROWS = 200
+
+# Fewest phone digits treated as a real number
+MIN_PHONE_DIGITS = 7
+
+# Words dropped from names before comparing them
+NAME_TITLES = {'mr', 'mrs', 'ms', 'miss', 'dr', 'shri', 'shree', 'sri', 'smt', 'kumari', 'prof'}
+
+# Visits that do not count towards repeat or lifetime value figures
+NOT_VISIT_STATUSES = ['Cancelled']
+
+# A customer with no visit in this many days has churned
+CHURN_DAYS = 365
+
+RESOLVE_BATCH_SIZE = 200_000
+
+NAME_WORDS = re.compile(r'[a-z]+')
+
+
+def create_identity_tables(conn):
+    """Entity mapping, key index and high-water mark tables"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS customer_entities (
+            customer_id INTEGER PRIMARY KEY,
+            entity_id INTEGER NOT NULL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_customer_entities_entity ON customer_entities (entity_id)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS identity_keys (
+            key TEXT PRIMARY KEY,
+            entity_id INTEGER NOT NULL,
+            rows INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_identity_keys_entity ON identity_keys (entity_id)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS identity_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            hwm INTEGER NOT NULL
+        )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO identity_state (id, hwm) VALUES (1, 0)")
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS identity_customers_delete AFTER DELETE ON customers
+        BEGIN DELETE FROM customer_entities WHERE customer_id = old.id; END
+    ''')
+
+
+def normalize_phone_key(phones):
+    """Last 10 digits of each phone, extensions dropped; None when too short"""
+    digits = (
+        phones.fillna('').astype(str)
+        .str.lower().str.split(r'x|ext', n=1, regex=True).str[0]
+        .str.replace(r'\D', '', regex=True).str[-10:]
+    )
+    # All one digit (0000000000) is a placeholder, not a number
+    junk = (digits.str.len() < MIN_PHONE_DIGITS) | digits.str.fullmatch(r'(\d)\1*')
+    return digits.mask(junk.fillna(True), None)
+
+
+def _name_key(name):
+    if not name.isascii():
+        name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
+    words = [word for word in NAME_WORDS.findall(name.lower()) if word not in NAME_TITLES]
+    return ' '.join(sorted(words)) or None
+
+
+def normalize_name_key(names):
+    """Lower-case ASCII name words without titles, in sorted order"""
+    return names.fillna('').astype(str).map(_name_key)
+
+
+def normalize_address_key(addresses):
+    """Lower-case address words separated by single spaces"""
+    return (
+        addresses.fillna('').astype(str).str.lower()
+        .str.findall(r'[a-z0-9]+').str.join(' ')
+        .replace('', None)
+    )
+
+
+def _per_unique(values, normalize):
+    """``normalize`` applied once per distinct value; names and phones repeat"""
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    return pd.Series(normalize(pd.Series(uniques, dtype=object)).to_numpy(dtype=object)[codes], index=values.index)
+
+
+def blocking_keys(rows):
+    """(row id, key) pairs for a frame with id, name, phone and address"""
+    phone = 'p:' + _per_unique(rows['phone'], normalize_phone_key)
+    name = _per_unique(rows['name'], normalize_name_key)
+    address = _per_unique(rows['address'], normalize_address_key)
+    name_address = 'n:' + name + '|' + address
+    keys = pd.concat([
+        pd.DataFrame({'row': rows['id'].to_numpy(), 'key': phone.to_numpy()}),
+        pd.DataFrame({'row': rows['id'].to_numpy(), 'key': name_address.to_numpy()}),
+    ], ignore_index=True)
+    return keys.dropna(ignore_index=True)
+
+
+def propagate_labels(keys, seeds=None):
+    """Entity label per row: smallest label reachable through shared keys
+
+    ``keys`` has columns row and key; ``seeds`` optionally maps keys to
+    labels they already carry. Returns (row labels, key labels) as Series.
+    """
+    row_codes, rows = pd.factorize(keys['row'])
+    key_codes, key_names = pd.factorize(keys['key'])
+    row_label = rows.to_numpy(dtype='int64')
+    seed_label = np.full(len(key_names), np.iinfo('int64').max)
+    if seeds is not None and len(seeds):
+        positions = key_names.get_indexer(seeds.index)
+        found = positions >= 0
+        seed_label[positions[found]] = seeds.to_numpy(dtype='int64')[found]
+
+    while True:
+        key_label = seed_label.copy()
+        np.minimum.at(key_label, key_codes, row_label[row_codes])
+        new_label = row_label.copy()
+        np.minimum.at(new_label, row_codes, key_label[key_codes])
+        if np.array_equal(new_label, row_label):
+            return pd.Series(row_label, index=rows), pd.Series(key_label, index=key_names)
+        row_label = new_label
+
+
+def _known_keys(conn, keys):
+    """(entity, rows so far) of each key already in identity_keys"""
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS identity_lookup (key TEXT PRIMARY KEY) WITHOUT ROWID")
+    conn.execute("DELETE FROM identity_lookup")
+    conn.executemany("INSERT OR IGNORE INTO identity_lookup (key) VALUES (?)", ((key,) for key in keys))
+    # IN keeps the lookup on identity_keys' primary key
+    known = pd.read_sql_query('''
+        SELECT key, entity_id, rows FROM identity_keys WHERE key IN (SELECT key FROM temp.identity_lookup)
+    ''', conn, index_col='key')
+    conn.execute("DELETE FROM identity_lookup")
+    return known
+
+
+def resolve_identities(conn, rebuild=False, batch_size=RESOLVE_BATCH_SIZE, max_batches=None):
+    """Map rows added since the last run (or with ``rebuild``, every row) to entities
+
+    Must run inside a write transaction. Works through new rows in id order,
+    ``batch_size`` at a time, stopping after ``max_batches`` if given.
+    Returns counts of rows placed, existing entities merged into others
+    and batches run.
+    """
+    if rebuild:
+        for table in ['customer_entities', 'identity_keys']:
+            conn.execute(f"DELETE FROM {table}")
+        conn.execute("UPDATE identity_state SET hwm = 0 WHERE id = 1")
+        # Resolve everything as one batch so key counts see every row
+        batch_size = None
+    hwm = conn.execute("SELECT hwm FROM identity_state WHERE id = 1").fetchone()[0]
+    stats = {'rows': 0, 'merged': 0, 'batches': 0}
+
+    while True:
+        rows = pd.read_sql_query(
+            "SELECT id, name, phone, address FROM customers WHERE id > ? ORDER BY id"
+            + (" LIMIT ?" if batch_size else ""),
+            conn, params=(hwm, batch_size) if batch_size else (hwm,),
+        )
+        if rows.empty:
+            break
+        keys = blocking_keys(rows)
+        counts = keys['key'].value_counts()
+        known = _known_keys(conn, counts.index) if hwm else pd.DataFrame(columns=['entity_id', 'rows'])
+        counts = counts.add(known['rows'], fill_value=0).astype('int64')
+        keys = keys[keys['key'].map(counts) <= MAX_KEY_ROWS]
+        seeds = known.loc[known.index.isin(keys['key']), 'entity_id'].astype('int64')
+
+        row_label, key_label = propagate_labels(keys, seeds)
+        labels = row_label.reindex(rows['id']).fillna(pd.Series(rows['id'].to_numpy(), index=rows['id']))
+
+        # A new row linking two known entities folds the larger id into the smaller
+        merges = pd.DataFrame({'old': seeds, 'new': key_label.reindex(seeds.index)})
+        merges = merges[merges['old'] != merges['new']].drop_duplicates()
+        for old, new in merges.itertuples(index=False):
+            conn.execute("UPDATE customer_entities SET entity_id = ? WHERE entity_id = ?", (int(new), int(old)))
+            conn.execute("UPDATE identity_keys SET entity_id = ? WHERE entity_id = ?", (int(new), int(old)))
+        stats['merged'] += merges['old'].nunique()
+
+        conn.executemany(
+            "INSERT OR REPLACE INTO customer_entities (customer_id, entity_id) VALUES (?, ?)",
+            zip(labels.index.astype(int).tolist(), labels.astype(int).tolist()),
+        )
+        # Sorted, so the key B-tree is appended to rather than split at random
+        key_label = key_label.sort_index()
+        conn.executemany(
+            "INSERT OR REPLACE INTO identity_keys (key, entity_id, rows) VALUES (?, ?, ?)",
+            zip(key_label.index.tolist(), key_label.astype(int).tolist(), counts.reindex(key_label.index).tolist()),
+        )
+        # Keys past the limit only keep their count, so they stay unlinked
+        common = counts[counts > MAX_KEY_ROWS]
+        conn.executemany(
+            "INSERT INTO identity_keys (key, entity_id, rows) VALUES (?, 0, ?) "
+            "ON CONFLICT (key) DO UPDATE SET rows = excluded.rows",
+            zip(common.index.tolist(), common.tolist()),
+        )
+        hwm = int(rows['id'].max())
+        conn.execute("UPDATE identity_state SET hwm = ? WHERE id = 1", (hwm,))
+        stats['rows'] += len(rows)
+        stats['batches'] += 1
+        if not batch_size or len(rows) < batch_size or stats['batches'] == max_batches:
+            break
+    return stats
+
+
+def _entity_select(today):
+    """Per-entity visits, revenue and first/last visit dates
+
+    Rows not resolved yet count as customers of their own.
+    """
+    statuses = ', '.join(f"'{status}'" for status in NOT_VISIT_STATUSES)
+    return f'''
+        SELECT coalesce(e.entity_id, c.id) AS entity,
+               COUNT(*) AS visits,
+               TOTAL(c.amount) AS billed,
+               TOTAL(CASE WHEN c.paid = 1 THEN c.amount END) AS paid,
+               MIN(c.visit_date) AS first_visit,
+               MAX(CASE WHEN c.visit_date <= '{today}' THEN c.visit_date END) AS last_visit
+        FROM customers AS c LEFT JOIN customer_entities AS e ON e.customer_id = c.id
+        WHERE coalesce(c.service_status, '') NOT IN ({statuses})
+        GROUP BY entity
+    '''
+
+
+def customer_metrics(conn, today, churn_days=CHURN_DAYS):
+    """Unique customers, repeat rate, lifetime value and churn, in one grouped pass
+
+    Churn counts customers whose first visit is more than ``churn_days``
+    ago and who have had no visit since ``today - churn_days``.
+    """
+    today = pd.Timestamp(today)
+    cutoff = (today - pd.Timedelta(days=churn_days)).strftime('%Y-%m-%d')
+    row = conn.execute(f'''
+        SELECT COUNT(*),
+               COUNT(CASE WHEN visits > 1 THEN 1 END),
+               TOTAL(billed),
+               TOTAL(paid),
+               TOTAL(visits),
+               COUNT(CASE WHEN first_visit < ? THEN 1 END),
+               COUNT(CASE WHEN first_visit < ? AND coalesce(last_visit, first_visit) < ? THEN 1 END)
+        FROM ({_entity_select(today.strftime('%Y-%m-%d'))})
+    ''', (cutoff, cutoff, cutoff)).fetchone()
+    customers, repeat, billed, paid, visits, eligible, churned = row
+    return {
+        'customers': customers,
+        'repeat_customers': repeat,
+        'repeat_rate': repeat / customers * 100 if customers else 0.0,
+        'visits_per_customer': visits / customers if customers else 0.0,
+        'avg_lifetime_value': round(billed / customers, 2) if customers else 0.0,
+        'avg_lifetime_paid': round(paid / customers, 2) if customers else 0.0,
+        'churn_rate': churned / eligible * 100 if eligible else 0.0,
+        'churned_customers': churned,
+    }
+
+
+def top_customers(conn, today, limit=20):
+    """Highest lifetime value customers with their latest name and phone"""
+    return pd.read_sql_query(f'''
+        SELECT c.name, c.phone, t.visits, round(t.billed, 2) AS lifetime_value,
+               round(t.paid, 2) AS paid, t.first_visit, t.last_visit
+        FROM ({_entity_select(pd.Timestamp(today).strftime('%Y-%m-%d'))}) AS t
+        JOIN customers AS c ON c.id = coalesce(
+            (SELECT max(customer_id) FROM customer_entities WHERE entity_id = t.entity), t.entity
+        )
+        ORDER BY t.billed DESC
+        LIMIT ?
+    ''', conn, params=(int(limit),))
@@ -0,0 +1,275 @@
+"""Bulk import of service records from CSV or JSONL
+
+Rows are streamed from the source, validated and normalized one at a
+time, and inserted with ``executemany`` in large write transactions.
+Rejected rows are reported with their line number and reason instead of
+aborting the import.
+
+    python -m pestcore.importer jobs.csv --db pestcontrol.db --rejects rejects.csv
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+import time
+from contextlib import nullcontext
+from datetime import date, datetime
+
+from pestcore.data import LEGACY_STATUSES, SERVICE_STATUSES
+from pestcore.db import ConnectionManager
+from pestcore.receivables import refresh_receivables
+from pestcore.rollups import refresh_rollups
+from pestcore.search import bulk_insert
+
+BATCH_SIZE = 50_000
+
+IMPORT_COLUMNS = [
+    'name', 'phone', 'address', 'service', 'visit_date',
+    'amount', 'paid', 'payment_method', 'service_status',
+]
+
+INSERT_SQL = f'''
+    INSERT INTO customers ({', '.join(IMPORT_COLUMNS)})
+    VALUES ({', '.join('?' for _ in IMPORT_COLUMNS)})
+'''
+
+# Non-ISO date layouts accepted in source files, day first as written in India
+DATE_FORMATS = ['%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y', '%Y/%m/%d', '%d/%m/%y']
+
+PAID_VALUES = {
+    '1': 1, 'true': 1, 'yes': 1, 'y': 1, 'paid': 1,
+    '0': 0, 'false': 0, 'no': 0, 'n': 0, 'unpaid': 0, '': 0,
+}
+
+STATUS_VALUES = {status.lower(): status for status in SERVICE_STATUSES}
+STATUS_VALUES.update({old.lower(): new for old, new in LEGACY_STATUSES.items()})
+
+
+class RejectedRow(ValueError):
+    """A source row that failed validation"""
+
+
+def _text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def normalize_date(value):
+    """Visit date as ISO YYYY-MM-DD"""
+    if isinstance(value, (date, datetime)):
+        return value.strftime('%Y-%m-%d')
+    text = _text(value)
+    if text is None:
+        raise RejectedRow("missing visit_date")
+    try:
+        # Fast paths for ISO and DD/MM/YYYY, which cover almost every row
+        if len(text) == 10 and text[2] == text[5] and text[2] in '/-.':
+            return date(int(text[6:]), int(text[3:5]), int(text[:2])).isoformat()
+        return date.fromisoformat(text[:10]).isoformat()
+    except ValueError:
+        pass
+    for layout in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, layout).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    raise RejectedRow(f"unrecognised visit_date {text!r}")
+
+
+def normalize_row(raw):
+    """Validated insert tuple for one source row, or RejectedRow"""
+    name = _text(raw.get('name'))
+    if name is None:
+        raise RejectedRow("missing name")
+
+    amount = _text(raw.get('amount'))
+    try:
+        amount = float(amount.replace(',', '')) if amount is not None else 0.0
+    except ValueError:
+        raise RejectedRow(f"invalid amount {amount!r}")
+    if amount < 0:
+        raise RejectedRow(f"negative amount {amount}")
+
+    paid = raw.get('paid')
+    paid = PAID_VALUES.get(str(paid).strip().lower() if paid is not None else '')
+    if paid is None:
+        raise RejectedRow(f"invalid paid {raw.get('paid')!r}")
+
+    status = _text(raw.get('service_status'))
+    if status is not None:
+        status = STATUS_VALUES.get(status.lower())
+        if status is None:
+            raise RejectedRow(f"unknown service_status {raw.get('service_status')!r}")
+
+    return (
+        name,
+        _text(raw.get('phone')),
+        _text(raw.get('address')),
+        _text(raw.get('service')),
+        normalize_date(raw.get('visit_date')),
+        amount,
+        paid,
+        _text(raw.get('payment_method')),
+        status,
+    )
+
+
+def open_source(path):
+    """Text stream for a CSV/JSONL file, transparently gunzipped"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8', newline='')
+
+
+def source_format(name):
+    """'csv' or 'jsonl' from a file name"""
+    base = name[:-3] if name.endswith('.gz') else name
+    if base.endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    return 'csv'
+
+
+def read_rows(handle, fmt):
+    """Yield (line_number, row dict) from a CSV or JSONL text stream"""
+    if fmt == 'jsonl':
+        for line_number, line in enumerate(handle, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                row = {'__error__': f"invalid JSON: {e.msg}", '__raw__': line.rstrip('\n')}
+            yield line_number, row
+    else:
+        reader = csv.reader(handle)
+        header = [column.strip() for column in next(reader, [])]
+        for row in reader:
+            yield reader.line_num, dict(zip(header, row))
+
+
+def _insert_batches(conn_for_batch, rows, batch_size, reject_writer, stats):
+    """Normalize ``rows`` and insert them batch by batch"""
+    batch = []
+
+    def flush():
+        with conn_for_batch() as conn, bulk_insert(conn):
+            conn.executemany(INSERT_SQL, batch)
+        stats['inserted'] += len(batch)
+        batch.clear()
+
+    for line_number, raw in rows:
+        stats['read'] += 1
+        try:
+            if '__error__' in raw:
+                raise RejectedRow(raw['__error__'])
+            batch.append(normalize_row(raw))
+        except RejectedRow as e:
+            stats['rejected'] += 1
+            if reject_writer is not None:
+                source = raw.get('__raw__') if '__error__' in raw else json.dumps(raw, default=str)
+                reject_writer.writerow([line_number, str(e), source])
+            continue
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+
+def import_records(manager, rows, batch_size=BATCH_SIZE, reject_writer=None, rebuild_indexes=False):
+    """Insert normalized rows in batched write transactions
+
+    ``manager`` is a ConnectionManager; ``rows`` yields (line_number, dict).
+    Rejects go to ``reject_writer`` (a csv.writer) when given. Returns
+    counts and throughput.
+
+    With ``rebuild_indexes`` the whole import is one transaction that drops
+    the secondary indexes, inserts, and rebuilds them by sorting, which is
+    several times faster for very large loads but holds the write lock for
+    the duration.
+    """
+    started = time.perf_counter()
+    stats = {'read': 0, 'inserted': 0, 'rejected': 0}
+
+    if rebuild_indexes:
+        with manager.write() as conn:
+            indexes = conn.execute(
+                "SELECT name, sql FROM sqlite_master "
+                "WHERE type = 'index' AND tbl_name = 'customers' AND sql IS NOT NULL"
+            ).fetchall()
+            for name, _ in indexes:
+                conn.execute(f'DROP INDEX "{name}"')
+            _insert_batches(lambda: nullcontext(conn), rows, batch_size, reject_writer, stats)
+            for _, sql in indexes:
+                conn.execute(sql)
+    else:
+        _insert_batches(manager.write, rows, batch_size, reject_writer, stats)
+
+    stats['seconds'] = round(time.perf_counter() - started, 3)
+    stats['rows_per_sec'] = round(stats['read'] / stats['seconds']) if stats['seconds'] else stats['read']
+    return stats
+
+
+def reject_log(handle):
+    """csv.writer for a reject log with its header written"""
+    writer = csv.writer(handle)
+    writer.writerow(['line', 'reason', 'row'])
+    return writer
+
+
+def import_file(manager, path, fmt=None, batch_size=BATCH_SIZE, rejects_path=None, rebuild_indexes=False):
+    """Import a CSV/JSONL file (optionally .gz) and return the import stats"""
+    fmt = fmt or source_format(path)
+    rejects = open(rejects_path, 'w', newline='', encoding='utf-8') if rejects_path else None
+    try:
+        with open_source(path) as handle:
+            return import_records(manager, read_rows(handle, fmt), batch_size,
+                                  reject_log(rejects) if rejects else None, rebuild_indexes)
+    finally:
+        if rejects:
+            rejects.close()
+
+
+def import_upload(manager, data, name, batch_size=BATCH_SIZE):
+    """Import an uploaded file's bytes; returns (stats, reject log CSV text)"""
+    if name.endswith('.gz'):
+        data = gzip.decompress(data)
+    handle = io.StringIO(data.decode('utf-8-sig'), newline='')
+    rejects = io.StringIO()
+    stats = import_records(manager, read_rows(handle, source_format(name)), batch_size, reject_log(rejects))
+    return stats, rejects.getvalue()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pestcore.importer', description=__doc__.splitlines()[0])
+    parser.add_argument('source', help='CSV or JSONL file, optionally gzipped')
+    parser.add_argument('--db', default='pestcontrol.db')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help='default: from the file extension')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--rejects', help='write rejected rows to this CSV file')
+    parser.add_argument('--rebuild-indexes', action='store_true',
+                        help='one transaction with indexes rebuilt at the end (fastest for large loads)')
+    parser.add_argument('--create', action='store_true', help='create the database if it does not exist')
+    args = parser.parse_args(argv)
+
+    if args.create and not os.path.exists(args.db):
+        open(args.db, 'a').close()
+
+    # Fold each batch into the rollups and receivables as it commits, as the page's writes do
+    manager = ConnectionManager(args.db).check().add_write_hook(refresh_rollups).add_write_hook(refresh_receivables)
+    try:
+        stats = import_file(manager, args.source, args.format, args.batch_size, args.rejects,
+                            args.rebuild_indexes)
+    finally:
+        manager.close()
+    print(f"Read {stats['read']:,} rows, inserted {stats['inserted']:,}, rejected {stats['rejected']:,} "
+          f"in {stats['seconds']}s ({stats['rows_per_sec']:,} rows/s)")
+    return 1 if stats['rejected'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
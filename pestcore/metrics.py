@@ -0,0 +1,82 @@
+"""One-pass KPI and sidebar metrics over an in-memory customers frame
+
+Pure functions with no Streamlit calls, so they can be imported by the
+dashboard, scripts and benchmarks alike.
+"""
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from pestcore.data import LEGACY_STATUSES
+
+RECENT_DAYS = 7
+
+COMPLETED_STATUSES = ['Completed'] + [old for old, new in LEGACY_STATUSES.items() if new == 'Completed']
+
+METRIC_NAMES = [
+    'total_contracts', 'total_revenue', 'total_paid', 'total_pending',
+    'completed_count', 'completion_rate', 'recent_visits',
+]
+
+
+def recent_cutoff(now=None, days=RECENT_DAYS):
+    """Start of the 'recent visits' window"""
+    return (now or datetime.now()) - timedelta(days=days)
+
+
+def recent_first_day(now=None, days=RECENT_DAYS):
+    """Earliest visit date (a midnight timestamp) inside the recent window"""
+    cutoff = recent_cutoff(now, days)
+    first = cutoff.date()
+    if cutoff.time() != datetime.min.time():
+        first += timedelta(days=1)
+    return first
+
+
+def _as_float(series):
+    if not pd.api.types.is_numeric_dtype(series):
+        series = pd.to_numeric(series, errors='coerce')
+    return series.to_numpy(dtype='float64', na_value=np.nan)
+
+
+def compute_metrics(df, now=None):
+    """Every KPI and sidebar stat in a single vectorized pass
+
+    Amounts are summed per payment state with one ``bincount`` (unpaid,
+    paid, unknown), and ``visit_date`` is used as already parsed by the
+    loader rather than re-parsed.
+    """
+    total = len(df)
+
+    if 'amount' in df.columns:
+        amount = np.nan_to_num(_as_float(df['amount']))
+    else:
+        amount = np.zeros(total)
+
+    if 'paid' in df.columns:
+        paid = _as_float(df['paid'])
+        codes = np.where(paid == 0, 0, np.where(paid == 1, 1, 2))
+    else:
+        codes = np.full(total, 2)
+    sums = np.bincount(codes, weights=amount, minlength=3)
+
+    completed = int(df['service_status'].isin(COMPLETED_STATUSES).sum()) if 'service_status' in df.columns else 0
+
+    recent = 0
+    if 'visit_date' in df.columns:
+        visit_date = df['visit_date']
+        if not pd.api.types.is_datetime64_any_dtype(visit_date):
+            visit_date = pd.to_datetime(visit_date, errors='coerce')
+        recent = int((visit_date >= recent_cutoff(now)).sum())
+
+    return {
+        'total_contracts': total,
+        # Amounts may be float32 in memory; report them to the paisa
+        'total_revenue': round(float(sums.sum()), 2),
+        'total_paid': round(float(sums[1]), 2),
+        'total_pending': round(float(sums[0]), 2),
+        'completed_count': completed,
+        'completion_rate': completed / total * 100 if total else 0.0,
+        'recent_visits': recent,
+    }
@@ -0,0 +1,195 @@
+"""Versioned schema migrations for the customers database
+
+Each migration runs in its own write transaction and bumps
+``PRAGMA user_version``, so running the runner again is a no-op.
+
+    python -m pestcore.migrations pestcontrol.db
+"""
+import sqlite3
+import sys
+
+import pandas as pd
+
+from pestcore.edits import create_change_tracking
+from pestcore.geocode import create_geocoding
+from pestcore.identity import create_identity_tables
+from pestcore.receivables import create_receivables, refresh_receivables
+from pestcore.rollups import create_rollups, refresh_rollups
+from pestcore.search import rebuild_search_index
+
+ISO_DATE_GLOB = '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'
+
+# Year-first layouts, tried before the day-first parse so 2025/03/07 stays in March
+YEAR_FIRST_FORMATS = ['%Y/%m/%d', '%Y.%m.%d', '%Y-%m-%d']
+
+
+def _create_customers(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS customers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            phone TEXT,
+            address TEXT,
+            service TEXT,
+            visit_date TEXT,
+            amount REAL,
+            paid INTEGER,
+            payment_method TEXT,
+            service_status TEXT
+        )
+    ''')
+
+
+def _add_indexes(conn):
+    # KPI sums by payment state are answered from the index alone
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_customers_paid_amount ON customers (paid, amount)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_customers_status_paid ON customers (service_status, paid, amount)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_customers_service ON customers (service, service_status)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_customers_visit_date ON customers (visit_date, paid, amount)")
+
+
+def _normalize_visit_dates(conn):
+    """Rewrite free-text visit dates as sortable ISO YYYY-MM-DD"""
+    # ISO timestamps only need their time part dropped
+    conn.execute(
+        "UPDATE customers SET visit_date = substr(visit_date, 1, 10) "
+        "WHERE visit_date GLOB ? AND length(visit_date) > 10",
+        (ISO_DATE_GLOB + '*',)
+    )
+    rows = conn.execute(
+        "SELECT id, visit_date FROM customers WHERE visit_date IS NOT NULL AND visit_date NOT GLOB ?",
+        (ISO_DATE_GLOB,)
+    ).fetchall()
+    if not rows:
+        return
+    ids, raw = zip(*rows)
+    raw = pd.Series(raw)
+    parsed = pd.Series(pd.NaT, index=raw.index, dtype='datetime64[ns]')
+    for layout in YEAR_FIRST_FORMATS:
+        parsed = parsed.fillna(pd.to_datetime(raw, errors='coerce', format=layout))
+    rest = parsed.isna()
+    parsed[rest] = pd.to_datetime(raw[rest], errors='coerce', format='mixed', dayfirst=True)
+    # Unparseable values are kept as typed rather than discarded
+    updates = [
+        (value.strftime('%Y-%m-%d'), row_id)
+        for row_id, value in zip(ids, parsed) if pd.notnull(value)
+    ]
+    conn.executemany("UPDATE customers SET visit_date = ? WHERE id = ?", updates)
+
+
+def _add_search_indexes(conn):
+    # Prefix lookups from the record browser
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_customers_name ON customers (name COLLATE NOCASE)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_customers_phone ON customers (phone)")
+
+
+def _add_scheduler_tables(conn):
+    # Recurring contracts: each rule repeats one visit every N months
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS recurrences (
+            id INTEGER PRIMARY KEY,
+            customer_id INTEGER NOT NULL,
+            every_months INTEGER NOT NULL CHECK (every_months > 0),
+            next_date TEXT NOT NULL,
+            until TEXT,
+            active INTEGER NOT NULL DEFAULT 1,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_recurrences_due ON recurrences (active, next_date)")
+    # Unpaid jobs past the grace period, maintained by the overdue sweep
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS overdue_jobs (
+            customer_id INTEGER PRIMARY KEY,
+            flagged_at TEXT NOT NULL
+        )
+    ''')
+
+
+def _add_rollups(conn):
+    create_rollups(conn)
+    refresh_rollups(conn)
+
+
+def _add_receivables(conn):
+    create_receivables(conn)
+    refresh_receivables(conn)
+
+
+def _add_insert_triggers(conn):
+    # Both create functions skip what exists and add the insert triggers
+    create_rollups(conn)
+    create_receivables(conn)
+
+
+def _drop_prefix_indexes(conn):
+    # Search goes through customers_fts; these only slowed down inserts
+    conn.execute("DROP INDEX IF EXISTS idx_customers_name")
+    conn.execute("DROP INDEX IF EXISTS idx_customers_phone")
+
+
+# (version, description, apply) in the order they must run
+MIGRATIONS = [
+    (1, 'Create customers table', _create_customers),
+    (2, 'Indexes for dashboard filters and aggregates', _add_indexes),
+    (3, 'Normalize visit_date to ISO YYYY-MM-DD', _normalize_visit_dates),
+    (4, 'Name and phone prefix search indexes', _add_search_indexes),
+    (5, 'Daily and monthly rollup tables', _add_rollups),
+    (6, 'Full-text search index over name, phone and address', rebuild_search_index),
+    (7, 'Record versions and scoped cache tokens', create_change_tracking),
+    (8, 'Recurring visit rules and overdue job flags', _add_scheduler_tables),
+    (9, 'Gazetteer and geocode cache for route planning', create_geocoding),
+    (10, 'Customer entity mapping for identity resolution', create_identity_tables),
+    (11, 'Receivables aging ledger', _add_receivables),
+    (12, 'Drop the name and phone prefix indexes replaced by full-text search', _drop_prefix_indexes),
+    (13, 'Roll up and ledger rows inserted below the high-water marks', _add_insert_triggers),
+    (14, 'Bump the cache tokens for rows inserted below the newest id', create_change_tracking),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn):
+    """Schema version recorded in PRAGMA user_version"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, target=None):
+    """Apply pending migrations, up to ``target`` if given, and return the versions that ran"""
+    if conn.in_transaction:
+        conn.commit()
+
+    applied = []
+    for version, description, apply in MIGRATIONS:
+        if version <= schema_version(conn):
+            continue
+        if target is not None and version > target:
+            break
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have migrated while we waited for the lock
+            if version > schema_version(conn):
+                apply(conn)
+                conn.execute(f"PRAGMA user_version = {int(version)}")
+                applied.append(version)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return applied
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    db_path = argv[0] if argv else 'pestcontrol.db'
+    conn = sqlite3.connect(db_path)
+    try:
+        applied = migrate(conn)
+        print(f"{db_path}: schema version {schema_version(conn)}"
+              + (f" (applied {', '.join(map(str, applied))})" if applied else " (up to date)"))
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,398 @@
+"""Receivables aging: unpaid jobs bucketed by days since the visit
+
+A receivable is an unpaid job that has been carried out, i.e. not
+``Scheduled`` or ``Cancelled``. Two small tables keep the amounts owed
+materialized:
+
+- ``receivables_days``: jobs and amount per visit date x payment method
+- ``receivables_aging``: the same per aging bucket x payment method, as of
+  the date in ``receivables_state``
+
+They are maintained like the rollups. Edits and deletes of rows below the
+high-water mark (a payment recorded, an amount corrected), and rows
+inserted with an explicit id below it, are applied by triggers. New rows are folded in set-wise by ``refresh_receivables()``,
+which runs at the end of every write and on each scheduler pass.
+
+Buckets move with the calendar, not with the data. When the date changes,
+``refresh_receivables()`` rolls them forward from ``receivables_days``:
+only visit dates young enough to change bucket are touched, a few hundred
+ledger rows, never the unpaid customers rows themselves. Readers add the
+tail above the mark on the fly, as ``trend()`` does, so figures are
+current even before the next refresh.
+
+Undated jobs count as 90+.
+
+    python -m pestcore.receivables check --db pestcontrol.db
+"""
+import argparse
+import sqlite3
+import sys
+from datetime import date, timedelta
+
+import pandas as pd
+
+# (label, oldest age in days it holds), youngest first; the last is open-ended
+BUCKETS = [('0-30', 30), ('31-60', 60), ('61-90', 90), ('90+', None)]
+
+BUCKET_LABELS = [label for label, _ in BUCKETS]
+
+# Beyond this age a job never changes bucket again
+MAX_BUCKET_AGE = BUCKETS[-2][1]
+
+# Shown for jobs with no payment method
+UNSET_METHOD = 'Not Set'
+
+# Unpaid jobs that are not owed yet, or never will be
+NOT_RECEIVABLE_STATUSES = ['Scheduled', 'Cancelled']
+
+
+def _receivable(r):
+    """Condition for a customers row alias ``r`` being owed"""
+    statuses = ', '.join(f"'{status}'" for status in NOT_RECEIVABLE_STATUSES)
+    return f"coalesce({r}.paid, 0) = 0 AND coalesce({r}.service_status, '') NOT IN ({statuses})"
+
+
+def _bucket_expr(visit_date, as_of):
+    """Bucket label of a visit date, as of another date (both SQL expressions)"""
+    age = f"julianday({as_of}) - julianday({visit_date})"
+    cases = ' '.join(f"WHEN {age} <= {limit} THEN '{label}'" for label, limit in BUCKETS[:-1])
+    return f"CASE WHEN julianday({visit_date}) IS NULL THEN '{BUCKETS[-1][0]}' {cases} ELSE '{BUCKETS[-1][0]}' END"
+
+
+def _as_of(day):
+    return (day or date.today()).isoformat()
+
+
+def _literal(day):
+    """A date as an SQL literal; the bucket CASE repeats it, so it is not bound"""
+    return f"'{date.fromisoformat(str(day)).isoformat()}'"
+
+
+def _upsert(table, key_columns, select):
+    return f'''
+        INSERT INTO {table} ({', '.join(key_columns)}, jobs, amount)
+        {select}
+        ON CONFLICT ({', '.join(key_columns)}) DO UPDATE
+        SET jobs = jobs + excluded.jobs, amount = amount + excluded.amount;
+    '''
+
+
+def _row_changes(r, sign):
+    """Trigger statements adding (sign '') or removing (sign '-') one row"""
+    as_of = "(SELECT as_of FROM receivables_state WHERE id = 1)"
+    where = f"WHERE {_receivable(r)}"
+    method = f"coalesce({r}.payment_method, '')"
+    amount = f"{sign}coalesce({r}.amount, 0)"
+    return (
+        _upsert('receivables_days', ['visit_date', 'payment_method'],
+                f"SELECT coalesce({r}.visit_date, ''), {method}, {sign}1, {amount} {where}")
+        + _upsert('receivables_aging', ['bucket', 'payment_method'],
+                  f"SELECT {_bucket_expr(f'{r}.visit_date', as_of)}, {method}, {sign}1, {amount} {where}")
+    )
+
+
+def create_receivables(conn, today=None):
+    """Ledger tables, the triggers that apply edits to them, and a drill-down index"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS receivables_days (
+            visit_date TEXT NOT NULL,
+            payment_method TEXT NOT NULL,
+            jobs INTEGER NOT NULL DEFAULT 0,
+            amount REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (visit_date, payment_method)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS receivables_aging (
+            bucket TEXT NOT NULL,
+            payment_method TEXT NOT NULL,
+            jobs INTEGER NOT NULL DEFAULT 0,
+            amount REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket, payment_method)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS receivables_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            hwm INTEGER NOT NULL,
+            as_of TEXT NOT NULL
+        )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO receivables_state (id, hwm, as_of) VALUES (1, 0, ?)", (_as_of(today),))
+    # Per-customer drill-down reads unpaid rows only, by visit date
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_customers_receivable ON customers (visit_date)
+        WHERE coalesce(paid, 0) = 0
+    ''')
+
+    # Rows above the mark are picked up by the next refresh instead
+    ledgered = "{r}.id <= (SELECT hwm FROM receivables_state WHERE id = 1)"
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS receivables_customers_insert AFTER INSERT ON customers
+        WHEN {ledgered.format(r='new')}
+        BEGIN {_row_changes('new', '')} END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS receivables_customers_delete AFTER DELETE ON customers
+        WHEN {ledgered.format(r='old')}
+        BEGIN {_row_changes('old', '-')} END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS receivables_customers_update
+        AFTER UPDATE OF visit_date, amount, paid, payment_method, service_status ON customers
+        WHEN {ledgered.format(r='old')}
+        BEGIN {_row_changes('old', '-')} {_row_changes('new', '')} END
+    ''')
+
+
+def roll_forward(conn, today=None):
+    """Move aging buckets to ``today``; returns the number of days moved
+
+    Only visit dates within ``MAX_BUCKET_AGE`` days of either date can
+    change bucket, so only their ledger rows are read.
+    """
+    old = conn.execute("SELECT as_of FROM receivables_state WHERE id = 1").fetchone()[0]
+    new = _as_of(today)
+    if new == old:
+        return 0
+    since = (min(date.fromisoformat(old), date.fromisoformat(new)) - timedelta(days=MAX_BUCKET_AGE)).isoformat()
+    conn.execute(_upsert('receivables_aging', ['bucket', 'payment_method'], f'''
+        SELECT bucket, payment_method, SUM(jobs), SUM(amount) FROM (
+            SELECT {_bucket_expr('d.visit_date', _literal(new))} AS bucket, d.payment_method, d.jobs, d.amount
+            FROM receivables_days AS d WHERE d.visit_date >= ?
+            UNION ALL
+            SELECT {_bucket_expr('d.visit_date', _literal(old))}, d.payment_method, -d.jobs, -d.amount
+            FROM receivables_days AS d WHERE d.visit_date >= ?
+        )
+        WHERE true
+        GROUP BY bucket, payment_method
+    '''), (since, since))
+    conn.execute("DELETE FROM receivables_aging WHERE jobs = 0")
+    conn.execute("UPDATE receivables_state SET as_of = ? WHERE id = 1", (new,))
+    return abs((date.fromisoformat(new) - date.fromisoformat(old)).days)
+
+
+def refresh_receivables(conn, today=None):
+    """Roll buckets forward to ``today`` and fold in rows above the mark
+
+    Must run inside a write transaction; usable as a write hook. Returns
+    the number of ids covered.
+    """
+    roll_forward(conn, today)
+    hwm = conn.execute("SELECT hwm FROM receivables_state WHERE id = 1").fetchone()[0]
+    top = conn.execute("SELECT MAX(id) FROM customers").fetchone()[0]
+    if top is None or top <= hwm:
+        return 0
+
+    as_of = "(SELECT as_of FROM receivables_state WHERE id = 1)"
+    where = f"WHERE c.id > ? AND c.id <= ? AND {_receivable('c')}"
+    conn.execute(_upsert('receivables_days', ['visit_date', 'payment_method'], f'''
+        SELECT coalesce(c.visit_date, '') AS day, coalesce(c.payment_method, '') AS method,
+               COUNT(*), TOTAL(c.amount)
+        FROM customers AS c {where}
+        GROUP BY day, method
+    '''), (hwm, top))
+    conn.execute(_upsert('receivables_aging', ['bucket', 'payment_method'], f'''
+        SELECT {_bucket_expr('c.visit_date', as_of)} AS bucket, coalesce(c.payment_method, '') AS method,
+               COUNT(*), TOTAL(c.amount)
+        FROM customers AS c {where}
+        GROUP BY bucket, method
+    '''), (hwm, top))
+    for table in ['receivables_days', 'receivables_aging']:
+        conn.execute(f"DELETE FROM {table} WHERE jobs = 0")
+    conn.execute("UPDATE receivables_state SET hwm = ? WHERE id = 1", (top,))
+    return top - hwm
+
+
+def rebuild_receivables(conn, today=None):
+    """Recompute the ledger from scratch (inside a write transaction)"""
+    for table in ['receivables_days', 'receivables_aging']:
+        conn.execute(f"DELETE FROM {table}")
+    conn.execute("UPDATE receivables_state SET hwm = 0, as_of = ? WHERE id = 1", (_as_of(today),))
+    return refresh_receivables(conn, today)
+
+
+def aging_summary(conn, today=None):
+    """Jobs and amount owed per bucket and payment method, as of ``today``
+
+    Reads the materialized buckets when they are as of ``today``, else
+    re-buckets the per-day ledger, plus the tail above the mark either way.
+    """
+    hwm, as_of = conn.execute("SELECT hwm, as_of FROM receivables_state WHERE id = 1").fetchone()
+    today = _as_of(today)
+    if as_of == today:
+        ledger = "SELECT bucket, payment_method, jobs, amount FROM receivables_aging"
+    else:
+        ledger = (f"SELECT {_bucket_expr('d.visit_date', _literal(today))} AS bucket, "
+                  f"d.payment_method, d.jobs, d.amount FROM receivables_days AS d")
+    summary = pd.read_sql_query(f'''
+        SELECT bucket, payment_method, SUM(jobs) AS jobs, SUM(amount) AS amount
+        FROM (
+            {ledger}
+            UNION ALL
+            SELECT {_bucket_expr('c.visit_date', _literal(today))}, coalesce(c.payment_method, ''), 1, coalesce(c.amount, 0)
+            FROM customers AS c
+            WHERE c.id > ? AND {_receivable('c')}
+        )
+        GROUP BY bucket, payment_method
+        HAVING SUM(jobs) != 0
+    ''', conn, params=(hwm,))
+    summary['amount'] = summary['amount'].round(2)
+    order = summary['bucket'].map({label: position for position, label in enumerate(BUCKET_LABELS)})
+    return summary.iloc[order.argsort(kind='stable')].reset_index(drop=True)
+
+
+def bucket_totals(summary):
+    """Jobs and amount per bucket, every bucket present and in order"""
+    totals = summary.groupby('bucket')[['jobs', 'amount']].sum().reindex(BUCKET_LABELS, fill_value=0)
+    return totals.rename_axis('bucket').reset_index()
+
+
+def bucket_pivot(summary, value='amount'):
+    """Payment methods down, buckets across, with row and column totals"""
+    pivot = (
+        summary.pivot_table(index='payment_method', columns='bucket', values=value, aggfunc='sum', fill_value=0)
+        .reindex(columns=BUCKET_LABELS, fill_value=0)
+    )
+    pivot['Total'] = pivot.sum(axis=1)
+    pivot = pivot.sort_values('Total', ascending=False).rename(index={'': UNSET_METHOD})
+    pivot.loc['Total'] = pivot.sum()
+    return pivot.rename_axis('payment_method').reset_index()
+
+
+def _bucket_range(bucket, today):
+    """(oldest, newest) visit dates of a bucket; None where it is open"""
+    limits = dict(BUCKETS)
+    if bucket not in limits:
+        raise ValueError(f"Unknown aging bucket: {bucket}")
+    position = BUCKET_LABELS.index(bucket)
+    newer = BUCKETS[position - 1][1] if position else None
+    oldest = today - timedelta(days=limits[bucket]) if limits[bucket] is not None else None
+    newest = today - timedelta(days=newer + 1) if newer is not None else None
+    return oldest, newest
+
+
+def _drilldown_where(today, bucket=None, payment_method=None):
+    where, params = [_receivable('c')], []
+    if bucket:
+        oldest, newest = _bucket_range(bucket, today)
+        if oldest is not None:
+            where.append("c.visit_date >= ?")
+            params.append(oldest.isoformat())
+        if newest is not None:
+            # Undated jobs ('' or NULL) are 90+
+            where.append("coalesce(c.visit_date, '') <= ?")
+            params.append(newest.isoformat())
+    if payment_method is not None:
+        where.append("coalesce(c.payment_method, '') = ?")
+        params.append(payment_method)
+    return ' AND '.join(where), params
+
+
+def customer_aging(conn, today=None, bucket=None, payment_method=None, limit=50):
+    """Customers owing the most, with their amount in each bucket
+
+    Visits are grouped into customer entities (see ``pestcore.identity``);
+    ``bucket`` and ``payment_method`` narrow the jobs counted.
+    """
+    today = today or date.today()
+    where, params = _drilldown_where(today, bucket, payment_method)
+    per_bucket = ', '.join(
+        f"ROUND(TOTAL(CASE WHEN o.bucket = '{label}' THEN o.amount END), 2) AS \"{label}\""
+        for label in BUCKET_LABELS
+    )
+    return pd.read_sql_query(f'''
+        SELECT t.entity, c.name, c.phone, t.jobs, t.amount, t.oldest_visit, {', '.join(f't."{label}"' for label in BUCKET_LABELS)}
+        FROM (
+            SELECT o.entity, MAX(o.id) AS latest, COUNT(*) AS jobs, ROUND(TOTAL(o.amount), 2) AS amount,
+                   MIN(o.visit_date) AS oldest_visit, {per_bucket}
+            FROM (
+                SELECT coalesce(e.entity_id, c.id) AS entity, c.id, c.visit_date, coalesce(c.amount, 0) AS amount,
+                       {_bucket_expr('c.visit_date', _literal(today))} AS bucket
+                FROM customers AS c
+                LEFT JOIN customer_entities AS e ON e.customer_id = c.id
+                WHERE {where}
+            ) AS o
+            GROUP BY o.entity
+            ORDER BY amount DESC
+            LIMIT ?
+        ) AS t
+        JOIN customers AS c ON c.id = t.latest
+        ORDER BY t.amount DESC
+    ''', conn, params=params + [int(limit)])
+
+
+def receivable_jobs(conn, entity, today=None, bucket=None, payment_method=None):
+    """One customer entity's unpaid jobs, oldest first, with age and bucket"""
+    today = today or date.today()
+    where, params = _drilldown_where(today, bucket, payment_method)
+    return pd.read_sql_query(f'''
+        SELECT c.id, c.name, c.service, c.visit_date, c.amount, c.payment_method, c.service_status,
+               CAST(julianday({_literal(today)}) - julianday(c.visit_date) AS INTEGER) AS age_days,
+               {_bucket_expr('c.visit_date', _literal(today))} AS bucket
+        FROM customers AS c
+        LEFT JOIN customer_entities AS e ON e.customer_id = c.id
+        WHERE (c.id = ? OR c.id IN (SELECT customer_id FROM customer_entities WHERE entity_id = ?))
+        AND coalesce(e.entity_id, c.id) = ? AND {where}
+        ORDER BY c.visit_date, c.id
+    ''', conn, params=[int(entity)] * 3 + params)
+
+
+def check_receivables(conn, today=None, tolerance=0.01):
+    """Differences between the ledger and a scan of the unpaid rows
+
+    Returns a list of (bucket, payment_method, ledger (jobs, amount),
+    base (jobs, amount)); an empty list means the ledger is consistent.
+    """
+    today = _as_of(today)
+    ledger = {
+        (row.bucket, row.payment_method): (row.jobs, row.amount)
+        for row in aging_summary(conn, today=date.fromisoformat(today)).itertuples()
+    }
+    base = {
+        (bucket, method): (jobs, amount)
+        for bucket, method, jobs, amount in conn.execute(f'''
+            SELECT {_bucket_expr('c.visit_date', _literal(today))} AS bucket, coalesce(c.payment_method, '') AS method,
+                   COUNT(*), TOTAL(c.amount)
+            FROM customers AS c WHERE {_receivable('c')}
+            GROUP BY bucket, method
+        ''')
+    }
+    mismatches = []
+    for key in sorted(set(ledger) | set(base)):
+        got, want = ledger.get(key, (0, 0.0)), base.get(key, (0, 0.0))
+        if got[0] != want[0] or abs(got[1] - want[1]) > tolerance:
+            mismatches.append((*key, got, want))
+    return mismatches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pestcore.receivables', description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['refresh', 'rebuild', 'check', 'show'])
+    parser.add_argument('--db', default='pestcontrol.db')
+    parser.add_argument('--date', type=date.fromisoformat, default=date.today())
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    try:
+        if args.command == 'check':
+            mismatches = check_receivables(conn, args.date)
+            for bucket, method, got, want in mismatches[:50]:
+                print(f"{bucket} {method!r}: ledger {got} != base {want}")
+            print(f"{len(mismatches)} mismatched aging rows")
+            return 1 if mismatches else 0
+        if args.command == 'show':
+            print(bucket_pivot(aging_summary(conn, args.date)).to_string(index=False))
+            return 0
+
+        conn.execute("BEGIN IMMEDIATE")
+        refresh = refresh_receivables if args.command == 'refresh' else rebuild_receivables
+        covered = refresh(conn, args.date)
+        conn.execute("COMMIT")
+        print(f"Ledgered {covered:,} new ids")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
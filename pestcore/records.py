@@ -0,0 +1,101 @@
+"""Keyset-paginated customer record queries
+
+Pages are ordered newest first and addressed by the last ``id`` of the
+previous page, so fetching page 500 costs the same as page 1 and only one
+page of rows ever leaves SQLite.
+"""
+import pandas as pd
+
+from pestcore.data import LEGACY_STATUSES
+from pestcore.search import FTS_TABLE, match_expression
+
+PAGE_SIZE = 25
+
+RECORD_COLUMNS = [
+    'id', 'name', 'phone', 'service', 'visit_date', 'amount',
+    'paid', 'payment_method', 'service_status', 'version',
+]
+
+# Columns shown only in the single-record detail view
+DETAIL_COLUMNS = RECORD_COLUMNS + ['address', 'updated_at']
+
+def build_filters(search=None, statuses=None, services=None, paid=None,
+                  date_from=None, date_to=None):
+    """WHERE clause and parameters for the record browser filters
+
+    ``search`` is free text for the full-text index, ``paid`` is True/False/None
+    and the dates are inclusive ``date`` objects or ISO strings.
+    """
+    clauses, params = [], []
+
+    expression = match_expression(search)
+    if expression is not None:
+        # Full-text match on name, phone digits and address
+        clauses.append(f"id IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ?)")
+        params.append(expression)
+
+    if statuses:
+        wanted = set(statuses)
+        wanted |= {old for old, new in LEGACY_STATUSES.items() if new in wanted}
+        clauses.append(f"service_status IN ({', '.join('?' for _ in wanted)})")
+        params += sorted(wanted)
+
+    if services:
+        clauses.append(f"service IN ({', '.join('?' for _ in services)})")
+        params += list(services)
+
+    if paid is not None:
+        clauses.append("paid = ?")
+        params.append(int(bool(paid)))
+
+    if date_from:
+        clauses.append("visit_date >= ?")
+        params.append(str(date_from))
+
+    if date_to:
+        clauses.append("visit_date <= ?")
+        params.append(str(date_to))
+
+    where = ' AND '.join(clauses) if clauses else '1'
+    return where, params
+
+
+def fetch_page(conn, filters=('1', []), after_id=None, page_size=PAGE_SIZE, table='customers'):
+    """One page of matching records with ids below ``after_id``
+
+    Returns ``(page, has_more)``; pass the last id of ``page`` as the next
+    ``after_id``.
+    """
+    where, params = filters
+    if after_id is not None:
+        where = f"({where}) AND id < ?"
+        params = list(params) + [int(after_id)]
+
+    rows = conn.execute(f'''
+        SELECT {', '.join(RECORD_COLUMNS)} FROM "{table}"
+        WHERE {where}
+        ORDER BY id DESC
+        LIMIT ?
+    ''', list(params) + [page_size + 1]).fetchall()
+
+    page = pd.DataFrame(rows[:page_size], columns=RECORD_COLUMNS)
+    page['service_status'] = page['service_status'].replace(LEGACY_STATUSES)
+    return page, len(rows) > page_size
+
+
+def count_matching(conn, filters=('1', []), table='customers'):
+    """Number of records matching the filters"""
+    where, params = filters
+    return conn.execute(f'SELECT COUNT(*) FROM "{table}" WHERE {where}', params).fetchone()[0]
+
+
+def fetch_record(conn, record_id, table='customers'):
+    """Every detail column of one record as a dict, or None if it is gone"""
+    row = conn.execute(
+        f'SELECT {", ".join(DETAIL_COLUMNS)} FROM "{table}" WHERE id = ?', (int(record_id),)
+    ).fetchone()
+    if row is None:
+        return None
+    record = dict(zip(DETAIL_COLUMNS, row))
+    record['service_status'] = LEGACY_STATUSES.get(record['service_status'], record['service_status'])
+    return record
@@ -0,0 +1,239 @@
+"""Daily and monthly rollups of the customers table
+
+``rollup_daily`` and ``rollup_monthly`` hold job counts and revenue per
+period x service x status x paid x payment method. They are maintained in
+two halves:
+
+- new rows are folded in set-wise by ``refresh_rollups()``, which advances a
+  high-water-mark ``id`` kept in ``rollup_state``
+- edits and deletes of rows already below the mark, and rows inserted with
+  an explicit id below it, are applied by triggers
+
+Readers never wait for a refresh: ``trend()`` adds the not-yet-rolled-up
+tail above the mark on the fly.
+
+    python -m pestcore.rollups check --db pestcontrol.db
+"""
+import argparse
+import sqlite3
+import sys
+
+import pandas as pd
+
+from pestcore.data import LEGACY_STATUSES
+
+# grain -> (table, period expression over a customers row alias)
+GRAINS = {
+    'day': ('rollup_daily', "coalesce({r}.visit_date, '')"),
+    'month': ('rollup_monthly', "coalesce(substr({r}.visit_date, 1, 7), '')"),
+}
+
+DIMENSIONS = ['service', 'service_status', 'paid', 'payment_method']
+
+KEY_COLUMNS = ['period'] + DIMENSIONS
+
+
+def _status_expr(r):
+    cases = ' '.join(f"WHEN '{old}' THEN '{new}'" for old, new in LEGACY_STATUSES.items())
+    return f"CASE coalesce({r}.service_status, '') {cases} ELSE coalesce({r}.service_status, '') END"
+
+
+def _key_exprs(grain, r):
+    """Rollup key expressions for the customers row alias ``r``"""
+    return [
+        GRAINS[grain][1].format(r=r),
+        f"coalesce({r}.service, '')",
+        _status_expr(r),
+        f"coalesce({r}.paid, 0)",
+        f"coalesce({r}.payment_method, '')",
+    ]
+
+
+def _upsert(table, values):
+    return f'''
+        INSERT INTO {table} ({', '.join(KEY_COLUMNS)}, jobs, revenue)
+        VALUES ({', '.join(values)})
+        ON CONFLICT ({', '.join(KEY_COLUMNS)}) DO UPDATE
+        SET jobs = jobs + excluded.jobs, revenue = revenue + excluded.revenue;
+    '''
+
+
+def create_rollups(conn):
+    """Rollup tables and the triggers that keep them current under edits"""
+    for grain, (table, _) in GRAINS.items():
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                period TEXT NOT NULL,
+                service TEXT NOT NULL,
+                service_status TEXT NOT NULL,
+                paid INTEGER NOT NULL,
+                payment_method TEXT NOT NULL,
+                jobs INTEGER NOT NULL DEFAULT 0,
+                revenue REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY ({', '.join(KEY_COLUMNS)})
+            ) WITHOUT ROWID
+        ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS rollup_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            hwm INTEGER NOT NULL
+        )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO rollup_state (id, hwm) VALUES (1, 0)")
+
+    # Rows above the mark are picked up by the next refresh instead
+    rolled_up = "{r}.id <= (SELECT hwm FROM rollup_state WHERE id = 1)"
+    remove = ''.join(
+        _upsert(table, _key_exprs(grain, 'old') + ['-1', '-coalesce(old.amount, 0)'])
+        for grain, (table, _) in GRAINS.items()
+    )
+    add = ''.join(
+        _upsert(table, _key_exprs(grain, 'new') + ['1', 'coalesce(new.amount, 0)'])
+        for grain, (table, _) in GRAINS.items()
+    )
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS rollup_customers_insert AFTER INSERT ON customers
+        WHEN {rolled_up.format(r='new')}
+        BEGIN {add} END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS rollup_customers_delete AFTER DELETE ON customers
+        WHEN {rolled_up.format(r='old')}
+        BEGIN {remove} END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS rollup_customers_update AFTER UPDATE ON customers
+        WHEN {rolled_up.format(r='old')}
+        BEGIN {remove} {add} END
+    ''')
+
+
+def _tail_select(grain, where):
+    """Grouped rollup rows computed straight from customers
+
+    Groups by position: the key aliases shadow real column names.
+    """
+    keys = _key_exprs(grain, 'c')
+    return f'''
+        SELECT {', '.join(f'{expr} AS {col}' for expr, col in zip(keys, KEY_COLUMNS))},
+               COUNT(*) AS jobs, TOTAL(c.amount) AS revenue
+        FROM customers AS c
+        WHERE {where}
+        GROUP BY {', '.join(str(position) for position in range(1, len(KEY_COLUMNS) + 1))}
+    '''
+
+
+def refresh_rollups(conn):
+    """Fold rows above the high-water mark into the rollups
+
+    Must run inside a write transaction. Returns the number of ids covered.
+    """
+    hwm = conn.execute("SELECT hwm FROM rollup_state WHERE id = 1").fetchone()[0]
+    top = conn.execute("SELECT MAX(id) FROM customers").fetchone()[0]
+    if top is None or top <= hwm:
+        return 0
+
+    for grain, (table, _) in GRAINS.items():
+        conn.execute(f'''
+            INSERT INTO {table} ({', '.join(KEY_COLUMNS)}, jobs, revenue)
+            {_tail_select(grain, 'c.id > ? AND c.id <= ?')}
+            ON CONFLICT ({', '.join(KEY_COLUMNS)}) DO UPDATE
+            SET jobs = jobs + excluded.jobs, revenue = revenue + excluded.revenue
+        ''', (hwm, top))
+        conn.execute(f"DELETE FROM {table} WHERE jobs = 0")
+    conn.execute("UPDATE rollup_state SET hwm = ? WHERE id = 1", (top,))
+    return top - hwm
+
+
+def rebuild_rollups(conn):
+    """Recompute every rollup from scratch (inside a write transaction)"""
+    for table, _ in GRAINS.values():
+        conn.execute(f"DELETE FROM {table}")
+    conn.execute("UPDATE rollup_state SET hwm = 0 WHERE id = 1")
+    return refresh_rollups(conn)
+
+
+def trend(conn, grain='month', by='service', date_from=None, date_to=None):
+    """Jobs and revenue per period and ``by`` group, ordered by period
+
+    Reads the rollup plus the tail of rows above the high-water mark, so
+    the result is current even before the next refresh.
+    """
+    if by not in DIMENSIONS:
+        raise ValueError(f"Unknown trend dimension: {by}")
+    table = GRAINS[grain][0]
+    hwm = conn.execute("SELECT hwm FROM rollup_state WHERE id = 1").fetchone()[0]
+
+    # Periods are ISO prefixes: YYYY-MM-DD or YYYY-MM
+    width = 10 if grain == 'day' else 7
+    where, params = ["period != ''"], []
+    if date_from:
+        where.append("period >= ?")
+        params.append(str(date_from)[:width])
+    if date_to:
+        where.append("period <= ?")
+        params.append(str(date_to)[:width])
+
+    return pd.read_sql_query(f'''
+        SELECT period, {by} AS "group", SUM(jobs) AS jobs, SUM(revenue) AS revenue
+        FROM (
+            SELECT {', '.join(KEY_COLUMNS)}, jobs, revenue FROM {table}
+            UNION ALL
+            {_tail_select(grain, 'c.id > ?')}
+        )
+        WHERE {' AND '.join(where)}
+        GROUP BY period, "group"
+        HAVING SUM(jobs) != 0
+        ORDER BY period, "group"
+    ''', conn, params=[hwm] + params)
+
+
+def check_rollups(conn, tolerance=0.01):
+    """Differences between the rollups and the base table below the mark
+
+    Returns a list of (grain, key, rollup (jobs, revenue), base (jobs, revenue));
+    an empty list means the rollups are consistent.
+    """
+    hwm = conn.execute("SELECT hwm FROM rollup_state WHERE id = 1").fetchone()[0]
+    mismatches = []
+    for grain, (table, _) in GRAINS.items():
+        rolled = {
+            tuple(row[:5]): (row[5], row[6])
+            for row in conn.execute(f"SELECT {', '.join(KEY_COLUMNS)}, jobs, revenue FROM {table} WHERE jobs != 0")
+        }
+        base = {
+            tuple(row[:5]): (row[5], row[6])
+            for row in conn.execute(_tail_select(grain, 'c.id <= ?'), (hwm,))
+        }
+        for key in sorted(set(rolled) | set(base), key=repr):
+            got, want = rolled.get(key, (0, 0.0)), base.get(key, (0, 0.0))
+            if got[0] != want[0] or abs(got[1] - want[1]) > tolerance:
+                mismatches.append((grain, key, got, want))
+    return mismatches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pestcore.rollups', description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['refresh', 'rebuild', 'check'])
+    parser.add_argument('--db', default='pestcontrol.db')
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    try:
+        if args.command == 'check':
+            mismatches = check_rollups(conn)
+            for grain, key, got, want in mismatches[:50]:
+                print(f"{grain} {key}: rollup {got} != base {want}")
+            print(f"{len(mismatches)} mismatched rollup rows")
+            return 1 if mismatches else 0
+
+        conn.execute("BEGIN IMMEDIATE")
+        covered = refresh_rollups(conn) if args.command == 'refresh' else rebuild_rollups(conn)
+        conn.execute("COMMIT")
+        print(f"Rolled up {covered:,} new ids")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""Per-technician visit routes for a day's Scheduled jobs
+
+Stops are the day's ``Scheduled`` visits, geocoded through the cached
+gazetteer lookup. They are shared out between technicians by sweeping
+around the depot in equal-sized angular sectors. Each technician's stops
+are then ordered by nearest neighbour from the depot and improved with
+2-opt.
+
+Distances are great-circle kilometres from one vectorized matrix per
+route, and each 2-opt pass scores every candidate move for a stop in one
+numpy operation, so a few thousand stops plan in seconds.
+
+    python -m pestcore.routes plan --date 2025-06-02 --technicians 3 --db pestcontrol.db
+    python -m pestcore.routes load-gazetteer places.csv --db pestcontrol.db
+"""
+import argparse
+import sys
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from pestcore.db import ConnectionManager
+from pestcore.geocode import geocode, load_gazetteer
+
+EARTH_RADIUS_KM = 6371.0
+
+# Wall-clock budget for 2-opt improvement across all technicians
+TWO_OPT_SECONDS = 5.0
+
+STOP_COLUMNS = ['id', 'name', 'phone', 'address', 'service']
+
+
+def distance_matrix(lat, lon):
+    """Great-circle distances in km between every pair of points"""
+    lat, lon = np.radians(np.asarray(lat, dtype='float64')), np.radians(np.asarray(lon, dtype='float64'))
+    dlat = lat[:, None] - lat[None, :]
+    dlon = lon[:, None] - lon[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def nearest_neighbour(dist, start=0):
+    """Visit order starting at ``start``, always going to the closest unvisited point"""
+    n = len(dist)
+    visited = np.zeros(n, dtype=bool)
+    order = [start]
+    visited[start] = True
+    for _ in range(n - 1):
+        candidates = np.where(visited, np.inf, dist[order[-1]])
+        nxt = int(candidates.argmin())
+        order.append(nxt)
+        visited[nxt] = True
+    return np.array(order)
+
+
+def two_opt(order, dist, deadline=None):
+    """Improve an open path whose first point is fixed by reversing segments
+
+    The path ends wherever its last stop is, so the final edge costs
+    nothing. Stops at ``deadline`` (a perf_counter value) if given.
+    """
+    order = np.array(order)
+    n = len(order)
+    if n < 4:
+        return order
+    # Open path: pad with a free end point so the last edge can be swapped too
+    padded = np.zeros((len(dist) + 1, len(dist) + 1))
+    padded[:-1, :-1] = dist
+    end = len(dist)
+    path = np.append(order, end)
+
+    improved = True
+    while improved:
+        improved = False
+        for i in range(n - 2):
+            if deadline is not None and time.perf_counter() > deadline:
+                return path[:-1]
+            a, b = path[i], path[i + 1]
+            c, d = path[i + 2:-1], path[i + 3:]
+            delta = padded[a, c] + padded[b, d] - padded[a, b] - padded[c, d]
+            j = int(delta.argmin())
+            if delta[j] < -1e-9:
+                # Reverse path[i+1 .. i+2+j]
+                path[i + 1:i + 3 + j] = path[i + 1:i + 3 + j][::-1]
+                improved = True
+    return path[:-1]
+
+
+def assign_technicians(lat, lon, depot, technicians):
+    """Technician number per stop: equal-sized sectors swept around the depot"""
+    n = len(lat)
+    technicians = max(1, min(int(technicians), n or 1))
+    angles = np.arctan2(np.asarray(lat) - depot[0], np.asarray(lon) - depot[1])
+    # Start the sweep at the widest gap between stops so no sector straddles a cluster
+    ordered = np.sort(angles)
+    if n > 1:
+        gaps = np.diff(np.append(ordered, ordered[0] + 2 * np.pi))
+        angles = (angles - ordered[(gaps.argmax() + 1) % n]) % (2 * np.pi)
+    ranks = np.empty(n, dtype=int)
+    ranks[np.argsort(angles, kind='stable')] = np.arange(n)
+    return ranks * technicians // max(n, 1)
+
+
+def plan_routes(stops, technicians=1, depot=None, max_seconds=TWO_OPT_SECONDS):
+    """Ordered routes for geocoded stops
+
+    ``stops`` needs ``lat`` and ``lon`` columns; ``depot`` is (lat, lon)
+    and defaults to the stops' centre. Returns the stops with
+    ``technician``, ``stop`` (1-based order) and ``leg_km`` columns added,
+    sorted by technician and stop.
+    """
+    stops = stops.reset_index(drop=True)
+    if stops.empty:
+        return stops.assign(technician=pd.Series(dtype=int), stop=pd.Series(dtype=int), leg_km=pd.Series(dtype=float))
+    lat, lon = stops['lat'].to_numpy(dtype='float64'), stops['lon'].to_numpy(dtype='float64')
+    depot = depot or (float(lat.mean()), float(lon.mean()))
+
+    teams = assign_technicians(lat, lon, depot, technicians)
+    deadline = time.perf_counter() + max_seconds
+    technician, position, legs = np.zeros(len(stops), dtype=int), np.zeros(len(stops), dtype=int), np.zeros(len(stops))
+    for team in np.unique(teams):
+        members = np.flatnonzero(teams == team)
+        # Index 0 is the depot
+        dist = distance_matrix(np.append(depot[0], lat[members]), np.append(depot[1], lon[members]))
+        order = two_opt(nearest_neighbour(dist), dist, deadline)
+        route = order[1:]
+        technician[members[route - 1]] = team + 1
+        position[members[route - 1]] = np.arange(1, len(route) + 1)
+        legs[members[route - 1]] = dist[order[:-1], order[1:]]
+
+    routed = stops.assign(technician=technician, stop=position, leg_km=legs.round(2))
+    return routed.sort_values(['technician', 'stop'], ignore_index=True)
+
+
+def route_summary(routes):
+    """Stops and kilometres per technician"""
+    return (
+        routes.groupby('technician', as_index=False)
+        .agg(stops=('stop', 'size'), km=('leg_km', 'sum'))
+        .assign(km=lambda frame: frame['km'].round(1))
+    )
+
+
+def scheduled_stops(conn, day):
+    """The ``Scheduled`` visits of one day"""
+    return pd.read_sql_query(f'''
+        SELECT {', '.join(STOP_COLUMNS)} FROM customers
+        WHERE service_status = 'Scheduled' AND visit_date = ?
+        ORDER BY id
+    ''', conn, params=(day.isoformat() if isinstance(day, date) else str(day),))
+
+
+def day_routes(manager, day, technicians=1, depot=None, max_seconds=TWO_OPT_SECONDS):
+    """Geocode and route a day's Scheduled visits
+
+    Returns (routes, unresolved): routed stops, and the stops whose
+    address the gazetteer could not place.
+    """
+    with manager.read() as conn:
+        stops = scheduled_stops(conn, day)
+    with manager.write() as conn:
+        coordinates = geocode(conn, stops['address'].tolist())
+    stops = stops.assign(lat=coordinates['lat'].to_numpy(), lon=coordinates['lon'].to_numpy(),
+                         source=coordinates['source'].to_numpy())
+    placed = stops['lat'].notna()
+    return plan_routes(stops[placed], technicians, depot, max_seconds), stops[~placed].reset_index(drop=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pestcore.routes', description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    plan_cmd = commands.add_parser('plan', help="route a day's Scheduled visits")
+    plan_cmd.add_argument('--date', type=date.fromisoformat, default=date.today())
+    plan_cmd.add_argument('--technicians', type=int, default=1)
+    plan_cmd.add_argument('--db', default='pestcontrol.db')
+
+    load_cmd = commands.add_parser('load-gazetteer', help='add places from a name,kind,lat,lon CSV')
+    load_cmd.add_argument('path')
+    load_cmd.add_argument('--replace', action='store_true', help='drop the existing entries first')
+    load_cmd.add_argument('--db', default='pestcontrol.db')
+
+    args = parser.parse_args(argv)
+    manager = ConnectionManager(args.db).check()
+    try:
+        if args.command == 'load-gazetteer':
+            with manager.write() as conn:
+                loaded = load_gazetteer(conn, args.path, args.replace)
+            print(f"Loaded {loaded:,} places")
+            return 0
+
+        started = time.perf_counter()
+        routes, unresolved = day_routes(manager, args.date, args.technicians)
+        for team, stops in routes.groupby('technician'):
+            print(f"Technician {team}: {len(stops)} stops, {stops['leg_km'].sum():.1f} km")
+            for stop in stops.itertuples():
+                print(f"  {stop.stop:>3}. #{stop.id} {stop.name} - {stop.address} ({stop.leg_km} km)")
+        if len(unresolved):
+            print(f"{len(unresolved)} stops could not be placed: {', '.join(map(str, unresolved['id']))}")
+        print(f"Planned in {time.perf_counter() - started:.2f}s")
+        return 0
+    finally:
+        manager.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""Server-side downsampling of trend series before they are charted
+
+Trend values are additive (jobs, revenue), so a long daily range is first
+binned into weeks, months, quarters or years: totals stay exact and the
+bin is the coarsest one the point budget needs. Series still over the
+budget are thinned with Largest-Triangle-Three-Buckets, which keeps the
+peaks and troughs a plain stride would drop.
+"""
+import numpy as np
+import pandas as pd
+
+# Most points drawn per chart line
+MAX_POINTS = 400
+
+# bin -> pandas period frequency, finest first
+BINS = {
+    'Week': 'W-SUN',
+    'Month': 'M',
+    'Quarter': 'Q',
+    'Year': 'Y',
+}
+
+
+def lttb(x, y, threshold):
+    """Indices of the ``threshold`` points of (x, y) that best keep its shape
+
+    Largest-Triangle-Three-Buckets: the first and last points are kept and
+    each bucket in between contributes the point forming the largest
+    triangle with the previous pick and the next bucket's mean.
+    """
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    picked = np.empty(threshold, dtype=int)
+    picked[0], picked[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        after = slice(stop, edges[bucket + 2] if bucket + 2 < len(edges) else n)
+        mean_x, mean_y = x[after].mean(), y[after].mean()
+        areas = np.abs(
+            (x[previous] - mean_x) * (y[start:stop] - y[previous])
+            - (x[previous] - x[start:stop]) * (mean_y - y[previous])
+        )
+        previous = start + int(areas.argmax())
+        picked[bucket + 1] = previous
+    return picked
+
+
+def bin_trend(trend_df, max_points=MAX_POINTS):
+    """A daily ``rollups.trend()`` frame binned to fit ``max_points`` periods
+
+    Returns the frame and the bin label, or the frame unchanged and None
+    when it already fits. Periods become each bin's first day.
+    """
+    periods = trend_df['period'].nunique()
+    if periods <= max_points:
+        return trend_df, None
+
+    days = pd.to_datetime(trend_df['period'], format='%Y-%m-%d')
+    for label, freq in BINS.items():
+        starts = days.dt.to_period(freq).dt.start_time
+        if starts.nunique() <= max_points or label == list(BINS)[-1]:
+            break
+    binned = (
+        trend_df.assign(period=starts.dt.strftime('%Y-%m-%d'))
+        .groupby(['period', 'group'], sort=True, as_index=False)[['jobs', 'revenue']].sum()
+    )
+    return binned, label
+
+
+def thin_series(periods, values, max_points=MAX_POINTS):
+    """(periods, values) of one line cut to ``max_points`` by LTTB"""
+    if len(values) <= max_points:
+        return periods, values
+    keep = lttb(np.arange(len(values)), values, max_points)
+    return [periods[i] for i in keep], [values[i] for i in keep]
@@ -0,0 +1,310 @@
+"""Recurring service visits and overdue payment sweeps, run off the render path
+
+``recurrences`` holds one rule per recurring contract: the visit it repeats,
+an interval in months and the next date due. ``expand_recurrences()`` turns
+rules due within the look-ahead window into ``Scheduled`` customers rows and
+advances them. ``sweep_overdue()`` keeps ``overdue_jobs`` in step with
+unpaid jobs older than the grace period. Each pass also folds rows written
+outside the page into the rollups, places new rows into customer entities
+(see ``pestcore.identity``) and rolls receivables aging buckets forward to
+the current date.
+
+Every step runs in short write transactions, batched where the work grows
+with the table, and ``Scheduler`` runs them on a daemon thread so page
+loads never wait on them.
+
+Passes run from the command line also rewrite the customers snapshot once
+edits or enough new rows have made it stale (see ``pestcore.snapshot``).
+That reads and digests the whole table, so the page's own scheduler leaves
+it to a ``serve`` process or a cron job rather than competing with the
+sessions it serves.
+
+    python -m pestcore.scheduler run-once --db pestcontrol.db
+    python -m pestcore.scheduler serve --db pestcontrol.db --every 300
+    python -m pestcore.scheduler rebuild-identities --db pestcontrol.db
+"""
+import argparse
+import calendar
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from pestcore.db import ConnectionManager
+from pestcore.identity import resolve_identities
+from pestcore.receivables import refresh_receivables, roll_forward
+from pestcore.rollups import refresh_rollups
+from pestcore.search import bulk_insert
+from pestcore.snapshot import refresh_snapshot
+
+# Label -> interval in months
+RECURRENCE_INTERVALS = {
+    'Quarterly': 3,
+    'Half-yearly': 6,
+    'Annually': 12,
+}
+
+# How far ahead recurring visits are created
+LOOKAHEAD_DAYS = 30
+
+# Unpaid jobs this many days past their visit are overdue
+OVERDUE_DAYS = 30
+
+# Statuses that never count as overdue: not done yet, or called off
+NOT_BILLABLE_STATUSES = ['Scheduled', 'Cancelled']
+
+RECURRENCE_BATCH_SIZE = 500
+SWEEP_BATCH_SIZE = 50_000
+IDENTITY_BATCH_SIZE = 50_000
+
+RUN_EVERY_SECONDS = 300
+
+
+def add_months(day, months):
+    """``day`` moved by whole months, clamped to the end of shorter months"""
+    month = day.month - 1 + months
+    year, month = day.year + month // 12, month % 12 + 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def add_recurrence(manager, customer_id, every_months, start=None, until=None):
+    """Repeat a visit every ``every_months`` months; returns the rule id
+
+    The first generated visit falls on ``start``, by default one interval
+    after the template visit.
+    """
+    with manager.write() as conn:
+        return insert_recurrence(conn, customer_id, every_months, start, until)
+
+
+def insert_recurrence(conn, customer_id, every_months, start=None, until=None):
+    """``add_recurrence()`` on an already open write transaction"""
+    row = conn.execute("SELECT visit_date FROM customers WHERE id = ?", (int(customer_id),)).fetchone()
+    if row is None:
+        raise LookupError(f"Record {customer_id} does not exist")
+    if start is None:
+        start = add_months(date.fromisoformat(row[0][:10]), every_months)
+    return conn.execute('''
+        INSERT INTO recurrences (customer_id, every_months, next_date, until, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (
+        int(customer_id), int(every_months), start.isoformat(),
+        until.isoformat() if until else None, datetime.now().isoformat(timespec='seconds'),
+    )).lastrowid
+
+
+def expand_recurrences(manager, today=None, lookahead_days=LOOKAHEAD_DAYS, batch_size=RECURRENCE_BATCH_SIZE):
+    """Create the Scheduled visits due within the look-ahead window
+
+    Rules are processed ``batch_size`` at a time in id order. Visits missed
+    while the scheduler was not running are caught up. Rules whose template
+    visit was deleted, or which ran past ``until``, are deactivated.
+    Returns counts of rules seen and visits created.
+    """
+    today = today or date.today()
+    horizon = (today + timedelta(days=lookahead_days)).isoformat()
+    stats = {'rules': 0, 'visits': 0, 'finished': 0}
+    after = 0
+
+    while True:
+        with manager.write() as conn:
+            rules = conn.execute('''
+                SELECT r.id, r.every_months, r.next_date, r.until,
+                       c.id, c.name, c.phone, c.address, c.service, c.amount
+                FROM recurrences AS r LEFT JOIN customers AS c ON c.id = r.customer_id
+                WHERE r.active = 1 AND r.next_date <= ? AND r.id > ?
+                ORDER BY r.id LIMIT ?
+            ''', (horizon, after, batch_size)).fetchall()
+            if not rules:
+                break
+
+            visits, advanced, finished = [], [], []
+            for rule_id, every, next_date, until, template_id, *template in rules:
+                if template_id is None:
+                    finished.append((rule_id,))
+                    continue
+                due = date.fromisoformat(next_date)
+                while due.isoformat() <= horizon and (until is None or due.isoformat() <= until):
+                    name, phone, address, service, amount = template
+                    visits.append((name, phone, address, service, due.isoformat(), amount))
+                    due = add_months(due, every)
+                if until is not None and due.isoformat() > until:
+                    finished.append((rule_id,))
+                else:
+                    advanced.append((due.isoformat(), rule_id))
+
+            with bulk_insert(conn):
+                conn.executemany('''
+                    INSERT INTO customers (name, phone, address, service, visit_date, amount,
+                                           paid, payment_method, service_status)
+                    VALUES (?, ?, ?, ?, ?, ?, 0, 'Pending', 'Scheduled')
+                ''', visits)
+            conn.executemany("UPDATE recurrences SET next_date = ? WHERE id = ?", advanced)
+            conn.executemany("UPDATE recurrences SET active = 0 WHERE id = ?", finished)
+
+        stats['rules'] += len(rules)
+        stats['visits'] += len(visits)
+        stats['finished'] += len(finished)
+        after = rules[-1][0]
+    return stats
+
+
+def sweep_overdue(manager, today=None, overdue_days=OVERDUE_DAYS, batch_size=SWEEP_BATCH_SIZE):
+    """Flag unpaid jobs older than ``overdue_days`` and clear settled ones
+
+    Walks customers in id ranges of ``batch_size``, one write transaction
+    per range. Returns counts of newly flagged and cleared jobs.
+    """
+    today = today or date.today()
+    cutoff = (today - timedelta(days=overdue_days)).isoformat()
+    now = datetime.now().isoformat(timespec='seconds')
+    overdue = f'''
+        paid = 0 AND visit_date < ?
+        AND coalesce(service_status, '') NOT IN ({', '.join('?' for _ in NOT_BILLABLE_STATUSES)})
+    '''
+    stats = {'flagged': 0, 'cleared': 0}
+
+    with manager.read() as conn:
+        top = conn.execute(
+            "SELECT max(coalesce((SELECT MAX(id) FROM customers), 0), "
+            "coalesce((SELECT MAX(customer_id) FROM overdue_jobs), 0))"
+        ).fetchone()[0]
+
+    for low in range(0, top + 1, batch_size):
+        high = low + batch_size - 1
+        params = [low, high, cutoff] + NOT_BILLABLE_STATUSES
+        with manager.write() as conn:
+            stats['cleared'] += conn.execute(f'''
+                DELETE FROM overdue_jobs
+                WHERE customer_id BETWEEN ? AND ?
+                AND customer_id NOT IN (SELECT id FROM customers WHERE id BETWEEN ? AND ? AND {overdue})
+            ''', [low, high] + params).rowcount
+            stats['flagged'] += conn.execute(f'''
+                INSERT OR IGNORE INTO overdue_jobs (customer_id, flagged_at)
+                SELECT id, ? FROM customers WHERE id BETWEEN ? AND ? AND {overdue}
+            ''', [now] + params).rowcount
+    return stats
+
+
+def overdue_summary(conn):
+    """Number of overdue jobs and the amount outstanding on them"""
+    count, amount = conn.execute('''
+        SELECT COUNT(*), TOTAL(c.amount)
+        FROM overdue_jobs AS o JOIN customers AS c ON c.id = o.customer_id
+    ''').fetchone()
+    return {'count': count, 'amount': amount}
+
+
+def resolve_new_identities(manager, batch_size=IDENTITY_BATCH_SIZE):
+    """Place rows added since the last pass into customer entities
+
+    One write transaction per ``batch_size`` rows, so a first pass over a
+    large table never holds the write lock for long.
+    """
+    stats = {'rows': 0, 'merged': 0}
+    while True:
+        with manager.write() as conn:
+            batch = resolve_identities(conn, batch_size=batch_size, max_batches=1)
+        stats['rows'] += batch['rows']
+        stats['merged'] += batch['merged']
+        if batch['rows'] < batch_size:
+            return stats
+
+
+def roll_receivables(manager, today=None):
+    """Move receivables aging buckets to today; returns the days moved"""
+    with manager.write() as conn:
+        days = roll_forward(conn, today)
+        refresh_receivables(conn, today)
+    return days
+
+
+def fold_rollups(manager):
+    """Fold rows above the rollup high-water mark, e.g. from CLI writes; returns ids covered"""
+    with manager.write() as conn:
+        return refresh_rollups(conn)
+
+
+def run_once(manager, today=None, snapshot=False):
+    """One scheduler pass: recurrences, overdue sweep, rollups, identities, receivables aging
+
+    With ``snapshot`` the customers snapshot is refreshed too.
+    """
+    started = time.perf_counter()
+    result = {
+        'recurrences': expand_recurrences(manager, today),
+        'overdue': sweep_overdue(manager, today),
+        'rollups': fold_rollups(manager),
+        'identities': resolve_new_identities(manager),
+        'receivables': roll_receivables(manager, today),
+    }
+    if snapshot:
+        result['snapshot'] = refresh_snapshot(manager)
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    return result
+
+
+class Scheduler:
+    """Runs ``run_once()`` every ``every`` seconds on a daemon thread"""
+
+    def __init__(self, manager, every=RUN_EVERY_SECONDS):
+        self.manager = manager
+        self.every = every
+        self.last_run = None
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name='pestcore-scheduler', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.last_run = dict(run_once(self.manager), finished=datetime.now().isoformat(timespec='seconds'))
+                self.last_error = None
+            except Exception as e:
+                # Keep the worker alive; the next pass retries
+                self.last_error = repr(e)
+            self._stop.wait(self.every)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pestcore.scheduler', description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['run-once', 'serve', 'rebuild-identities'])
+    parser.add_argument('--db', default='pestcontrol.db')
+    parser.add_argument('--every', type=float, default=RUN_EVERY_SECONDS, help='seconds between passes for "serve"')
+    args = parser.parse_args(argv)
+
+    manager = ConnectionManager(args.db).check()
+    try:
+        if args.command == 'run-once':
+            print(run_once(manager, snapshot=True))
+            return 0
+        if args.command == 'rebuild-identities':
+            # Picks up edited names and phones; holds the write lock throughout
+            started = time.perf_counter()
+            with manager.write() as conn:
+                stats = resolve_identities(conn, rebuild=True)
+            print(f"Resolved {stats['rows']:,} rows in {time.perf_counter() - started:.1f}s")
+            return 0
+        while True:
+            print(run_once(manager, snapshot=True), flush=True)
+            time.sleep(args.every)
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        manager.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,233 @@
+"""Full-text customer search over name, phone and address
+
+``customers_fts`` is an FTS5 table keyed by ``customers.id`` and kept in
+sync by triggers on insert, update and delete. Phone numbers are indexed
+as their digits plus every trailing run of digits, so "+91 98765 43210",
+"9876543210" and "3210" all find the same customer.
+
+Bulk loads wrap their inserts in ``bulk_insert()``, which pauses the
+insert trigger and indexes the new rows set-wise instead; FTS5 is several
+times slower fed one row per trigger firing.
+
+    python -m pestcore.search query "sharma 3210" --db pestcontrol.db
+    python -m pestcore.search rebuild --db pestcontrol.db
+"""
+import argparse
+import re
+import sqlite3
+import sys
+from contextlib import contextmanager
+
+import pandas as pd
+
+FTS_TABLE = 'customers_fts'
+
+# Characters people type inside phone numbers
+PHONE_SEPARATORS = [' ', '-', '(', ')', '.', '+', '/']
+
+# Trailing digit runs indexed per phone: "last 4 digits" up to the
+# 10-digit national number
+PHONE_SUFFIXES = range(4, 11)
+
+# Result ranking weights for name, phone and address matches
+RANK_WEIGHTS = (10.0, 5.0, 1.0)
+
+SEARCH_LIMIT = 20
+
+# Only the newest matches are ranked, so a very common term costs the same
+# as a rare one
+RANK_CANDIDATES = 2000
+
+
+def normalize_phone(value):
+    """Digits of a phone number, as indexed"""
+    return re.sub(r'\D', '', value or '')
+
+
+def _phone_digits(r):
+    expr = f"coalesce({r}.phone, '')"
+    for separator in PHONE_SEPARATORS:
+        expr = f"replace({expr}, '{separator}', '')"
+    return expr
+
+
+def _phone_tokens(d):
+    """SQL for phone digits ``d`` followed by their trailing runs"""
+    return " || ' ' || ".join([d] + [f"substr({d}, -{n})" for n in PHONE_SUFFIXES])
+
+
+def _insert_sql(r):
+    return f'''
+        INSERT INTO {FTS_TABLE} (rowid, name, phone, address)
+        SELECT {r}.id, coalesce({r}.name, ''), {_phone_tokens('d')}, coalesce({r}.address, '')
+        FROM (SELECT {_phone_digits(r)} AS d);
+    '''
+
+
+def _index_select(where):
+    # Materialized so the digits are computed once per row, not once per token
+    return f'''
+        WITH phones AS MATERIALIZED (
+            SELECT c.id, c.name, {_phone_digits('c')} AS d, c.address
+            FROM customers AS c WHERE {where}
+        )
+        INSERT INTO {FTS_TABLE} (rowid, name, phone, address)
+        SELECT id, coalesce(name, ''), {_phone_tokens('d')}, coalesce(address, '')
+        FROM phones
+    '''
+
+
+def create_search_index(conn):
+    """FTS table and the triggers that mirror customers into it"""
+    conn.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+            name, phone, address,
+            tokenize = "unicode61 remove_diacritics 2",
+            prefix = '2 3'
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS search_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            bulk INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO search_state (id, bulk) VALUES (1, 0)")
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS customers_fts_insert AFTER INSERT ON customers
+        WHEN (SELECT bulk FROM search_state WHERE id = 1) = 0
+        BEGIN {_insert_sql('new')} END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS customers_fts_delete AFTER DELETE ON customers
+        BEGIN DELETE FROM {FTS_TABLE} WHERE rowid = old.id; END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS customers_fts_update AFTER UPDATE OF id, name, phone, address ON customers
+        BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+            {_insert_sql('new')}
+        END
+    ''')
+
+
+def rebuild_search_index(conn):
+    """Repopulate the FTS table from customers (inside a write transaction)
+
+    Returns the number of rows indexed.
+    """
+    create_search_index(conn)
+    conn.execute(f"DELETE FROM {FTS_TABLE}")
+    conn.execute(_index_select('1'))
+    conn.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    return conn.execute(f"SELECT COUNT(*) FROM {FTS_TABLE}").fetchone()[0]
+
+
+@contextmanager
+def bulk_insert(conn):
+    """Index rows appended inside the block in one statement at its end
+
+    Must run inside the write transaction doing the inserts, so other
+    connections never see the trigger paused. A no-op before the search
+    migration has run.
+    """
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'search_state'").fetchone():
+        yield
+        return
+    start = conn.execute("SELECT coalesce(MAX(id), 0) FROM customers").fetchone()[0]
+    conn.execute("UPDATE search_state SET bulk = 1 WHERE id = 1")
+    yield
+    conn.execute(_index_select('c.id > ?'), (start,))
+    conn.execute("UPDATE search_state SET bulk = 0 WHERE id = 1")
+
+
+def match_expression(text):
+    """FTS5 MATCH expression for free-text input, or None if nothing is searchable
+
+    Every term must match as a prefix. Digit terms search phones and
+    addresses, other terms names and addresses. A query that is only a
+    phone number, however it is spaced, is searched as one number: its
+    last 10 digits, which every indexed phone carries as a token, so a
+    country code on either side does not matter.
+    """
+    text = (text or '').strip()
+    if not text:
+        return None
+
+    digits = normalize_phone(text)
+    if digits and not re.sub(rf"[\d{re.escape(''.join(PHONE_SEPARATORS))}]", '', text):
+        return f'{{phone address}} : "{digits[-PHONE_SUFFIXES[-1]:]}"*'
+
+    terms = []
+    for word in re.findall(r'\w+', text):
+        if word.isdigit():
+            terms.append(f'{{phone address}} : "{word}"*')
+        else:
+            terms.append(f'{{name address}} : "{word}"*')
+    return ' AND '.join(terms) or None
+
+
+def search_customers(conn, text, limit=SEARCH_LIMIT, columns=('id', 'name', 'phone', 'address', 'service', 'visit_date')):
+    """Best-ranked customers for free-text input, as a DataFrame
+
+    Ranks the newest ``RANK_CANDIDATES`` matches by bm25, weighting name
+    hits above phone and address hits.
+    """
+    expression = match_expression(text)
+    if expression is None:
+        return pd.DataFrame(columns=list(columns) + ['rank'])
+    weights = ', '.join(str(weight) for weight in RANK_WEIGHTS)
+    return pd.read_sql_query(f'''
+        SELECT {', '.join(f'c.{col}' for col in columns)}, hits.rank
+        FROM (
+            SELECT rowid, bm25({FTS_TABLE}, {weights}) AS rank
+            FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ?
+            ORDER BY rowid DESC LIMIT ?
+        ) AS hits
+        JOIN customers AS c ON c.id = hits.rowid
+        ORDER BY hits.rank, hits.rowid DESC
+        LIMIT ?
+    ''', conn, params=(expression, RANK_CANDIDATES, int(limit)))
+
+
+def check_search_index(conn):
+    """Ids present in only one of customers and the FTS table"""
+    missing = [row[0] for row in conn.execute(
+        f"SELECT id FROM customers EXCEPT SELECT rowid FROM {FTS_TABLE}"
+    )]
+    stale = [row[0] for row in conn.execute(
+        f"SELECT rowid FROM {FTS_TABLE} EXCEPT SELECT id FROM customers"
+    )]
+    return missing, stale
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pestcore.search', description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['query', 'rebuild', 'check'])
+    parser.add_argument('text', nargs='?', default='', help='search text for "query"')
+    parser.add_argument('--db', default='pestcontrol.db')
+    parser.add_argument('--limit', type=int, default=SEARCH_LIMIT)
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    try:
+        if args.command == 'query':
+            results = search_customers(conn, args.text, args.limit)
+            print(results.to_string(index=False) if not results.empty else "No matches")
+            return 0 if not results.empty else 1
+
+        if args.command == 'check':
+            missing, stale = check_search_index(conn)
+            print(f"{len(missing)} customers missing from the index, {len(stale)} stale index rows")
+            return 1 if missing or stale else 0
+
+        conn.execute("BEGIN IMMEDIATE")
+        indexed = rebuild_search_index(conn)
+        conn.execute("COMMIT")
+        print(f"Indexed {indexed:,} customers")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,344 @@
+"""Memory-mapped Arrow snapshot of the customers table
+
+Decoding SQLite rows into a DataFrame is most of a cold start on a large
+table. ``write_snapshot()`` materializes ``customers`` into an
+uncompressed Arrow IPC file next to the database, already in the cache's
+compact dtypes, and ``read_snapshot()`` memory-maps it, so only the pages
+of the projected columns are read. Parquet was passed over because its
+pages have to be decoded before use.
+
+Not everything stays in the mapping. With pandas 3, string columns come
+out as Arrow-backed ``str`` columns that point into the mapped file, and
+every process serving the page shares those pages through the OS cache.
+Numeric, date, ``paid`` and categorical columns are copied out by
+``to_pandas()``, and amounts are narrowed to float32 on top. On a
+1M-row snapshot, the 123 MB frame costs about 65 MB of private memory.
+pandas 2 decodes strings into Python objects, so there the whole frame
+is private.
+
+A snapshot records the state it was taken at: the high-water ``id``, the
+``records`` change counter (bumped by every edit and delete, see
+``pestcore.edits``) and the cache's per-bucket row digests. It stays
+usable while only inserts have happened since; ``load_frame()`` then
+appends the rows above the high-water id from SQLite. An edit or delete
+makes it stale until the next one is written.
+
+Writing reads and digests the whole table (about 12s for 1M rows), so the
+page never does it. ``python -m pestcore.scheduler serve`` refreshes the
+snapshot on each pass, or cron can run the ``refresh`` command below,
+which only rewrites a snapshot that is stale or far enough behind.
+
+Files are written under a temporary name and moved into place with
+``os.replace``, so a reader opens either the old snapshot or the new one,
+never a partial file. A reader still mapping the old file keeps it until
+it lets go.
+
+    python -m pestcore.snapshot write --db pestcontrol.db
+    python -m pestcore.snapshot refresh --db pestcontrol.db
+    python -m pestcore.snapshot show --db pestcontrol.db
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from pestcore.data import (
+    BUCKET_SIZE, CATEGORICAL_COLUMNS, LAZY_COLUMNS, LEGACY_STATUSES, CustomerCache,
+    compact_frame, merge_frames, prepare_frame, records_version, table_digest,
+)
+from pestcore.db import ConnectionManager
+
+SNAPSHOT_SUFFIX = '.snapshot.arrow'
+
+# Bumped whenever the file layout or metadata changes
+SNAPSHOT_FORMAT = 1
+
+# Schema metadata key holding the snapshot state
+META_KEY = b'pestcore.snapshot'
+
+# Rows per SQLite fetch and per Arrow record batch
+CHUNK_ROWS = 100_000
+
+# Rows inserted since the snapshot before the scheduler rewrites it anyway;
+# below this, reading them from SQLite costs less than a rewrite
+STALE_ROWS = 50_000
+
+# Youngest snapshot the scheduler replaces: a rewrite costs a full table
+# read, and a stale snapshot only slows the next process start
+MIN_AGE_SECONDS = 900
+
+
+def snapshot_path(db_path):
+    """Snapshot file kept alongside a database"""
+    return db_path + SNAPSHOT_SUFFIX
+
+
+def _pyarrow():
+    """pyarrow and pyarrow.ipc, imported only when snapshots are used"""
+    try:
+        import pyarrow
+        import pyarrow.ipc
+    except ImportError:
+        raise RuntimeError("Snapshots need pyarrow (pip install pyarrow)")
+    return pyarrow, pyarrow.ipc
+
+
+def available():
+    """Whether pyarrow is installed, so snapshots can be written and read"""
+    try:
+        _pyarrow()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _schema(conn, meta):
+    """Arrow schema for the customers table, carrying the snapshot state"""
+    pa, _ = _pyarrow()
+    declared = {row[1]: (row[2] or '').upper() for row in conn.execute('PRAGMA table_info(customers)')}
+    types = {'INTEGER': pa.int64(), 'REAL': pa.float64()}
+    fields = []
+    for col in meta['columns']:
+        if col in CATEGORICAL_COLUMNS:
+            kind = pa.dictionary(pa.int32(), pa.large_string())
+        elif col == 'visit_date':
+            kind = pa.timestamp('us')
+        elif col == 'paid':
+            kind = pa.bool_()
+        else:
+            kind = types.get(declared[col], pa.large_string())
+        fields.append((col, kind))
+    return pa.schema(fields, metadata={META_KEY: json.dumps(meta)})
+
+
+def _categories(conn, hwm):
+    """Every value of each categorical column, so all batches share one dictionary"""
+    categories = {}
+    for col in CATEGORICAL_COLUMNS:
+        values = [row[0] for row in conn.execute(
+            f'SELECT DISTINCT "{col}" FROM customers WHERE id <= ? AND "{col}" IS NOT NULL', (hwm,)
+        )]
+        if col == 'service_status':
+            values = [LEGACY_STATUSES.get(value, value) for value in values]
+        categories[col] = sorted(set(values))
+    return categories
+
+
+def _frames(conn, hwm, chunk_rows):
+    """Prepared frames of every row up to ``hwm``, newest first"""
+    categories = _categories(conn, hwm)
+    chunks = pd.read_sql_query('SELECT * FROM customers WHERE id <= ? ORDER BY id DESC', conn,
+                               params=(hwm,), chunksize=chunk_rows)
+    for chunk in chunks:
+        # Amounts stay exact on disk; readers narrow them for the whole table at once
+        amount = chunk['amount'].astype('float64')
+        frame = prepare_frame(chunk).assign(amount=amount)
+        for col in CATEGORICAL_COLUMNS:
+            frame[col] = frame[col].astype('category').cat.set_categories(categories[col])
+        yield frame
+
+
+def write_snapshot(conn, path, chunk_rows=CHUNK_ROWS):
+    """Write the customers table to a new snapshot at ``path``; returns its metadata
+
+    Reads inside one transaction, so the rows, counter and digests agree.
+    """
+    pa, ipc = _pyarrow()
+    started = time.perf_counter()
+    partial = path + '.part'
+    conn.execute("BEGIN")
+    try:
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(customers)')]
+        hwm = conn.execute("SELECT COALESCE(MAX(id), 0) FROM customers").fetchone()[0]
+        meta = {
+            'format': SNAPSHOT_FORMAT,
+            'columns': columns,
+            'hwm': hwm,
+            'rows': conn.execute("SELECT COUNT(*) FROM customers WHERE id <= ?", (hwm,)).fetchone()[0],
+            'records': records_version(conn),
+            'digests': [[bucket, count, crc] for bucket, (count, crc)
+                        in sorted(table_digest(conn, 'customers', columns, 0, hwm).items())],
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        schema = _schema(conn, meta)
+        with open(partial, 'wb') as handle:
+            with ipc.new_file(handle, schema) as writer:
+                for frame in _frames(conn, hwm, chunk_rows):
+                    writer.write_batch(pa.RecordBatch.from_pandas(frame, schema=schema, preserve_index=False))
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(partial, path)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    finally:
+        conn.rollback()
+    meta['seconds'] = round(time.perf_counter() - started, 3)
+    return meta
+
+
+def snapshot_meta(path):
+    """State recorded in the snapshot at ``path``, or None when there is none"""
+    pa, ipc = _pyarrow()
+    try:
+        source = pa.memory_map(path)
+    except FileNotFoundError:
+        return None
+    with source:
+        return json.loads(ipc.open_file(source).schema.metadata[META_KEY])
+
+
+def read_snapshot(path, columns=None):
+    """Memory-map the snapshot at ``path``: (frame, meta), or None when there is none
+
+    Only the ``columns`` asked for are touched. Arrow-backed string columns
+    point into the mapping, so the frame keeps the file mapped while it
+    lives; the other columns are copies.
+    """
+    pa, ipc = _pyarrow()
+    try:
+        source = pa.memory_map(path)
+    except FileNotFoundError:
+        return None
+    reader = ipc.open_file(source)
+    meta = json.loads(reader.schema.metadata[META_KEY])
+    table = reader.read_all()
+    if columns is not None:
+        table = table.select(columns)
+    frame = table.to_pandas(types_mapper={pa.bool_(): pd.BooleanDtype()}.get)
+    return frame, meta
+
+
+def is_current(conn, meta):
+    """Whether a snapshot still holds every row up to its high-water id, unchanged
+
+    True when only inserts have happened since it was written. The row
+    count and the digest of its newest bucket tie it to this database, in
+    case the file sits next to a different one.
+    """
+    if meta is None or meta.get('format') != SNAPSHOT_FORMAT:
+        return False
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(customers)')]
+    if columns != meta['columns'] or records_version(conn) != meta['records']:
+        return False
+    hwm = meta['hwm']
+    if conn.execute("SELECT COUNT(*) FROM customers WHERE id <= ?", (hwm,)).fetchone()[0] != meta['rows']:
+        return False
+    if not meta['digests']:
+        return True
+    bucket, count, crc = meta['digests'][-1]
+    return table_digest(conn, 'customers', columns, bucket * BUCKET_SIZE, hwm).get(bucket) == (count, crc)
+
+
+def load_frame(conn, path, columns=None):
+    """Snapshot rows plus newer rows from SQLite, newest first: (frame, meta)
+
+    Returns None when there is no current snapshot. ``columns`` defaults to
+    every column; the frame is compacted like the customer cache's.
+    """
+    # Checked against the mapped file itself, which a rotation cannot swap out
+    loaded = read_snapshot(path, columns)
+    if loaded is None or not is_current(conn, loaded[1]):
+        return None
+    frame, meta = loaded
+    selected = ', '.join(f'"{col}"' for col in (columns or meta['columns']))
+    newer = pd.read_sql_query(f'SELECT {selected} FROM customers WHERE id > ? ORDER BY id DESC',
+                              conn, params=(meta['hwm'],))
+    parts = [prepare_frame(newer)] if not newer.empty else []
+    return merge_frames(parts + [compact_frame(frame)]), meta
+
+
+class SnapshotCache(CustomerCache):
+    """``CustomerCache`` whose full loads start from a current snapshot
+
+    Falls back to reading SQLite when pyarrow is missing or the snapshot
+    is absent or stale.
+    """
+
+    def __init__(self, db_path, path=None):
+        super().__init__(db_path)
+        self.path = path or snapshot_path(db_path)
+
+    def _full_load(self, conn):
+        loaded = None
+        if available():
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(customers)')]
+            loaded = load_frame(conn, self.path, [col for col in columns if col not in LAZY_COLUMNS])
+        if loaded is None:
+            return super()._full_load(conn)
+
+        frame, meta = loaded
+        self._columns = meta['columns']
+        self._records = meta['records']
+        self._hwm = int(frame['id'].max()) if not frame.empty else 0
+        self._digests = {bucket: (count, crc) for bucket, count, crc in meta['digests']}
+        if self._hwm > meta['hwm']:
+            # Digest the buckets the rows read from SQLite landed in
+            low = meta['hwm'] + 1
+            self._digests.update(self._digest(conn, low // BUCKET_SIZE * BUCKET_SIZE, self._hwm))
+        self.frame = frame
+        self.last_refresh = {'kind': 'snapshot', 'rows': len(frame), 'snapshot_rows': meta['rows']}
+
+
+def refresh_snapshot(manager, path=None, stale_rows=STALE_ROWS, min_age=MIN_AGE_SECONDS):
+    """Rewrite the snapshot if missing, stale, or ``stale_rows`` behind; returns rows written
+
+    A snapshot younger than ``min_age`` seconds is kept either way. A no-op
+    without pyarrow.
+    """
+    if not available():
+        return 0
+    path = path or snapshot_path(manager.db_path)
+    with manager.read() as conn:
+        meta = snapshot_meta(path)
+        if meta is not None:
+            age = (datetime.now() - datetime.fromisoformat(meta['created_at'])).total_seconds()
+            if age < min_age:
+                return 0
+            if is_current(conn, meta):
+                top = conn.execute("SELECT COALESCE(MAX(id), 0) FROM customers").fetchone()[0]
+                if top - meta['hwm'] < stale_rows:
+                    return 0
+        return write_snapshot(conn, path)['rows']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pestcore.snapshot', description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['write', 'refresh', 'show'])
+    parser.add_argument('--db', default='pestcontrol.db')
+    parser.add_argument('--out', help='snapshot file (default: next to the database)')
+    args = parser.parse_args(argv)
+
+    path = args.out or snapshot_path(args.db)
+    manager = ConnectionManager(args.db).check()
+    try:
+        if args.command == 'refresh':
+            rows = refresh_snapshot(manager, path)
+            print(f"Wrote {rows:,} rows to {path}" if rows else f"{path} is current")
+            return 0
+        with manager.read() as conn:
+            if args.command == 'write':
+                meta = write_snapshot(conn, path)
+                print(f"Wrote {meta['rows']:,} rows up to id {meta['hwm']} to {path} in {meta['seconds']}s")
+                return 0
+
+            meta = snapshot_meta(path)
+            if meta is None:
+                print(f"No snapshot at {path}")
+                return 1
+            size = os.path.getsize(path) / 1024 / 1024
+            state = 'current' if is_current(conn, meta) else 'stale'
+            print(f"{path}: {meta['rows']:,} rows up to id {meta['hwm']}, {size:.1f} MB, "
+                  f"written {meta['created_at']}, {state}")
+            return 0
+    finally:
+        manager.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,345 @@
+"""Reproducible synthetic customers databases for load testing
+
+Rows follow the shape of a real Pune pest-control book rather than uniform
+noise:
+
+- volume grows year on year, rises through the monsoon and drops on Sundays
+- services and prices follow fixed shares; mosquito work peaks in the monsoon
+- visits after ``today`` are Scheduled; recent jobs may still be Ongoing
+- payment arrives over the weeks after a job, so unpaid work is mostly recent
+- customers come back: a small share of households books most of the visits,
+  with the phone written in different ways from one booking to the next
+
+Rows are generated in chunks with numpy and inserted into a bare
+``customers`` table in visit-date order. The remaining migrations then
+build indexes, search, rollups and the receivables ledger set-wise, so
+even 10M rows never sit in memory at once. The same seed, size and
+``--today`` always give the same database.
+
+``seed_database()``, ``random_row()`` and ``synthetic_frame()`` make
+uniformly random rows instead, for benchmarks and tests that only need
+volume.
+
+    python -m pestcore.synthetic --rows 1m --out synthetic-1m.db
+"""
+import argparse
+import csv
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from pestcore.geocode import BUNDLED_GAZETTEER
+from pestcore.migrations import migrate
+from pestcore.search import bulk_insert
+from pestcore.writequeue import RECORD_COLUMNS
+
+# Named sizes accepted by --rows
+SIZES = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+
+# Rows built and inserted per transaction
+CHUNK_ROWS = 200_000
+
+# Years of history before ``today``, and days of Scheduled work after it
+HISTORY_YEARS = 5
+SCHEDULED_DAYS = 30
+
+# Year-on-year growth in visits
+YEARLY_GROWTH = 1.25
+
+# Relative volume by month (Jan..Dec): the monsoon brings the pests
+MONTH_VOLUME = [0.8, 0.8, 0.9, 1.0, 1.1, 1.3, 1.4, 1.4, 1.3, 1.1, 0.9, 0.8]
+
+# Relative volume by weekday (Mon..Sun)
+WEEKDAY_VOLUME = [1.0, 1.0, 1.0, 1.0, 1.0, 0.9, 0.4]
+
+# Service -> (share of visits, median price in rupees)
+SERVICES = {
+    'General Pest Control': (0.32, 1500),
+    'Mosquito Control': (0.16, 1200),
+    'Cockroach Treatment': (0.16, 1100),
+    'Termite Treatment': (0.12, 4500),
+    'Rodent Control': (0.11, 1800),
+    'Ant Control': (0.08, 900),
+    'Other': (0.05, 2000),
+}
+
+# Extra share of monsoon visits that are mosquito work
+MONSOON_MONTHS = [6, 7, 8, 9]
+MONSOON_MOSQUITO_SHARE = 0.15
+
+# Spread of prices around the median (sigma of the log)
+PRICE_SPREAD = 0.35
+
+# How payments are made, and the share of unpaid jobs already marked Pending
+PAYMENT_METHODS = {'UPI': 0.45, 'Cash': 0.25, 'Bank Transfer': 0.18, 'Credit Card': 0.12}
+UNPAID_PENDING_SHARE = 0.85
+
+# Completed jobs: share paid at once, and days over which the rest come in
+PAID_ON_COMPLETION = 0.4
+PAYMENT_DAYS = 20
+BAD_DEBT_SHARE = 0.02
+
+# Past jobs: share cancelled, never updated from Scheduled, or still Ongoing
+CANCELLED_SHARE = 0.04
+STALE_SCHEDULED_SHARE = 0.01
+ONGOING_DAYS = 14
+ONGOING_SHARE = 0.3
+
+# Households per visit, and how strongly bookings concentrate on a few
+CUSTOMERS_PER_ROW = 0.45
+REPEAT_SKEW = 1.6
+
+# Phone spellings: '+91 98220 12345', '9822012345', '09822012345'
+PHONE_FORMATS = [0.6, 0.3, 0.1]
+
+FIRST_NAMES = [
+    'Aarav', 'Aditi', 'Akshay', 'Amit', 'Ananya', 'Anil', 'Anjali', 'Arjun', 'Deepa', 'Ganesh',
+    'Gauri', 'Harish', 'Ishaan', 'Jyoti', 'Kavita', 'Kiran', 'Mahesh', 'Manisha', 'Meera', 'Nikhil',
+    'Neha', 'Omkar', 'Pooja', 'Prakash', 'Priya', 'Rahul', 'Rajesh', 'Rohan', 'Sachin', 'Sakshi',
+    'Sandeep', 'Shweta', 'Siddharth', 'Sneha', 'Sunil', 'Swati', 'Tanvi', 'Varun', 'Vikram', 'Vaishali',
+]
+LAST_NAMES = [
+    'Agarwal', 'Bhosale', 'Chavan', 'Deshmukh', 'Deshpande', 'Gaikwad', 'Ghosh', 'Gupta', 'Iyer', 'Jadhav',
+    'Jain', 'Joshi', 'Kadam', 'Kale', 'Kharat', 'Kulkarni', 'Kumar', 'Mehta', 'More', 'Nair',
+    'Naik', 'Patil', 'Pawar', 'Rao', 'Reddy', 'Sawant', 'Shah', 'Shinde', 'Singh', 'Thakur',
+]
+BUILDINGS = [
+    'Sai Heights', 'Ganga Residency', 'Shanti Apartments', 'Om Society', 'Krishna Kunj', 'Sunshine Towers',
+    'Green Acres', 'Silver Oak', 'Mayur Park', 'Vrindavan', 'Lake View', 'Royal Enclave', 'Shivneri',
+    'Anand Nagar', 'Kohinoor Estate', 'Blue Ridge', 'Yashwant Nagar', 'Pearl Residency', 'Tulsi Vihar', 'Amba Niwas',
+]
+
+# Value pools of the uniformly random rows
+RANDOM_SERVICES = ['General', 'Termite', 'Rodent', 'Mosquito', 'Other']
+RANDOM_STATUSES = ['Completed', 'Ongoing', 'Cancelled', 'Scheduled']
+RANDOM_METHODS = ['Cash', 'UPI', 'Bank', 'Other', 'Pending']
+
+INSERT_SQL = f'''
+    INSERT INTO customers ({', '.join(RECORD_COLUMNS)})
+    VALUES ({', '.join('?' for _ in RECORD_COLUMNS)})
+'''
+
+
+def parse_rows(value):
+    """Row count from '10k', '1m', '10m' or a plain number"""
+    value = str(value).strip().lower().replace('_', '').replace(',', '')
+    if value in SIZES:
+        return SIZES[value]
+    return int(value)
+
+
+def localities(path=BUNDLED_GAZETTEER):
+    """Locality names from the gazetteer, so generated addresses geocode"""
+    with open(path, newline='', encoding='utf-8') as handle:
+        return [row['name'].title() for row in csv.DictReader(handle) if row['kind'] == 'locality']
+
+
+def _weights(values):
+    weights = np.asarray(values, dtype='float64')
+    return weights / weights.sum()
+
+
+def visit_days(rows, rng, today):
+    """Sorted day offsets from the first history day, following the volume curves"""
+    start = today - timedelta(days=365 * HISTORY_YEARS)
+    days = pd.date_range(start, today + timedelta(days=SCHEDULED_DAYS), freq='D')
+    volume = (
+        YEARLY_GROWTH ** (np.arange(len(days)) / 365)
+        * np.asarray(MONTH_VOLUME)[days.month - 1]
+        * np.asarray(WEEKDAY_VOLUME)[days.dayofweek]
+    )
+    return start, np.sort(rng.choice(len(days), rows, p=_weights(volume)).astype('int32'))
+
+
+def households(count, rng, places):
+    """Per-household attributes as index arrays; strings are built per chunk"""
+    return {
+        'first': rng.integers(0, len(FIRST_NAMES), count),
+        'last': rng.integers(0, len(LAST_NAMES), count),
+        'phone': rng.integers(6_000_000_000, 10_000_000_000, count),
+        'flat': rng.integers(1, 1500, count),
+        'building': rng.integers(0, len(BUILDINGS), count),
+        'locality': rng.integers(0, len(places), count),
+    }
+
+
+def _phones(numbers, rng):
+    digits = pd.Series(numbers.astype(str))
+    spelled = np.where(rng.random(len(numbers)) < PHONE_FORMATS[0] / sum(PHONE_FORMATS),
+                       '+91 ' + digits.str.slice(0, 5) + ' ' + digits.str.slice(5), digits)
+    leading_zero = rng.random(len(numbers)) < PHONE_FORMATS[2] / sum(PHONE_FORMATS)
+    return np.where(leading_zero & (spelled == digits.to_numpy()), '0' + digits, spelled)
+
+
+def generate_chunk(offsets, start, today, people, places, rng):
+    """One chunk of customers rows as a frame in ``RECORD_COLUMNS`` order"""
+    rows = len(offsets)
+    visit = pd.Timestamp(start) + pd.to_timedelta(offsets, unit='D')
+    age = (pd.Timestamp(today) - visit).days.to_numpy()
+
+    # Households: low indexes book far more often than high ones
+    household = (rng.random(rows) ** REPEAT_SKEW * len(people['first'])).astype('int64')
+    first = np.asarray(FIRST_NAMES, dtype=object)[people['first'][household]]
+    last = np.asarray(LAST_NAMES, dtype=object)[people['last'][household]]
+    building = np.asarray(BUILDINGS, dtype=object)[people['building'][household]]
+    locality = np.asarray(places, dtype=object)[people['locality'][household]]
+    flat = people['flat'][household].astype(str).astype(object)
+
+    names = list(SERVICES)
+    service = rng.choice(len(names), rows, p=_weights([share for share, _ in SERVICES.values()]))
+    monsoon = np.isin(visit.month, MONSOON_MONTHS) & (rng.random(rows) < MONSOON_MOSQUITO_SHARE)
+    service[monsoon] = names.index('Mosquito Control')
+    median = np.asarray([price for _, price in SERVICES.values()], dtype='float64')[service]
+    amount = np.round(median * np.exp(rng.normal(0.0, PRICE_SPREAD, rows)), -1)
+
+    # Status by age: future work is Scheduled, recent work may be Ongoing
+    draw = rng.random(rows)
+    status = np.full(rows, 'Completed', dtype=object)
+    status[draw < CANCELLED_SHARE + STALE_SCHEDULED_SHARE] = 'Scheduled'
+    status[draw < CANCELLED_SHARE] = 'Cancelled'
+    status[(age <= ONGOING_DAYS) & (draw > 1 - ONGOING_SHARE)] = 'Ongoing'
+    status[age < 0] = 'Scheduled'
+
+    # Payments trickle in after completion; a few never do
+    chance = 1 - (1 - PAID_ON_COMPLETION) * np.exp(-np.clip(age, 0, None) / PAYMENT_DAYS)
+    paid = (status == 'Completed') & (rng.random(rows) < chance) & (rng.random(rows) >= BAD_DEBT_SHARE)
+    method = np.asarray(list(PAYMENT_METHODS), dtype=object)[
+        rng.choice(len(PAYMENT_METHODS), rows, p=_weights(list(PAYMENT_METHODS.values())))
+    ]
+    method[~paid & ((rng.random(rows) < UNPAID_PENDING_SHARE) | (status == 'Scheduled'))] = 'Pending'
+
+    return pd.DataFrame({
+        'name': first + ' ' + last,
+        'phone': _phones(people['phone'][household], rng),
+        'address': 'Flat ' + flat + ', ' + building + ', ' + locality + ', Pune',
+        'service': np.asarray(names, dtype=object)[service],
+        'visit_date': visit.strftime('%Y-%m-%d'),
+        'amount': amount,
+        'paid': paid.astype('int64'),
+        'payment_method': method,
+        'service_status': status,
+    }, columns=RECORD_COLUMNS)
+
+
+def generate_database(db_path, rows, seed=0, today=None, chunk_rows=CHUNK_ROWS, progress=None):
+    """Write a new migrated database of ``rows`` synthetic visits to ``db_path``
+
+    Refuses to touch an existing file. ``progress(done, rows)`` is called
+    after each chunk. Returns the row count.
+    """
+    if os.path.exists(db_path):
+        raise FileExistsError(f"{db_path} already exists")
+    today = today or date.today()
+    rng = np.random.default_rng(seed)
+    places = localities()
+    start, offsets = visit_days(rows, rng, today)
+    people = households(max(1, int(rows * CUSTOMERS_PER_ROW)), rng, places)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = OFF")
+        # Bare table first; indexes and derived tables are built once at the end
+        migrate(conn, target=1)
+        for low in range(0, rows, chunk_rows):
+            chunk = generate_chunk(offsets[low:low + chunk_rows], start, today, people, places, rng)
+            with conn:
+                conn.executemany(INSERT_SQL, zip(*(chunk[col].tolist() for col in RECORD_COLUMNS)))
+            if progress:
+                progress(min(low + chunk_rows, rows), rows)
+        migrate(conn)
+    finally:
+        conn.close()
+    return rows
+
+
+def random_row(rng, start=date(2023, 1, 1), days=900):
+    """One uniformly random customers row, in ``RECORD_COLUMNS`` order"""
+    return (
+        f"Customer {rng.randrange(10 ** 6)}",
+        f"+91 {rng.randrange(10 ** 9, 10 ** 10)}",
+        f"{rng.randrange(1, 999)} Main Road",
+        rng.choice(RANDOM_SERVICES),
+        (start + timedelta(days=rng.randrange(days))).isoformat(),
+        round(rng.uniform(500, 5000), 2),
+        rng.randrange(2),
+        rng.choice(RANDOM_METHODS),
+        rng.choice(RANDOM_STATUSES),
+    )
+
+
+def seed_database(db_path, rows, seed=0):
+    """Create (or extend) a customers database with uniformly random rows"""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    try:
+        migrate(conn)
+        with conn, bulk_insert(conn):
+            conn.executemany(INSERT_SQL, (random_row(rng) for _ in range(rows)))
+    finally:
+        conn.close()
+    return db_path
+
+
+def synthetic_frame(rows, seed=0, start='2023-01-01', days=900):
+    """Loader-shaped customers frame with ``rows`` random rows, built vectorized"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'id': np.arange(rows, 0, -1),
+        'service': rng.choice(RANDOM_SERVICES, rows),
+        'visit_date': pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, days, rows), unit='D'),
+        'amount': rng.uniform(500, 5000, rows).round(2),
+        'paid': rng.integers(0, 2, rows),
+        'payment_method': rng.choice(RANDOM_METHODS, rows),
+        'service_status': rng.choice(RANDOM_STATUSES, rows),
+    })
+
+
+def describe(db_path):
+    """Share of rows per service, status, payment method and paid flag"""
+    conn = sqlite3.connect(db_path)
+    try:
+        total = conn.execute("SELECT COUNT(*) FROM customers").fetchone()[0] or 1
+        return {
+            column: {
+                str(value): round(count / total * 100, 1)
+                for value, count in conn.execute(
+                    f"SELECT {column}, COUNT(*) FROM customers GROUP BY 1 ORDER BY 2 DESC"
+                )
+            }
+            for column in ['service', 'service_status', 'payment_method', 'paid']
+        }
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pestcore.synthetic', description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=parse_rows, default='10k', help="row count, or 10k / 1m / 10m")
+    parser.add_argument('--out', help='database to create (default: synthetic-<rows>.db)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--today', type=date.fromisoformat, default=date.today(),
+                        help='date the history ends at; fix it to reproduce a database exactly')
+    args = parser.parse_args(argv)
+
+    out = args.out or f'synthetic-{args.rows}.db'
+    started = time.perf_counter()
+
+    def progress(done, total):
+        print(f"\r{done:>12,} / {total:,} rows  {time.perf_counter() - started:6.1f}s", end='', flush=True)
+
+    generate_database(out, args.rows, args.seed, args.today, progress=progress)
+    print(f"\nWrote {out} ({os.path.getsize(out) / 2 ** 20:,.0f} MiB) in {time.perf_counter() - started:.1f}s")
+    for column, shares in describe(out).items():
+        print(f"{column:>16}: " + ', '.join(f"{value} {share}%" for value, share in shares.items()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,19 @@
+"""Dashboard stylesheet, kept out of the page script"""
+import functools
+import hashlib
+import os
+
+STYLESHEET = os.path.join(os.path.dirname(__file__), 'dashboard.css')
+
+
+@functools.lru_cache(maxsize=None)
+def stylesheet():
+    """Contents of the dashboard CSS file, read once per process"""
+    with open(STYLESHEET, encoding='utf-8') as handle:
+        return handle.read()
+
+
+@functools.lru_cache(maxsize=None)
+def theme_key():
+    """Short digest of the stylesheet, for caches of themed output"""
+    return hashlib.blake2b(stylesheet().encode('utf-8'), digest_size=8).hexdigest()
@@ -0,0 +1,322 @@
+"""Opt-in timing of render phases and SQLite queries
+
+Phases are timed with ``span()`` blocks, ``lap()`` checkpoints or the
+``@timed`` decorator. Queries
+are timed by ``TracedConnection``, the connection class the
+ConnectionManager opens. While recording it also installs SQLite's trace
+and progress hooks, which add every statement a query runs (triggers
+included) and its virtual machine step count.
+
+Each script run is one ``Run``. Finished runs are kept in a rolling window
+for p50/p95 and can be appended to a JSONL log.
+
+Recording is off by default. When it is off, ``span()`` returns a shared
+no-op context, ``lap()`` and ``@timed`` add one flag check per call,
+queries go straight to sqlite3 and no SQLite hooks are installed.
+"""
+import functools
+import json
+import math
+import sqlite3
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+# Finished runs kept for the rolling percentiles
+ROLLING_RUNS = 200
+
+# SQLite virtual machine instructions between progress callbacks
+PROGRESS_STEPS = 1000
+
+# Longest query text kept per record
+SQL_PREVIEW = 300
+
+_NULL_SPAN = nullcontext()
+
+_enabled = False
+_local = threading.local()
+_history = deque(maxlen=ROLLING_RUNS)
+_history_lock = threading.Lock()
+
+
+def enable(flag=True):
+    """Turn recording on or off for the whole process"""
+    global _enabled
+    _enabled = bool(flag)
+
+
+def is_enabled():
+    return _enabled
+
+
+class Run:
+    """Spans and queries recorded during one script run"""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.time()
+        self.seconds = None
+        self.records = []
+        self._clock = time.perf_counter()
+        self._lap = self._clock
+
+    def add(self, kind, name, seconds, **extra):
+        record = {'kind': kind, 'name': name, 'ms': round(seconds * 1000, 3)}
+        record.update(extra)
+        self.records.append(record)
+        return record
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self._clock
+        return self
+
+    def as_dict(self):
+        return {
+            'run': self.name,
+            'started': self.started,
+            'ms': round((self.seconds or 0) * 1000, 3),
+            'records': self.records,
+        }
+
+
+def begin_run(name='rerun'):
+    """Start recording a run on this thread, replacing any unfinished one"""
+    _local.run = Run(name) if _enabled else None
+    return _local.run
+
+
+def end_run():
+    """Finish this thread's run, add it to the rolling window and return it"""
+    run = getattr(_local, 'run', None)
+    _local.run = None
+    if run is None:
+        return None
+    run.finish()
+    with _history_lock:
+        _history.append(run)
+    return run
+
+
+def current_run():
+    return getattr(_local, 'run', None) if _enabled else None
+
+
+@contextmanager
+def _span(run, name, kind):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        run.add(kind, name, time.perf_counter() - started)
+
+
+def span(name, kind='phase'):
+    """Context manager timing a block into the current run"""
+    run = current_run()
+    if run is None:
+        return _NULL_SPAN
+    return _span(run, name, kind)
+
+
+def lap(name):
+    """Record the time since the previous lap (or the run start) as a phase
+
+    For top-level script sections, where wrapping each one in ``span()``
+    would mean re-indenting it.
+    """
+    run = current_run()
+    if run is None:
+        return
+    now = time.perf_counter()
+    run.add('phase', name, now - run._lap)
+    run._lap = now
+
+
+def timed(name=None, kind='phase'):
+    """Decorator timing every call of a function into the current run"""
+    def decorate(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with span(label, kind):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _preview(sql):
+    return ' '.join(str(sql).split())[:SQL_PREVIEW]
+
+
+class TracedCursor(sqlite3.Cursor):
+    """Cursor that records query time and rows fetched while recording is on"""
+
+    _record = None
+
+    def execute(self, sql, parameters=()):
+        run = current_run()
+        if run is None:
+            self._record = None
+            self.connection._detach()
+            return super().execute(sql, parameters)
+        return self._timed(run, super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        run = current_run()
+        if run is None:
+            self._record = None
+            self.connection._detach()
+            return super().executemany(sql, seq_of_parameters)
+        return self._timed(run, super().executemany, sql, seq_of_parameters)
+
+    def _timed(self, run, method, sql, parameters):
+        connection = self.connection
+        connection._attach()
+        started = time.perf_counter()
+        try:
+            return method(sql, parameters)
+        finally:
+            elapsed = time.perf_counter() - started
+            self._record = run.add('query', _preview(sql), elapsed, rows=0,
+                                   statements=connection._statements, steps=connection._steps * PROGRESS_STEPS)
+            if self.rowcount > 0:
+                self._record['rows'] = self.rowcount
+            connection._statements = 0
+            connection._steps = 0
+
+    def _fetched(self, rows, started):
+        record = self._record
+        if record is not None:
+            record['rows'] += len(rows)
+            record['ms'] = round(record['ms'] + (time.perf_counter() - started) * 1000, 3)
+        return rows
+
+    def fetchone(self):
+        if self._record is None:
+            return super().fetchone()
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched([row] if row is not None else [], started)
+        return row
+
+    def fetchmany(self, size=None):
+        if self._record is None:
+            return super().fetchmany(size) if size is not None else super().fetchmany()
+        started = time.perf_counter()
+        rows = super().fetchmany(size) if size is not None else super().fetchmany()
+        return self._fetched(rows, started)
+
+    def fetchall(self):
+        if self._record is None:
+            return super().fetchall()
+        started = time.perf_counter()
+        return self._fetched(super().fetchall(), started)
+
+
+class TracedConnection(sqlite3.Connection):
+    """Connection whose cursors are TracedCursors
+
+    SQLite's trace and progress hooks are installed by the first query of
+    a recording run and removed again by the first untraced one.
+    """
+
+    _hooked = False
+    _statements = 0
+    _steps = 0
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        if not _enabled:
+            self._detach()
+            return super().execute(sql, parameters)
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if not _enabled:
+            self._detach()
+            return super().executemany(sql, seq_of_parameters)
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def _attach(self):
+        if not self._hooked:
+            self.set_trace_callback(self._on_statement)
+            self.set_progress_handler(self._on_progress, PROGRESS_STEPS)
+            self._hooked = True
+
+    def _detach(self):
+        if self._hooked:
+            self.set_trace_callback(None)
+            self.set_progress_handler(None, 0)
+            self._hooked = False
+
+    def _on_statement(self, statement):
+        self._statements += 1
+
+    def _on_progress(self):
+        self._steps += 1
+        return 0
+
+
+def summarize(values):
+    """Count, p50 and p95 of millisecond timings"""
+    ordered = sorted(values)
+    if not ordered:
+        return {'count': 0, 'p50_ms': None, 'p95_ms': None}
+    return {
+        'count': len(ordered),
+        'p50_ms': round(statistics.median(ordered), 3),
+        'p95_ms': round(ordered[math.ceil(0.95 * len(ordered)) - 1], 3),
+    }
+
+
+def history():
+    with _history_lock:
+        return list(_history)
+
+
+def rolling_stats(runs=None):
+    """p50/p95 per phase or query over the rolling window
+
+    Returns a list of dicts sorted by p95, slowest first. Times of repeated
+    spans within one run are summed first, so a phase's figure is its cost
+    per run.
+    """
+    runs = history() if runs is None else runs
+    per_name = {}
+    for run in runs:
+        totals = {}
+        for record in run.records:
+            key = (record['kind'], record['name'])
+            totals[key] = totals.get(key, 0.0) + record['ms']
+        for key, ms in totals.items():
+            per_name.setdefault(key, []).append(ms)
+    per_name[('run', 'total')] = [round((run.seconds or 0) * 1000, 3) for run in runs]
+
+    stats = [dict(kind=kind, name=name, **summarize(values)) for (kind, name), values in per_name.items()]
+    return sorted(stats, key=lambda row: row['p95_ms'] or 0, reverse=True)
+
+
+def to_jsonl(runs=None):
+    """Runs as JSON lines, one run per line"""
+    runs = history() if runs is None else runs
+    return ''.join(json.dumps(run.as_dict()) + '\n' for run in runs)
+
+
+def append_jsonl(path, runs=None):
+    """Append runs to a JSONL log; returns how many were written"""
+    runs = history() if runs is None else runs
+    with open(path, 'a', encoding='utf-8') as handle:
+        handle.write(to_jsonl(runs))
+    return len(runs)
+
+
+def clear():
+    with _history_lock:
+        _history.clear()
@@ -0,0 +1,182 @@
+"""In-process write queue with group commit for new service records
+
+Form submissions are validated on the caller's thread and queued. A single
+writer thread drains the queue and commits everything waiting (up to
+``MAX_BATCH`` rows) in one write transaction, so a burst of submissions
+costs one commit instead of one each and never contends for the write
+lock. Each submission gets a ``Future`` resolving to its new record id.
+
+Commit hooks run on the writer thread after each batch. The dashboard uses
+one to fold the new rows into its cached customers frame, so the next page
+load finds the cache already current.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from pestcore.edits import clean_changes
+from pestcore.scheduler import insert_recurrence
+from pestcore.search import bulk_insert
+
+RECORD_COLUMNS = [
+    'name', 'phone', 'address', 'service', 'visit_date',
+    'amount', 'paid', 'payment_method', 'service_status',
+]
+
+REQUIRED_COLUMNS = ['name', 'service', 'visit_date']
+
+# Most rows committed per transaction
+MAX_BATCH = 500
+
+# How long the writer waits for more rows once one arrives
+LINGER_SECONDS = 0.005
+
+# Submissions held before submit() blocks
+MAX_PENDING = 10_000
+
+INSERT_SQL = f'''
+    INSERT INTO customers ({', '.join(RECORD_COLUMNS)})
+    VALUES ({', '.join('?' for _ in RECORD_COLUMNS)})
+    RETURNING id
+'''
+
+
+class QueueClosed(RuntimeError):
+    """The write queue was stopped"""
+
+
+def clean_record(record):
+    """A new record validated and normalized like an edit of every column"""
+    missing = [col for col in REQUIRED_COLUMNS if not record.get(col)]
+    if missing:
+        raise ValueError(f"Missing {', '.join(missing)}")
+    record = dict(record)
+    record.setdefault('amount', 0.0)
+    record.setdefault('paid', False)
+    record.setdefault('payment_method', 'Pending')
+    record.setdefault('service_status', 'Scheduled')
+    return clean_changes({col: record.get(col) for col in RECORD_COLUMNS})
+
+
+class WriteQueue:
+    """Queue of new records drained by one group-committing writer thread"""
+
+    def __init__(self, manager, max_batch=MAX_BATCH, linger=LINGER_SECONDS, max_pending=MAX_PENDING):
+        self.manager = manager
+        self.max_batch = max_batch
+        self.linger = linger
+        self.stats = {'rows': 0, 'batches': 0, 'failed': 0}
+        self.last_error = None
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._hooks = []
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._thread = None
+
+    def add_commit_hook(self, hook):
+        """Call ``hook(ids)`` on the writer thread after each committed batch"""
+        if hook not in self._hooks:
+            self._hooks.append(hook)
+        return self
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._loop, name='pestcore-writer', daemon=True)
+                self._thread.start()
+        return self
+
+    def submit(self, record, every_months=None):
+        """Queue one new record; returns a Future for its id
+
+        Validation errors raise here, before anything is queued.
+        ``every_months`` also adds a recurrence rule in the same transaction.
+        """
+        if self._stopping:
+            raise QueueClosed("The write queue is stopped")
+        future = Future()
+        self._queue.put((clean_record(record), every_months, future))
+        if self._thread is None:
+            self.start()
+        return future
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def stop(self, timeout=None):
+        """Commit everything already queued, then stop the writer"""
+        self._stopping = True
+        self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _take_batch(self):
+        """Block for one submission, then gather what arrives within the linger"""
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.linger
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.perf_counter(), 0))
+            except queue.Empty:
+                break
+            if item is None:
+                # Commit what was gathered, then stop
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                break
+            batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+            if batch:
+                self._commit(batch)
+
+        # Anything queued behind the stop marker is refused, not dropped silently
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[2].set_exception(QueueClosed("The write queue was stopped"))
+
+    def _insert(self, conn, record, every_months):
+        record_id = conn.execute(INSERT_SQL, [record[col] for col in RECORD_COLUMNS]).fetchone()[0]
+        if every_months:
+            insert_recurrence(conn, record_id, every_months)
+        return record_id
+
+    def _commit(self, batch):
+        try:
+            with self.manager.write() as conn, bulk_insert(conn):
+                ids = [self._insert(conn, record, every) for record, every, _ in batch]
+        except Exception as e:
+            self.last_error = repr(e)
+            if len(batch) > 1:
+                # One bad row must not sink the rest: retry each on its own
+                for item in batch:
+                    self._commit([item])
+            else:
+                self.stats['failed'] += 1
+                batch[0][2].set_exception(e)
+            return
+
+        self.stats['rows'] += len(ids)
+        self.stats['batches'] += 1
+        for (_, _, future), record_id in zip(batch, ids):
+            future.set_result(record_id)
+        for hook in self._hooks:
+            try:
+                hook(ids)
+            except Exception as e:
+                # The rows are committed; a failing hook only delays the cache
+                self.last_error = repr(e)
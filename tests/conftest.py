@@ -0,0 +1,26 @@
+import pytest
+
+from pestcore.synthetic import seed_database
+
+
+def pytest_addoption(parser):
+    parser.addoption('--large', action='store_true', help='also run the 1M and 10M row benchmarks')
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'large: needs millions of rows; runs only with --large')
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--large'):
+        return
+    skip = pytest.mark.skip(reason='needs --large')
+    for item in items:
+        if 'large' in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def seeded_db(tmp_path):
+    """Path of a migrated database holding 5000 uniformly random rows"""
+    return seed_database(str(tmp_path / 'customers.db'), 5000)
@@ -0,0 +1,42 @@
+"""The SQL and in-memory aggregate paths agree on one seeded database"""
+import sqlite3
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from pestcore.aggregates import frame_aggregates, sql_aggregates
+from pestcore.data import CustomerCache
+
+NOW = datetime(2025, 6, 1, 12, 0)
+
+
+@pytest.fixture
+def db_path(seeded_db):
+    conn = sqlite3.connect(seeded_db)
+    with conn:
+        # Rows the aggregates must skip or map the same way on both paths
+        conn.executemany('''
+            INSERT INTO customers (name, service, visit_date, amount, paid, payment_method, service_status)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            ('No service', None, '2025-05-30', 100.0, 1, 'Cash', 'Completed'),
+            ('Unknown payment', 'Rodent', '2025-05-31', 250.0, None, None, 'Ongoing'),
+            ('Legacy status', 'Termite', '2025-05-28', 999.5, 0, 'Pending', 'Finished'),
+            ('Future visit', 'Mosquito', '2025-06-20', 400.0, 0, 'Pending', 'Scheduled'),
+        ])
+    conn.close()
+    return seeded_db
+
+
+def test_sql_and_frame_aggregates_match(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        from_sql = sql_aggregates(conn, now=NOW)
+        from_frame = frame_aggregates(CustomerCache(db_path).refresh(conn), now=NOW)
+    finally:
+        conn.close()
+
+    assert from_frame['kpis'] == pytest.approx(from_sql['kpis'], abs=0.01)
+    pd.testing.assert_frame_equal(from_frame['services'], from_sql['services'])
+    pd.testing.assert_frame_equal(from_frame['payments'], from_sql['payments'])
@@ -0,0 +1,82 @@
+"""Head-office figures merged over branches match one database holding every row"""
+import sqlite3
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from pestcore.aggregates import sql_aggregates
+from pestcore.branches import BranchSet, merge_aggregates, merge_receivables, merge_trends
+from pestcore.db import ConnectionManager
+from pestcore.receivables import aging_summary
+from pestcore.rollups import trend
+from pestcore.synthetic import seed_database
+
+NOW = datetime(2025, 6, 1, 12, 0)
+TODAY = NOW.date()
+
+# (branch, rows, seed)
+BRANCHES = [('Mumbai', 3000, 1), ('Pune', 2000, 2)]
+
+
+@pytest.fixture
+def branches(tmp_path):
+    """Two branch databases, opened as a BranchSet"""
+    paths = {name: seed_database(str(tmp_path / f'{name}.db'), rows, seed) for name, rows, seed in BRANCHES}
+    managers = []
+
+    def open_branch(path):
+        managers.append(ConnectionManager(path).check())
+        return managers[-1]
+
+    branch_set = BranchSet(paths, open_branch)
+    yield branch_set
+    branch_set.close()
+    for manager in managers:
+        manager.close()
+
+
+@pytest.fixture
+def combined(tmp_path):
+    """Connection to one database with the rows of every branch"""
+    path = str(tmp_path / 'combined.db')
+    for _, rows, seed in BRANCHES:
+        seed_database(path, rows, seed)
+    conn = sqlite3.connect(path)
+    yield conn
+    conn.close()
+
+
+def test_merge_aggregates(branches, combined):
+    merged = merge_aggregates(branches.read_all(lambda conn: sql_aggregates(conn, now=NOW)))
+    want = sql_aggregates(combined, now=NOW)
+
+    assert merged['kpis'] == pytest.approx(want['kpis'], abs=0.01)
+    assert merged['kpis']['total_contracts'] == 5000
+    pd.testing.assert_frame_equal(merged['services'], want['services'], check_dtype=False)
+    pd.testing.assert_frame_equal(merged['payments'], want['payments'], check_dtype=False)
+
+
+@pytest.mark.parametrize('grain, by', [('month', 'service'), ('day', 'service_status'), ('month', 'paid')])
+def test_merge_trends(branches, combined, grain, by):
+    merged = merge_trends(branches.read_all(lambda conn: trend(conn, grain=grain, by=by)))
+    want = trend(combined, grain=grain, by=by).sort_values(['period', 'group'], ignore_index=True)
+
+    pd.testing.assert_frame_equal(merged, want, check_dtype=False, atol=0.01)
+
+
+def test_merge_receivables(branches, combined):
+    merged = merge_receivables(branches.read_all(lambda conn: aging_summary(conn, TODAY)))
+    want = aging_summary(combined, TODAY)
+
+    key = ['bucket', 'payment_method']
+    pd.testing.assert_frame_equal(
+        merged.sort_values(key, ignore_index=True), want.sort_values(key, ignore_index=True),
+        check_dtype=False, atol=0.01,
+    )
+    assert list(dict.fromkeys(merged['bucket'])) == list(dict.fromkeys(want['bucket']))
+
+
+def test_merging_no_branches():
+    assert merge_trends({}).empty
+    assert merge_receivables({'Empty': pd.DataFrame(), 'Missing': None}).empty
@@ -0,0 +1,82 @@
+"""Incremental refreshes of the customer cache match a fresh full load"""
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from pestcore.data import BUCKET_SIZE, CustomerCache
+from pestcore.synthetic import seed_database
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    # Three digest buckets
+    return seed_database(str(tmp_path / 'customers.db'), 2 * BUCKET_SIZE + 500)
+
+
+def fresh_frame(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return CustomerCache(db_path).refresh(conn)
+    finally:
+        conn.close()
+
+
+def assert_same_frame(got, want):
+    pd.testing.assert_frame_equal(got, want, check_categorical=False)
+
+
+def test_refresh_after_changes_below_the_mark(db_path):
+    cache = CustomerCache(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        cache.refresh(conn)
+        hwm = cache._hwm
+        with conn:
+            conn.execute("UPDATE customers SET amount = 1234.5, paid = 1 WHERE id = 7")
+            conn.execute("UPDATE customers SET phone = '9000011111' WHERE id = ?", (BUCKET_SIZE + 3,))
+            conn.execute("DELETE FROM customers WHERE id IN (?, ?)", (2 * BUCKET_SIZE + 1, hwm))
+            conn.execute("INSERT INTO customers (name, service, visit_date, amount, paid) "
+                         "VALUES ('Appended', 'Rodent', '2025-06-01', 800, 0)")
+
+        frame = cache.refresh(conn)
+
+        assert cache.last_refresh['kind'] == 'incremental'
+        assert cache.last_refresh['buckets'] == 3
+        assert_same_frame(frame, fresh_frame(db_path))
+        assert frame.loc[frame['id'] == 7, 'amount'].iloc[0] == pytest.approx(1234.5)
+        assert not frame['id'].isin([2 * BUCKET_SIZE + 1, hwm]).any()
+    finally:
+        conn.close()
+
+
+def test_refresh_after_insert_with_an_old_id(db_path):
+    cache = CustomerCache(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            conn.execute("DELETE FROM customers WHERE id = 100")
+        cache.refresh(conn)
+        with conn:
+            # A restored row keeps its id, below the cached mark, with no edit or delete alongside
+            conn.execute("INSERT INTO customers (id, name, service, visit_date, amount, paid) "
+                         "VALUES (100, 'Restored', 'General', '2024-01-01', 500, 1)")
+
+        frame = cache.refresh(conn)
+
+        assert cache.last_refresh['kind'] == 'incremental'
+        assert (frame['id'] == 100).sum() == 1
+        assert_same_frame(frame, fresh_frame(db_path))
+    finally:
+        conn.close()
+
+
+def test_unchanged_database_is_served_from_memory(db_path):
+    cache = CustomerCache(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        first = cache.refresh(conn)
+        assert cache.refresh(conn) is first
+        assert cache.last_refresh == {'kind': 'cached', 'rows': 0}
+    finally:
+        conn.close()
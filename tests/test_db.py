@@ -0,0 +1,95 @@
+"""ConnectionManager under concurrent sessions"""
+import sqlite3
+import threading
+
+import pytest
+
+import pestcore.db
+from pestcore.db import ConnectionManager
+
+THREADS = 8
+WRITES_PER_THREAD = 50
+
+
+@pytest.fixture
+def manager(seeded_db):
+    manager = ConnectionManager(seeded_db).check()
+    yield manager
+    manager.close()
+
+
+def run_threads(target, count=THREADS):
+    errors = []
+    start = threading.Barrier(count)
+
+    def run(index):
+        start.wait()
+        try:
+            target(index)
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+def test_concurrent_reads_and_writes(manager):
+    with manager.read() as conn:
+        before = conn.execute("SELECT COUNT(*) FROM customers").fetchone()[0]
+    inserted = [[] for _ in range(THREADS)]
+
+    def session(index):
+        for step in range(WRITES_PER_THREAD):
+            with manager.write() as conn:
+                record_id = conn.execute(
+                    "INSERT INTO customers (name, service, visit_date) VALUES (?, 'General', '2025-06-01') RETURNING id",
+                    (f"Thread {index} row {step}",),
+                ).fetchone()[0]
+            inserted[index].append(record_id)
+            with manager.read() as conn:
+                # A committed write is visible to the next read at once
+                assert conn.execute("SELECT name FROM customers WHERE id = ?", (record_id,)).fetchone()
+                conn.execute("SELECT service, SUM(amount) FROM customers GROUP BY service").fetchall()
+
+    errors = run_threads(session)
+
+    assert errors == []
+    ids = [record_id for ids in inserted for record_id in ids]
+    assert len(set(ids)) == THREADS * WRITES_PER_THREAD
+    with manager.read() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM customers").fetchone()[0] == before + len(ids)
+        names = {name for (name,) in conn.execute("SELECT name FROM customers WHERE name LIKE 'Thread %'")}
+    assert len(names) == len(ids)
+
+
+def test_failed_write_rolls_back(manager):
+    with pytest.raises(sqlite3.IntegrityError):
+        with manager.write() as conn:
+            conn.execute("INSERT INTO customers (name, service, visit_date) VALUES ('Rolled back', 'General', '2025-06-01')")
+            conn.execute("INSERT INTO customers (id, name) SELECT id, name FROM customers LIMIT 1")
+    with manager.read() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM customers WHERE name = 'Rolled back'").fetchone()[0] == 0
+
+
+def test_check_migrates_once(seeded_db, monkeypatch):
+    calls = []
+    migrate = pestcore.db.migrate
+
+    def counting_migrate(conn):
+        calls.append(threading.get_ident())
+        return migrate(conn)
+
+    monkeypatch.setattr(pestcore.db, 'migrate', counting_migrate)
+    manager = ConnectionManager(seeded_db)
+    try:
+        errors = run_threads(lambda index: manager.check())
+        manager.check()
+    finally:
+        manager.close()
+
+    assert errors == []
+    assert len(calls) == 1
@@ -0,0 +1,123 @@
+"""Versioned edits: conflicts, bulk batches and scoped cache tokens"""
+import pytest
+
+from pestcore.db import ConnectionManager
+from pestcore.edits import (
+    BULK_BATCH_SIZE, BULK_STATEMENT_ROWS, RecordNotFound, StaleRecord, bulk_update, cache_token,
+    matching_versions, update_record, update_records,
+)
+from pestcore.synthetic import seed_database
+
+
+@pytest.fixture
+def manager(seeded_db):
+    manager = ConnectionManager(seeded_db).check()
+    yield manager
+    manager.close()
+
+
+def versions(manager, ids):
+    with manager.read() as conn:
+        return dict(conn.execute(
+            f"SELECT id, version FROM customers WHERE id IN ({', '.join('?' for _ in ids)})", list(ids)
+        ))
+
+
+def tokens(manager):
+    with manager.read() as conn:
+        return {scope: cache_token(conn, scope) for scope in ['aggregates', 'records']}
+
+
+def test_update_record_bumps_version(manager):
+    assert update_record(manager, 10, 1, {'phone': ' 98450 12345 ', 'amount': '1200'}) == 2
+    with manager.read() as conn:
+        row = conn.execute("SELECT phone, amount, version, updated_at FROM customers WHERE id = 10").fetchone()
+    assert row[:3] == ('98450 12345', 1200.0, 2)
+    assert row[3] is not None
+
+
+def test_stale_and_missing_records_are_refused(manager):
+    update_record(manager, 10, 1, {'name': 'First edit'})
+
+    with pytest.raises(StaleRecord) as stale:
+        update_record(manager, 10, 1, {'name': 'Second edit'})
+    assert (stale.value.record_id, stale.value.expected, stale.value.current) == (10, 1, 2)
+
+    with manager.write() as conn:
+        conn.execute("DELETE FROM customers WHERE id = 11")
+    with pytest.raises(RecordNotFound):
+        update_record(manager, 11, 1, {'name': 'Gone'})
+
+    with manager.read() as conn:
+        assert conn.execute("SELECT name, version FROM customers WHERE id = 10").fetchone() == ('First edit', 2)
+
+
+def test_update_records_is_all_or_nothing(manager):
+    update_record(manager, 21, 1, {'paid': 1})
+
+    with pytest.raises(StaleRecord):
+        update_records(manager, [(20, 1, {'paid': 1}), (21, 1, {'paid': 0}), (22, 1, {'paid': 1})])
+    assert versions(manager, [20, 21, 22]) == {20: 1, 21: 2, 22: 1}
+
+    assert update_records(manager, [(20, 1, {'paid': 1}), (21, 2, {'paid': 0})]) == {20: 2, 21: 3}
+
+
+def test_bulk_update_reports_conflicts_across_chunks_and_batches(seeded_db, manager):
+    # 5000 seeded rows plus 1000: two write batches of several statements each
+    seed_database(seeded_db, 1000, seed=1)
+    with manager.read() as conn:
+        rows = matching_versions(conn)
+    assert len(rows) > BULK_BATCH_SIZE + BULK_STATEMENT_ROWS
+
+    boundaries = [BULK_STATEMENT_ROWS, BULK_BATCH_SIZE, BULK_BATCH_SIZE + BULK_STATEMENT_ROWS]
+    stale = {rows[i][0] for edge in boundaries for i in (edge - 1, edge)}
+    deleted = {rows[i][0] for edge in boundaries for i in (edge + 1,)}
+    for record_id in stale:
+        update_record(manager, record_id, 1, {'address': 'Moved'})
+    with manager.write() as conn:
+        conn.executemany("DELETE FROM customers WHERE id = ?", [(record_id,) for record_id in deleted])
+
+    result = bulk_update(manager, rows, {'service_status': 'Completed'})
+
+    assert set(result['conflicts']) == stale | deleted
+    assert len(result['updated']) == len(rows) - len(stale) - len(deleted)
+    assert result['updated'] == [record_id for record_id, _ in rows if record_id not in stale | deleted]
+    with manager.read() as conn:
+        edited = dict(conn.execute("SELECT id, address FROM customers WHERE version = 2"))
+        completed = conn.execute(
+            "SELECT COUNT(*) FROM customers WHERE version = 2 AND service_status = 'Completed' AND address != 'Moved'"
+        ).fetchone()[0]
+    assert completed == len(result['updated'])
+    assert sorted(edited) == sorted(result['updated'] + list(stale))
+    assert {edited[record_id] for record_id in stale} == {'Moved'}
+
+
+def test_cache_tokens_change_only_for_affected_scopes(manager):
+    before = tokens(manager)
+
+    update_record(manager, 30, 1, {'phone': '9000000001'})
+    after_phone = tokens(manager)
+    assert after_phone['aggregates'] == before['aggregates']
+    assert after_phone['records'] != before['records']
+
+    bulk_update(manager, [(31, 1), (32, 1)], {'name': 'Renamed'})
+    after_names = tokens(manager)
+    assert after_names['aggregates'] == before['aggregates']
+    assert after_names['records'] != after_phone['records']
+
+    update_record(manager, 33, 1, {'amount': 999})
+    after_amount = tokens(manager)
+    assert after_amount['aggregates'] != after_names['aggregates']
+    assert after_amount['records'] != after_names['records']
+
+    with manager.write() as conn:
+        conn.execute("DELETE FROM customers WHERE id = 34")
+    after_delete = tokens(manager)
+    assert after_delete['aggregates'] != after_amount['aggregates']
+    assert after_delete['records'] != after_amount['records']
+
+    with manager.write() as conn:
+        conn.execute("INSERT INTO customers (name, service, visit_date) VALUES ('New', 'General', '2025-06-01')")
+    after_insert = tokens(manager)
+    assert after_insert['aggregates'] != after_delete['aggregates']
+    assert after_insert['records'] != after_delete['records']
@@ -0,0 +1,76 @@
+"""Identity resolution links name variants through shared keys"""
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from pestcore.identity import customer_metrics, propagate_labels, resolve_identities
+from pestcore.migrations import migrate
+
+INSERT_SQL = "INSERT INTO customers (name, phone, address, visit_date, amount) VALUES (?, ?, ?, ?, ?)"
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'customers.db'))
+    migrate(conn)
+    yield conn
+    conn.close()
+
+
+def entities(conn):
+    return dict(conn.execute("SELECT customer_id, entity_id FROM customer_entities"))
+
+
+def test_propagate_labels_joins_rows_transitively():
+    keys = pd.DataFrame({
+        'row': [1, 2, 2, 3, 4],
+        'key': ['p:9845012345', 'p:9845012345', 'n:ravi|1 main road', 'n:ravi|1 main road', 'p:9000000001'],
+    })
+    row_label, key_label = propagate_labels(keys)
+
+    assert row_label.to_dict() == {1: 1, 2: 1, 3: 1, 4: 4}
+    assert key_label['n:ravi|1 main road'] == 1
+
+
+def test_propagate_labels_keeps_seeded_labels():
+    keys = pd.DataFrame({'row': [10, 11], 'key': ['p:9845012345', 'p:9000000001']})
+    seeds = pd.Series([3], index=['p:9845012345'])
+    row_label, _ = propagate_labels(keys, seeds)
+
+    assert row_label.to_dict() == {10: 3, 11: 11}
+
+
+def test_phone_match_merges_name_variants(conn):
+    with conn:
+        conn.executemany(INSERT_SQL, [
+            ('Mr. Ravi Kumar', '+91 98450 12345', '12 Lake View', '2024-01-05', 1500.0),
+            ('Kumar Ravi', '098450-12345 ext 2', '12, Lake View Apts', '2024-06-10', 1800.0),
+            ('Anita Shah', '+91 90000 00001', '4 Hill Road', '2024-03-01', 900.0),
+        ])
+        stats = resolve_identities(conn)
+
+    assert stats['rows'] == 3
+    assert entities(conn) == {1: 1, 2: 1, 3: 3}
+    assert customer_metrics(conn, '2024-07-01')['customers'] == 2
+
+
+def test_new_row_links_two_known_entities(conn):
+    with conn:
+        conn.executemany(INSERT_SQL, [
+            ('Ravi Kumar', '+91 98450 12345', '12 Lake View', '2024-01-05', 1500.0),
+            ('R Kumar', '+91 97400 55555', '7 Park Street', '2024-02-05', 700.0),
+        ])
+        resolve_identities(conn)
+    assert entities(conn) == {1: 1, 2: 2}
+
+    # Same name and address as row 2, same phone as row 1
+    with conn:
+        conn.execute(INSERT_SQL, ('Kumar R', '9845012345', '7 Park Street', '2024-08-01', 600.0))
+        stats = resolve_identities(conn)
+
+    assert stats == {'rows': 1, 'merged': 1, 'batches': 1}
+    assert entities(conn) == {1: 1, 2: 1, 3: 1}
+    with conn:
+        resolve_identities(conn, rebuild=True)
+    assert entities(conn) == {1: 1, 2: 1, 3: 1}
@@ -0,0 +1,27 @@
+"""compute_metrics() gives the same figures as the legacy multi-pass code"""
+from datetime import datetime
+
+import pytest
+
+from pestcore.bench import legacy_metrics
+from pestcore.metrics import compute_metrics
+from pestcore.synthetic import synthetic_frame
+
+NOW = datetime(2025, 6, 1, 12, 0)
+
+
+@pytest.mark.parametrize('start', ['2023-01-01', '2025-05-01'])
+def test_compute_metrics_matches_legacy(start):
+    df = synthetic_frame(20_000, seed=3, start=start, days=60)
+    revenue, paid, pending, completed, pending_payments, recent = legacy_metrics(df, NOW)
+    metrics = compute_metrics(df, NOW)
+
+    assert metrics['total_contracts'] == len(df)
+    assert metrics['total_revenue'] == pytest.approx(revenue, abs=0.01)
+    assert metrics['total_paid'] == pytest.approx(paid, abs=0.01)
+    assert metrics['total_pending'] == pytest.approx(pending, abs=0.01)
+    assert metrics['total_pending'] == pytest.approx(pending_payments, abs=0.01)
+    assert metrics['completed_count'] == completed
+    assert metrics['recent_visits'] == recent
+    if start == '2025-05-01':
+        assert recent > 0
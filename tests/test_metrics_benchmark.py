@@ -0,0 +1,36 @@
+"""compute_metrics() against the legacy multi-pass code, per table size
+
+    pytest tests/test_metrics_benchmark.py             # 10k and 100k rows
+    pytest tests/test_metrics_benchmark.py --large     # also 1M and 10M
+"""
+from datetime import datetime
+
+import pytest
+
+from pestcore.bench import legacy_metrics
+from pestcore.metrics import compute_metrics
+from pestcore.synthetic import synthetic_frame
+
+pytest.importorskip('pytest_benchmark')
+
+NOW = datetime(2025, 6, 1, 12, 0)
+
+SIZES = [
+    pytest.param(10_000, id='10k'),
+    pytest.param(100_000, id='100k'),
+    pytest.param(1_000_000, id='1m', marks=pytest.mark.large),
+    pytest.param(10_000_000, id='10m', marks=pytest.mark.large),
+]
+
+IMPLEMENTATIONS = {'legacy': legacy_metrics, 'one_pass': compute_metrics}
+
+
+@pytest.fixture(scope='module', params=SIZES)
+def frame(request):
+    return synthetic_frame(request.param)
+
+
+@pytest.mark.parametrize('name', IMPLEMENTATIONS)
+def test_metrics(benchmark, frame, name):
+    benchmark.group = f'metrics {len(frame):,} rows'
+    benchmark(IMPLEMENTATIONS[name], frame, NOW)
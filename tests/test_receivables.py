@@ -0,0 +1,84 @@
+"""The receivables ledger stays consistent through imports, edits and date changes"""
+import csv
+import sqlite3
+from datetime import date, timedelta
+
+from pestcore import importer
+from pestcore.db import ConnectionManager
+from pestcore.receivables import aging_summary, check_receivables, refresh_receivables
+
+TODAY = date.today()
+
+
+def ledger_hwm(conn):
+    return conn.execute("SELECT hwm FROM receivables_state WHERE id = 1").fetchone()[0]
+
+
+def write_source(path, days_ago):
+    with open(path, 'w', newline='', encoding='utf-8') as handle:
+        writer = csv.writer(handle)
+        writer.writerow(['name', 'phone', 'service', 'visit_date', 'amount', 'paid', 'payment_method', 'service_status'])
+        for index, days in enumerate(days_ago):
+            visit = TODAY - timedelta(days=days)
+            writer.writerow([
+                f'Imported {index}', f'98450{index:05d}', 'Termite', visit.strftime('%d/%m/%Y'),
+                1000 + index, 'no' if index % 3 else 'yes', ['UPI', 'Cash', ''][index % 3], 'Completed',
+            ])
+
+
+def test_imported_rows_age_through_the_buckets(seeded_db, tmp_path):
+    source = tmp_path / 'jobs.csv'
+    # Around each bucket edge, so a roll forward moves some of them
+    write_source(source, [0, 1, 29, 30, 31, 59, 60, 61, 89, 90, 91, 200])
+
+    assert importer.main([str(source), '--db', seeded_db]) == 0
+
+    conn = sqlite3.connect(seeded_db)
+    try:
+        # The import's write hook folded every batch in
+        assert ledger_hwm(conn) == conn.execute("SELECT MAX(id) FROM customers").fetchone()[0]
+        assert check_receivables(conn, TODAY) == []
+        before = aging_summary(conn, TODAY)
+
+        manager = ConnectionManager(seeded_db).check().add_write_hook(refresh_receivables)
+        try:
+            with manager.write() as write:
+                write.execute("UPDATE customers SET paid = 1 WHERE name = 'Imported 1'")
+                write.execute("UPDATE customers SET amount = 5000 WHERE name = 'Imported 4'")
+                write.execute("DELETE FROM customers WHERE name = 'Imported 5'")
+        finally:
+            manager.close()
+        assert check_receivables(conn, TODAY) == []
+
+        # The scheduler's pass on later days
+        for days in [1, 15, 45]:
+            later = TODAY + timedelta(days=days)
+            with conn:
+                refresh_receivables(conn, later)
+            assert conn.execute("SELECT as_of FROM receivables_state").fetchone()[0] == later.isoformat()
+            assert check_receivables(conn, later) == []
+        # Rolling back to an earlier date works the same way
+        with conn:
+            refresh_receivables(conn, TODAY)
+
+        assert check_receivables(conn, TODAY) == []
+        assert not aging_summary(conn, TODAY).equals(before)
+    finally:
+        conn.close()
+
+
+def test_rows_inserted_below_the_mark_are_ledgered(seeded_db):
+    conn = sqlite3.connect(seeded_db)
+    try:
+        with conn:
+            refresh_receivables(conn, TODAY)
+            hwm = ledger_hwm(conn)
+            conn.execute("DELETE FROM customers WHERE id = ?", (hwm - 1,))
+            conn.execute('''
+                INSERT INTO customers (id, name, service, visit_date, amount, paid, service_status)
+                VALUES (?, 'Restored', 'Rodent', ?, 640.0, 0, 'Completed')
+            ''', (hwm - 1, (TODAY - timedelta(days=40)).isoformat()))
+        assert ledger_hwm(conn) == hwm
+        assert check_receivables(conn, TODAY) == []
+    finally:
+        conn.close()
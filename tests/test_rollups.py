@@ -0,0 +1,54 @@
+"""Rollups stay consistent with writes on either side of the high-water mark"""
+import sqlite3
+from datetime import date
+
+from pestcore.db import ConnectionManager
+from pestcore.rollups import check_rollups, refresh_rollups
+from pestcore.scheduler import run_once
+
+INSERT_SQL = '''
+    INSERT INTO customers (name, service, visit_date, amount, paid, payment_method, service_status)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+def rollup_hwm(conn):
+    return conn.execute("SELECT hwm FROM rollup_state WHERE id = 1").fetchone()[0]
+
+
+def test_writes_around_the_mark_are_rolled_up(seeded_db):
+    manager = ConnectionManager(seeded_db).check()
+    raw = sqlite3.connect(seeded_db)
+    try:
+        with manager.write() as conn:
+            refresh_rollups(conn)
+        hwm = rollup_hwm(raw)
+        assert hwm == raw.execute("SELECT MAX(id) FROM customers").fetchone()[0]
+
+        # Through the manager, without the page's rollup write hook
+        with manager.write() as conn:
+            new_id = conn.execute(INSERT_SQL + " RETURNING id", (
+                'Above the mark', 'Termite', '2025-05-20', 4200.0, 0, 'Pending', 'Ongoing',
+            )).fetchone()[0]
+            conn.execute("UPDATE customers SET amount = amount + 100, paid = 1 WHERE id = ?", (hwm,))
+            conn.execute("DELETE FROM customers WHERE id = ?", (hwm - 1,))
+
+        # Outside the app, as the importer or a maintenance script would
+        with raw:
+            raw.execute(INSERT_SQL, ('Raw insert', 'Rodent', '2025-05-21', 1800.0, 1, 'Cash', 'Completed'))
+            raw.execute("UPDATE customers SET service = 'Mosquito', visit_date = '2025-04-01' WHERE id = ?", (hwm - 2,))
+            raw.execute("UPDATE customers SET amount = 5000 WHERE id = ?", (new_id,))
+            raw.execute("DELETE FROM customers WHERE id = ?", (hwm - 3,))
+            # A restored row keeps its old id, below the mark
+            raw.execute("INSERT INTO customers (id, name, service, visit_date, amount, paid) "
+                        "VALUES (?, 'Restored', 'General', '2024-12-01', 750.0, 1)", (hwm - 1,))
+        assert check_rollups(raw) == []
+
+        result = run_once(manager, today=date(2025, 6, 1))
+
+        assert result['rollups'] == 2
+        assert rollup_hwm(raw) == new_id + 1
+        assert check_rollups(raw) == []
+    finally:
+        raw.close()
+        manager.close()
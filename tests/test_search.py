@@ -0,0 +1,81 @@
+"""Customer search finds phones however they are written"""
+import sqlite3
+
+import pytest
+
+from pestcore.search import bulk_insert, check_search_index, normalize_phone, search_customers
+
+PHONES = [
+    '+91 98765 43210',
+    '098765-43211',
+    '(987) 654-3212',
+    '9876543213',
+    '+91-98765.43214',
+    '+1 (415) 555-0100',
+    '020/2553 1234',
+    '2553 9876',
+]
+
+
+@pytest.fixture
+def conn(seeded_db):
+    conn = sqlite3.connect(seeded_db)
+    yield conn
+    conn.close()
+
+
+def insert_phones(conn, prefix):
+    with conn:
+        return [
+            conn.execute(
+                "INSERT INTO customers (name, phone, service, visit_date) VALUES (?, ?, 'General', '2025-06-01') RETURNING id",
+                (f'{prefix} {index}', phone),
+            ).fetchone()[0]
+            for index, phone in enumerate(PHONES)
+        ]
+
+
+def found(conn, text):
+    return set(search_customers(conn, text, limit=50)['id'])
+
+
+@pytest.mark.parametrize('bulk', [False, True], ids=['trigger', 'bulk'])
+def test_phone_found_by_every_spelling(conn, bulk):
+    if bulk:
+        with conn, bulk_insert(conn):
+            ids = insert_phones(conn, 'Bulk')
+    else:
+        ids = insert_phones(conn, 'Single')
+
+    for record_id, phone in zip(ids, PHONES):
+        digits = normalize_phone(phone)
+        for spelling in {phone, digits, digits[-10:], digits[-4:]}:
+            assert record_id in found(conn, spelling), (phone, spelling)
+        # A country code typed in front of a number stored without one
+        if len(digits) == 10:
+            assert record_id in found(conn, '+91 ' + digits), phone
+    assert check_search_index(conn) == ([], [])
+
+
+def test_terms_combine_names_and_phone_digits(conn):
+    ids = insert_phones(conn, 'Sharma')
+
+    assert found(conn, 'sharma 3212') == {ids[2]}
+    assert found(conn, 'sharma 0100') == {ids[5]}
+    assert found(conn, 'nobody 3212') == set()
+
+
+def test_index_follows_bulk_inserts_edits_and_deletes(conn):
+    assert check_search_index(conn) == ([], [])
+    with conn, bulk_insert(conn):
+        conn.executemany("INSERT INTO customers (name, phone) VALUES (?, ?)",
+                         [(f'Bulk {index}', f'98220{index:05d}') for index in range(2000)])
+    assert check_search_index(conn) == ([], [])
+
+    with conn:
+        record_id = conn.execute("SELECT id FROM customers WHERE name = 'Bulk 7'").fetchone()[0]
+        conn.execute("UPDATE customers SET phone = '+91 90000 11111' WHERE id = ?", (record_id,))
+        conn.execute("DELETE FROM customers WHERE name = 'Bulk 8'")
+    assert check_search_index(conn) == ([], [])
+    assert record_id in found(conn, '9000011111')
+    assert record_id not in found(conn, '9822000007')
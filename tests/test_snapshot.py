@@ -0,0 +1,109 @@
+"""Arrow snapshots load the same frame as SQLite until an edit makes them stale"""
+import sqlite3
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from pestcore.data import LAZY_COLUMNS, CustomerCache
+from pestcore.db import ConnectionManager
+from pestcore.scheduler import run_once
+from pestcore.snapshot import (
+    SnapshotCache, is_current, load_frame, refresh_snapshot, snapshot_meta, snapshot_path, write_snapshot,
+)
+
+pytest.importorskip('pyarrow')
+
+
+@pytest.fixture
+def conn(seeded_db):
+    conn = sqlite3.connect(seeded_db, isolation_level=None)
+    write_snapshot(conn, snapshot_path(seeded_db))
+    yield conn
+    conn.close()
+
+
+def cached_columns(conn):
+    return [row[1] for row in conn.execute('PRAGMA table_info(customers)') if row[1] not in LAZY_COLUMNS]
+
+
+def fresh_frame(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return CustomerCache(db_path).refresh(conn)
+    finally:
+        conn.close()
+
+
+def assert_same_frame(got, want):
+    pd.testing.assert_frame_equal(got, want, check_categorical=False)
+
+
+def test_snapshot_loads_the_same_frame(seeded_db, conn):
+    frame, meta = load_frame(conn, snapshot_path(seeded_db), cached_columns(conn))
+
+    assert meta['rows'] == 5000
+    assert_same_frame(frame, fresh_frame(seeded_db))
+
+
+def test_inserts_are_read_on_top_of_the_snapshot(seeded_db, conn):
+    conn.executemany("INSERT INTO customers (name, phone, service, visit_date, amount, paid) VALUES (?, ?, ?, ?, ?, ?)", [
+        ('Newer one', '9822012345', 'Termite', '2025-06-02', 4100.0, 0),
+        ('Newer two', None, 'Unlisted service', None, 650.25, 1),
+    ])
+    meta = snapshot_meta(snapshot_path(seeded_db))
+
+    assert is_current(conn, meta)
+    frame, _ = load_frame(conn, snapshot_path(seeded_db), cached_columns(conn))
+    assert len(frame) == 5002
+    assert_same_frame(frame, fresh_frame(seeded_db))
+
+
+@pytest.mark.parametrize('change', [
+    "UPDATE customers SET amount = 1 WHERE id = 4990",
+    "UPDATE customers SET phone = '9000011111' WHERE id = 12",
+    "DELETE FROM customers WHERE id = 2500",
+])
+def test_edit_below_the_mark_makes_the_snapshot_stale(seeded_db, conn, change):
+    path = snapshot_path(seeded_db)
+    conn.execute(change)
+
+    assert not is_current(conn, snapshot_meta(path))
+    assert load_frame(conn, path, cached_columns(conn)) is None
+
+    cache = SnapshotCache(seeded_db)
+    frame = cache.refresh(conn)
+    assert cache.last_refresh['kind'] == 'full'
+    assert_same_frame(frame, fresh_frame(seeded_db))
+
+
+def test_snapshot_cache_starts_from_a_current_snapshot(seeded_db, conn):
+    conn.execute("INSERT INTO customers (name, service, visit_date) VALUES ('After', 'Rodent', '2025-06-03')")
+    cache = SnapshotCache(seeded_db)
+    cache.refresh(conn)
+    assert cache.last_refresh['kind'] == 'snapshot'
+
+    # Later refreshes work from the snapshot's digests like any other load
+    conn.execute("UPDATE customers SET amount = 2 WHERE id = 17")
+    frame = cache.refresh(conn)
+    assert cache.last_refresh['kind'] == 'incremental'
+    assert_same_frame(frame, fresh_frame(seeded_db))
+
+
+def test_only_command_line_passes_rewrite_the_snapshot(seeded_db, conn):
+    path = snapshot_path(seeded_db)
+    written = snapshot_meta(path)['created_at']
+    conn.execute("DELETE FROM customers WHERE id = 3")
+    manager = ConnectionManager(seeded_db).check()
+    try:
+        assert 'snapshot' not in run_once(manager, today=date(2025, 6, 1))
+        assert not is_current(conn, snapshot_meta(path))
+
+        # A young snapshot is kept until it ages past min_age
+        assert refresh_snapshot(manager) == 0
+        assert refresh_snapshot(manager, min_age=0) == 4999
+        assert is_current(conn, snapshot_meta(path))
+        assert run_once(manager, today=date(2025, 6, 1), snapshot=True)['snapshot'] == 0
+    finally:
+        manager.close()
+    assert snapshot_meta(path)['created_at'] >= written
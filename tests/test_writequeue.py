@@ -0,0 +1,110 @@
+"""Group-committed submissions through the write queue"""
+import sqlite3
+import threading
+
+import pytest
+
+from pestcore.db import ConnectionManager
+from pestcore.writequeue import QueueClosed, WriteQueue
+
+SUBMITTERS = 6
+ROWS_PER_SUBMITTER = 40
+
+
+def record(name, **extra):
+    return dict({'name': name, 'service': 'Termite', 'visit_date': '2025-06-01', 'amount': 1500}, **extra)
+
+
+@pytest.fixture
+def manager(seeded_db):
+    manager = ConnectionManager(seeded_db).check()
+    yield manager
+    manager.close()
+
+
+def names_by_id(manager, ids):
+    with manager.read() as conn:
+        return dict(conn.execute(
+            f"SELECT id, name FROM customers WHERE id IN ({', '.join('?' for _ in ids)})", list(ids)
+        ))
+
+
+def test_submissions_from_many_threads_resolve_to_their_rows(manager):
+    writes = WriteQueue(manager, linger=0.02).start()
+    committed = []
+    writes.add_commit_hook(committed.extend)
+    futures = {}
+    start = threading.Barrier(SUBMITTERS)
+
+    def submitter(index):
+        start.wait()
+        for step in range(ROWS_PER_SUBMITTER):
+            name = f"Submitter {index} row {step}"
+            futures[name] = writes.submit(record(name))
+
+    threads = [threading.Thread(target=submitter, args=(index,)) for index in range(SUBMITTERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writes.stop(timeout=30)
+
+    ids = {name: future.result(timeout=0) for name, future in futures.items()}
+    assert len(set(ids.values())) == SUBMITTERS * ROWS_PER_SUBMITTER
+    assert names_by_id(manager, ids.values()) == {record_id: name for name, record_id in ids.items()}
+    assert sorted(committed) == sorted(ids.values())
+    assert writes.stats['rows'] == len(ids)
+    # Submissions arriving together share commits
+    assert writes.stats['batches'] < len(ids)
+
+
+def test_poisoned_row_fails_only_its_own_future(manager):
+    with manager.write() as conn:
+        # Passes validation but fails inside the write transaction
+        conn.execute('''
+            CREATE TEMP TRIGGER poison BEFORE INSERT ON customers WHEN new.name = 'Poisoned'
+            BEGIN SELECT RAISE(ABORT, 'poisoned row'); END
+        ''')
+    writes = WriteQueue(manager, linger=0.2)
+    committed = []
+    writes.add_commit_hook(committed.extend)
+    good = [writes.submit(record(f"Good {index}")) for index in range(5)]
+    poisoned = writes.submit(record('Poisoned'))
+    good += [writes.submit(record(f"Good {index}")) for index in range(5, 10)]
+    writes.stop(timeout=30)
+
+    with pytest.raises(sqlite3.IntegrityError, match='poisoned row'):
+        poisoned.result(timeout=0)
+    ids = [future.result(timeout=0) for future in good]
+    assert sorted(names_by_id(manager, ids).values()) == sorted(f"Good {index}" for index in range(10))
+    assert sorted(committed) == sorted(ids)
+    assert writes.stats['failed'] == 1
+    with manager.read() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM customers WHERE name = 'Poisoned'").fetchone()[0] == 0
+
+
+def test_failing_commit_hook_keeps_rows_and_results(manager):
+    writes = WriteQueue(manager)
+
+    def broken_hook(ids):
+        raise RuntimeError('cache refresh failed')
+
+    writes.add_commit_hook(broken_hook)
+    future = writes.submit(record('Hook victim'), every_months=3)
+    writes.stop(timeout=30)
+
+    record_id = future.result(timeout=0)
+    assert 'cache refresh failed' in writes.last_error
+    with manager.read() as conn:
+        assert conn.execute("SELECT name FROM customers WHERE id = ?", (record_id,)).fetchone() == ('Hook victim',)
+        assert conn.execute("SELECT every_months FROM recurrences WHERE customer_id = ?", (record_id,)).fetchone() == (3,)
+
+
+def test_stopped_queue_refuses_submissions(manager):
+    writes = WriteQueue(manager).start()
+    writes.stop(timeout=30)
+
+    with pytest.raises(QueueClosed):
+        writes.submit(record('Too late'))
+    with pytest.raises(ValueError):
+        WriteQueue(manager).submit({'name': 'No service'})